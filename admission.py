@@ -0,0 +1,138 @@
+import re
+import threading
+import time
+
+from starlette.responses import JSONResponse
+
+from db_setup import statement_timeout
+
+"""
+Admission control, so that an overloaded database slows down the unimportant requests instead of every request.
+Every request gets a priority from its method and path:
+
+  high    answer submission and joining a session, rejected only when the server is completely full
+  normal  everything else
+  low     listings, search and analytics, the first to be rejected
+
+AdmissionMiddleware counts the requests in flight and AdmissionController tracks how long it takes to get a
+database connection (a moving average). Once either passes the threshold of a priority, new requests of that
+priority are answered with 503 and a Retry-After header right away, instead of queueing in the threadpool.
+Every priority also gets its own statement_timeout on the connections it opens.
+"""
+
+HIGH, NORMAL, LOW = "high", "normal", "low"
+
+HIGH_PRIORITY = (
+    ("POST", re.compile(r"^/player_answers/?$")),
+    ("POST", re.compile(r"^/session_players/?$")),
+)
+LOW_PRIORITY = (
+    ("GET", re.compile(r"^/[a-z_]+/?$")),  # listings of a whole table
+    ("GET", re.compile(r"^/quizzes/search$")),
+    ("GET", re.compile(r"^/quizzes/\d+/(stats|export)$")),
+    ("GET", re.compile(r"^/questions/\d+/stats$")),
+    ("GET", re.compile(r"^/(hashtags|creators)/")),
+)
+# Long-lived streams, the metrics and the docs aren't counted
+EXEMPT = (
+    re.compile(r"^/sessions/\d+/events$"),
+    re.compile(r"^/metrics/"),
+    re.compile(r"^/(docs|redoc|openapi\.json)"),
+)
+
+
+def classify(method: str, path: str):
+    """Returns the priority of a request, None if it is exempt from admission control"""
+    if any(pattern.match(path) for pattern in EXEMPT):
+        return None
+    if any(method == m and pattern.match(path) for m, pattern in HIGH_PRIORITY):
+        return HIGH
+    if any(method == m and pattern.match(path) for m, pattern in LOW_PRIORITY):
+        return LOW
+    return NORMAL
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 200, db_wait_threshold: float = 0.2, retry_after: int = 2,
+                 statement_timeouts: dict | None = None, db_wait_window: float = 5.0):
+        self.max_in_flight = max_in_flight
+        self.db_wait_threshold = db_wait_threshold
+        self.db_wait_window = db_wait_window
+        self.retry_after = retry_after
+        # Share of max_in_flight and multiple of db_wait_threshold at which a priority is rejected
+        self.limits = {
+            HIGH: (1.0, None),
+            NORMAL: (0.8, 4.0),
+            LOW: (0.5, 1.0),
+        }
+        self.statement_timeouts = statement_timeouts or {HIGH: 2000, NORMAL: 5000, LOW: 10000}
+        self.in_flight = 0
+        self.db_wait = 0.0
+        self._db_wait_at = 0.0
+        self.admitted = {HIGH: 0, NORMAL: 0, LOW: 0}
+        self.rejected = {HIGH: 0, NORMAL: 0, LOW: 0}
+        self._lock = threading.Lock()
+
+    def record_db_wait(self, seconds: float):
+        """Connect observer, keeps an exponential moving average of the time it takes to get a connection"""
+        with self._lock:
+            self.db_wait += (seconds - self.db_wait) * 0.2
+            self._db_wait_at = time.monotonic()
+
+    def try_acquire(self, priority: str) -> bool:
+        share, wait_multiple = self.limits[priority]
+        with self._lock:
+            if time.monotonic() - self._db_wait_at > self.db_wait_window:
+                # No connects lately (maybe because everything was rejected), don't keep rejecting on old samples
+                self.db_wait = 0.0
+            overloaded = self.in_flight >= self.max_in_flight * share or (
+                wait_multiple is not None and self.db_wait > self.db_wait_threshold * wait_multiple
+            )
+            if overloaded:
+                self.rejected[priority] += 1
+                return False
+            self.in_flight += 1
+            self.admitted[priority] += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "db_wait_ms": round(self.db_wait * 1000, 2),
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected),
+            }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that applies an AdmissionController to every http request"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        priority = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        if not self.controller.try_acquire(priority):
+            response = JSONResponse(
+                {"detail": "The server is overloaded, try again later"},
+                status_code=503,
+                headers={"Retry-After": str(self.controller.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        token = statement_timeout.set(self.controller.statement_timeouts[priority])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            statement_timeout.reset(token)
+            self.controller.release()
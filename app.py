@@ -1,42 +1,342 @@
+import asyncio
 import os
+import struct
+from contextlib import asynccontextmanager
 
 import psycopg2
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
 from psycopg2 import errors
 from psycopg2.extras import RealDictCursor
+from pydantic import ValidationError
 
 import db as db
+import db_setup
+import jobs
+import question_stats
 import schemas as sc
+import wire
+from admission import HIGH, LOW, NORMAL, AdmissionController, AdmissionMiddleware
 from db_setup import get_connection
-
-app = FastAPI()
+from event_log import (ANSWER, JOIN, QUESTION_END, QUESTION_START, SCORE, SESSION_END, SESSION_START,
+                       SessionEventLog)
+from etags import VersionCache, cache_headers, etag_matches, is_not_modified, make_etag, not_modified_response
+from microcache import MicroCache
+from notify import ChangeListener
+from records import (AnswerAlternativeRecord, PlayerAnswerRecord, QuestionRecord, QuizRecord, ScoreboardRecord,
+                     SessionPlayerRecord, SessionRecord, UserRecord, records_response)
+from recovery import LiveSessions
+from replicas import ReadYourWritesMiddleware, ReplicaRouter
+from responses import FastJSONResponse, dumps
+from session_changes import SessionChangeLog
+from shards import ShardRouter
+from singleflight import SingleFlight
+from snapshots import SnapshotCache, without_answers
+from unit_of_work import UnitOfWork
+from write_queue import GroupCommitQueue
+
+# The live session tables are on the SESSION_SHARD_DSNS databases when it is set, see shards.py
+shards = ShardRouter(db_setup.connect, get_connection, db_setup.SESSION_SHARD_DSNS)
+
+# Answers are committed in groups, one queue per database with session tables, see write_queue.py
+answer_queues = [
+    GroupCommitQueue(
+        factory,
+        max_batch_size=int(os.getenv("ANSWER_BATCH_SIZE", "200")),
+        max_delay=float(os.getenv("ANSWER_BATCH_DELAY_MS", "5")) / 1000,
+    )
+    for factory in shards.factories()
+]
+
+# Published quiz snapshots never change, so they are cached without invalidation
+snapshot_cache = SnapshotCache(max_entries=int(os.getenv("SNAPSHOT_CACHE_SIZE", "1000")))
+
+# Identical reads running at the same time share one query, see singleflight.py
+reads = SingleFlight(max_tracked_keys=int(os.getenv("SINGLEFLIGHT_TRACKED_KEYS", "1000")))
+
+# Host dashboards are polled by many screens, they share one query per ttl, see microcache.py
+dashboard_cache = MicroCache(ttl=float(os.getenv("DASHBOARD_CACHE_MS", "500")) / 1000)
+
+# Change events from every worker, see notify.py
+change_listener = ChangeListener(get_connection)
+
+# updated_at of the quiz content rows for the ETag headers, see etags.py
+version_cache = VersionCache(ttl=float(os.getenv("VERSION_CACHE_TTL", "30")))
+change_listener.subscribe(version_cache.invalidate)
+
+# The session events come from the databases with the session tables
+session_listeners = [ChangeListener(factory) for factory in shards.factories()] if shards.enabled else [change_listener]
+listeners = [change_listener, *session_listeners] if shards.enabled else [change_listener]
+
+# Recent changes of every session for the delta sync endpoint, see session_changes.py
+session_changes = SessionChangeLog(changes_per_session=int(os.getenv("SESSION_CHANGES_PER_SESSION", "256")))
+for listener in session_listeners:
+    listener.subscribe(session_changes.record)
+    listener.on_reconnect(session_changes.reset)
+
+# Live state of the running sessions, recovered at startup so a restart doesn't strand them, see recovery.py
+live_sessions = LiveSessions(
+    shards.factories(),
+    shards.for_session,
+    get_connection,
+    target_ms=float(os.getenv("SESSION_RECOVERY_TARGET_MS", "2000")),
+)
+for listener in session_listeners:
+    listener.subscribe(live_sessions.invalidate)
+    listener.on_reconnect(live_sessions.reset)
+
+# Append-only event log of every session when SESSION_EVENT_LOG_DIR is set, see event_log.py
+session_log = SessionEventLog(os.getenv("SESSION_EVENT_LOG_DIR"), sync=os.getenv("SESSION_EVENT_LOG_FSYNC") == "1")
+
+# Background jobs, JOB_WORKERS=0 leaves them to a separate runner (python jobs.py), see jobs.py
+job_runner = jobs.JobRunner(get_connection, workers=int(os.getenv("JOB_WORKERS", "0")))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for listener in listeners:
+        listener.start()
+    try:
+        await asyncio.to_thread(live_sessions.recover)
+    except psycopg2.Error as e:
+        print(f"Session recovery failed: {e}")
+    if job_runner.workers:
+        job_runner.start()
+    yield
+    for queue in answer_queues:
+        queue.stop()
+    for listener in listeners:
+        listener.stop()
+    job_runner.stop()
+    session_log.close()
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+
+# Rejects low priority requests first when the server or the database is overloaded, see admission.py
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "200")),
+    db_wait_threshold=float(os.getenv("ADMISSION_DB_WAIT_MS", "200")) / 1000,
+    retry_after=int(os.getenv("ADMISSION_RETRY_AFTER", "2")),
+    statement_timeouts={
+        HIGH: int(os.getenv("STATEMENT_TIMEOUT_HIGH_MS", "2000")),
+        NORMAL: int(os.getenv("STATEMENT_TIMEOUT_NORMAL_MS", "5000")),
+        LOW: int(os.getenv("STATEMENT_TIMEOUT_LOW_MS", "10000")),
+    },
+)
+db_setup.connect_observers.append(admission.record_db_wait)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Read-only endpoints read from the replicas when DATABASE_REPLICA_DSNS is set, see replicas.py
+replicas = ReplicaRouter(
+    db_setup.connect,
+    get_connection,
+    db_setup.REPLICA_DSNS,
+    max_lag=float(os.getenv("REPLICA_MAX_LAG", "1.0")),
+)
+app.add_middleware(ReadYourWritesMiddleware)
 
 """
 Endpoints for the API, organized by database-table.
 """
 
+def run_unit_of_work(connect):
+    uow = UnitOfWork(connect)
+    try:
+        yield uow
+    except BaseException:
+        uow.finish(commit=False)
+        raise
+    else:
+        uow.finish(commit=True)
+    finally:
+        uow.close()
+
+def unit_of_work():
+    """
+    Dependency of the write endpoints: one connection and one transaction per request, committed when the
+    endpoint returns and rolled back when it raises, see unit_of_work.py.
+    The session endpoints route it to the session's shard with con.route() before using it
+    """
+    yield from run_unit_of_work(get_connection)
+
+def catalog_unit_of_work():
+    """Second unit of work for the catalog writes of a session endpoint whose unit of work is on a shard"""
+    yield from run_unit_of_work(get_connection)
+
+def session_read_connection(session_id: int, min_lsn: str | None = None):
+    """Connection for reading a session, its shard or else a replica that has the client's writes"""
+    if shards.enabled:
+        return shards.for_session(session_id)
+    return read_connection(("session", session_id), min_lsn)
+
+def read_connection(key=None, min_lsn: str | None = None):
+    """Connection for a read-only endpoint, a replica when one is recent enough, see replicas.py"""
+    return replicas.read_connection(key, min_lsn)
+
+def require_unsharded():
+    """The play statistics are fed by catalog triggers on the session tables, which don't run on the shards"""
+    if shards.enabled:
+        raise HTTPException(status_code=501, detail="Play statistics are not available while sessions are sharded")
+
+def remember_write(request: Request, key, con):
+    """After-commit callback for writes that the client reads right away, routes its next reads of key accordingly"""
+    try:
+        lsn = replicas.note_write(key, con)
+    except psycopg2.Error as e:
+        print(f"Couldn't read the WAL position: {e}")
+        return
+    if lsn:
+        request.state.min_lsn = lsn
+
+def log_event(session_id: int, event_type: int, *fields):
+    """Appends an event to the session's log, the write it records is committed already so an error only gets printed"""
+    try:
+        session_log.append(session_id, event_type, *fields)
+    except (OSError, ValueError, struct.error) as e:  # struct.error: a field that doesn't fit its record
+        print(f"Couldn't write the event log of session {session_id}: {e}")
+
+def log_question_change(session_id: int, previous_question_id, question_id):
+    if previous_question_id == question_id:
+        return
+    if previous_question_id is not None:
+        log_event(session_id, QUESTION_END, previous_question_id)
+    if question_id is not None:
+        log_event(session_id, QUESTION_START, question_id)
+
+def parse_ids(ids: str):
+    """Parses the ids query parameter, a comma separated list of integers"""
+    try:
+        parsed = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    if not parsed or len(parsed) > 1000:
+        raise HTTPException(status_code=400, detail="ids must contain between 1 and 1000 ids")
+    return parsed
+
+def parse_fields(fields: str | None, record_cls):
+    """Parses the fields query parameter (?fields=id,quiz_title) and validates it against the columns of record_cls"""
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    try:
+        record_cls.project(names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return names
+
+def batch_response(table: str, ids: list, fields: str | None = None):
+    """Fetches rows by id in one query, returns them in the requested order and lists the ids that weren't found"""
+    ids = list(dict.fromkeys(ids))
+    fields = parse_fields(fields, db.BATCH_RECORDS[table])
+    if table in db.SESSION_TABLES:
+        records = {}
+        for shard, shard_ids in shards.group_by_shard(ids).items():
+            records.update(db.get_records_by_ids(shards.connection(shard), table, shard_ids, fields=fields))
+    else:
+        records = db.get_records_by_ids(get_connection(), table, ids, fields=fields)
+    return FastJSONResponse({
+        "results": [records[record_id] for record_id in ids if record_id in records],
+        "missing": [record_id for record_id in ids if record_id not in records],
+    })
+
+def coalesced_read(key: tuple, fields, read):
+    """Runs read(con) through the single-flight layer, requests with other fields are a different key"""
+    return reads.do(key + (",".join(fields) if fields else "*",), lambda: read(get_connection()))
+
+def fields_variant(fields, record_cls):
+    """The ETag variant of a sparse fieldset, its columns in column order so any spelling of the same fields matches"""
+    return ".".join(record_cls.project(fields).__slots__) if fields else None
+
+def content_version(table: str, row_id: int, not_found: str, variant: str | None = None):
+    """Returns the ETag and updated_at of a quiz content row, from the version cache when possible"""
+    version = version_cache.get(
+        table, row_id, lambda: reads.do(("version", table, row_id), lambda: db.get_content_version(get_connection(), table, row_id))
+    )
+    if version is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return make_etag(table, row_id, version, variant), version
+
+# --- Metrics ---
+
+@app.get("/metrics/admission")
+def get_admission_metrics():
+    """Requests in flight, the database wait time and how many requests of each priority were admitted or rejected"""
+    return admission.stats()
+
+@app.get("/metrics/replicas")
+def get_replica_metrics():
+    """How many reads went to the replicas and to the primary, and the last measured lag of every replica"""
+    return replicas.stats()
+
+@app.get("/metrics/recovery")
+def get_recovery_metrics():
+    """How many running sessions the last startup recovered and how long it took"""
+    return live_sessions.stats()
+
+@app.get("/metrics/coalescing")
+def get_coalescing_metrics(top: int = Query(20, ge=1, le=1000)):
+    """How many reads were collapsed into a shared query, in total and for the busiest keys"""
+    return {"reads": reads.stats(top=top), "dashboards": dashboard_cache.stats()}
+
+# --- Jobs Endpoints ---
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+def add_job(job_input: sc.JobCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
+    """Queues a background job, returns its ID. Its status and result are at GET /jobs/{job_id}"""
+    if job_input.job_type not in jobs.JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown job type, expected one of: {', '.join(jobs.JOB_TYPES)}")
+    job_id = db.enqueue_job(con, job_input.job_type, job_input.payload, max_attempts=job_input.max_attempts)
+    # The workers can only claim the job once it is committed
+    con.after_commit(lambda connection: job_runner.wake())
+    return {"job_id": job_id}
+
+@app.get("/jobs")
+def list_jobs(
+    job_status: str | None = Query(None, alias="status", pattern="^(queued|running|succeeded|failed)$"),
+    job_type: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Fetch the newest jobs, optionally filtered by status and job type. Results are left out, see GET /jobs/{job_id}"""
+    con = get_connection()
+    return [{**job, "result": None} for job in db.get_jobs(con, limit=limit, status=job_status, job_type=job_type)]
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: int):
+    """Fetch the status, progress and (when it succeeded) the result of a specific job"""
+    con = get_connection()
+    job = db.get_job(con, job_id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(job)
+
 # --- Users Endpoints ---
 
 @app.get("/users")
-def list_users():
-    """Fetch users from the database, max 10"""
-    con = get_connection()
-    users = db.get_users(con, limit=10)
-    return users
+def list_users(ids: str | None = None, fields: str | None = None):
+    """Fetch users from the database, max 10, or the ones with the given ids (?ids=1,2,3)"""
+    if ids is not None:
+        return batch_response("users", parse_ids(ids), fields)
+    con = read_connection()
+    users = db.get_users(con, limit=10, compact=True, fields=parse_fields(fields, UserRecord))
+    return records_response(users)
+
+@app.post("/users/batch")
+def batch_users(batch_input: sc.BatchIds, fields: str | None = None):
+    """Fetch users by id, for id lists too long for a query parameter"""
+    return batch_response("users", batch_input.ids, fields)
 
 @app.get("/users/{user_id}")
-def get_user(user_id: int):
+def get_user(user_id: int, fields: str | None = None):
     """Fetch a specific user by ID"""
     con = get_connection()
-    user = db.get_user(con, user_id=user_id)
+    user = db.get_user(con, user_id=user_id, compact=True, fields=parse_fields(fields, UserRecord))
     if not user:
             raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return records_response(user)
 
 @app.post("/users")
-def add_user(user_input: sc.UserCreate):
+def add_user(user_input: sc.UserCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Adds a new user to the database, returns the new object and its ID"""
-    con = get_connection()
     try:
         user_id = db.add_user(
             con, 
@@ -54,9 +354,8 @@ def add_user(user_input: sc.UserCreate):
     return user_id
 
 @app.put("/users/{user_id}", response_model=sc.UserResponse)
-def put_update_user(user_id: int, user_update: sc.UserUpdate):
+def put_update_user(user_id: int, user_update: sc.UserUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific user and returns the whole object"""
-    con = get_connection()
     try:
         updated_user = db.put_update_user(
             con, 
@@ -77,9 +376,8 @@ def put_update_user(user_id: int, user_update: sc.UserUpdate):
     return updated_user
 
 @app.delete("/users/{user_id}")
-def delete_user(user_id: int):
+def delete_user(user_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific user and returns its ID"""
-    con = get_connection()
     try:
         deleted_user_id = db.delete_user(con, user_id=user_id)
         if not deleted_user_id:
@@ -89,7 +387,7 @@ def delete_user(user_id: int):
     return deleted_user_id
 
 @app.patch("/users/{user_id}", response_model=sc.UserResponse)
-def patch_update_user(user_id: int, user_patch: sc.UserPatch):
+def patch_update_user(user_id: int, user_patch: sc.UserPatch, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     update_data = user_patch.model_dump(exclude_unset=True)
 
     if not update_data:
@@ -97,7 +395,6 @@ def patch_update_user(user_id: int, user_patch: sc.UserPatch):
     
     query, params = db.patch_update_table(update_data=update_data, table="users", pk="id")
     params[-1] = user_id
-    con = get_connection()
 
     try:
         with con:
@@ -124,25 +421,67 @@ def patch_update_user(user_id: int, user_patch: sc.UserPatch):
 # --- Quizzes Endpoints ---
 
 @app.get("/quizzes")
-def list_quizzes():
-    """Fetch quizzes from the database, max 10"""
-    con = get_connection()
-    quizzes = db.get_quizzes(con, limit=10)
-    return quizzes
+def list_quizzes(ids: str | None = None, fields: str | None = None):
+    """Fetch quizzes from the database, max 10, or the ones with the given ids (?ids=1,2,3)"""
+    if ids is not None:
+        return batch_response("quizzes", parse_ids(ids), fields)
+    con = read_connection()
+    quizzes = db.get_quizzes(con, limit=10, compact=True, fields=parse_fields(fields, QuizRecord))
+    return records_response(quizzes)
+
+@app.post("/quizzes/batch")
+def batch_quizzes(batch_input: sc.BatchIds, fields: str | None = None):
+    """Fetch quizzes by id, for id lists too long for a query parameter"""
+    return batch_response("quizzes", batch_input.ids, fields)
+
+@app.get("/quizzes/search")
+def search_quizzes(q: str = Query(min_length=1, max_length=200), limit: int = Query(10, ge=1, le=50), cursor: str | None = None):
+    """
+    Full-text search on public quizzes, ranked by relevance, the last word is matched as a prefix.
+    Pass next_cursor from the response as cursor to get the next page
+    """
+    after_rank, after_id = None, None
+    if cursor:
+        try:
+            rank_text, id_text = cursor.split(":")
+            after_rank, after_id = float(rank_text), int(id_text)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    con = read_connection()
+    quizzes = db.search_quizzes(con, q, limit=limit, after_rank=after_rank, after_id=after_id)
+    next_cursor = None
+    if len(quizzes) == limit:
+        last = quizzes[-1]
+        next_cursor = f"{last['rank']!r}:{last['id']}"
+    return FastJSONResponse({"results": quizzes, "next_cursor": next_cursor})
 
 @app.get("/quizzes/{quiz_id}")
-def get_quiz(quiz_id: int):
-    """Fetch a specific quiz by ID"""
-    con = get_connection()
-    quiz = db.get_quiz(con, quiz_id=quiz_id)
+def get_quiz(quiz_id: int, request: Request, fields: str | None = None):
+    """Fetch a specific quiz by ID, answers 304 if the client's copy is still current"""
+    fields = parse_fields(fields, QuizRecord)
+    etag, version = content_version("quizzes", quiz_id, "Quiz not found", fields_variant(fields, QuizRecord))
+    if is_not_modified(request, etag, version):
+        return not_modified_response(etag, version)
+    quiz = coalesced_read(("quizzes", quiz_id), fields, lambda con: db.get_quiz(con, quiz_id=quiz_id, compact=True, fields=fields))
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    return quiz
+    response = records_response(quiz)
+    response.headers.update(cache_headers(etag, version))
+    return response
+
+@app.get("/quizzes/{quiz_id}/stats")
+def get_quiz_stats(quiz_id: int):
+    """Fetch the stats of every question in a specific quiz"""
+    require_unsharded()
+    con = read_connection()
+    stats = db.get_quiz_question_stats(con, quiz_id=quiz_id)
+    if not stats:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return [question_stats.summarize(row) for row in stats]
 
 @app.post("/quizzes")
-def add_quiz(quiz_input: sc.QuizCreate):
+def add_quiz(quiz_input: sc.QuizCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Adds a new quiz to the database, returns the new object and its ID"""
-    con = get_connection()
     try:
         quiz_id = db.add_quiz(
             con, 
@@ -158,10 +497,51 @@ def add_quiz(quiz_input: sc.QuizCreate):
         raise HTTPException(status_code=400, detail=str(e))
     return quiz_id
 
+@app.post("/quizzes/import")
+def import_quiz(bundle: sc.QuizBundle, con: UnitOfWork = Depends(unit_of_work, scope="function")):
+    """Imports a quiz with its questions, answer alternatives and hashtags in one transaction, returns the new quiz ID"""
+    try:
+        quiz_id = db.add_quiz_bundle(con, bundle.model_dump())
+    except psycopg2.errors.ForeignKeyViolation as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"quiz_id": quiz_id}
+
+@app.post("/quizzes/{quiz_id}/clone")
+def clone_quiz(quiz_id: int, clone_input: sc.QuizClone | None = None, con: UnitOfWork = Depends(unit_of_work, scope="function")):
+    """Copies a quiz with its questions, answer alternatives and hashtags, returns the new quiz ID"""
+    clone_input = clone_input or sc.QuizClone()
+    try:
+        new_quiz_id = db.clone_quiz(con, quiz_id, quiz_creator_id=clone_input.quiz_creator_id, quiz_title=clone_input.quiz_title)
+    except psycopg2.errors.ForeignKeyViolation:
+        raise HTTPException(status_code=400, detail="Invalid quiz creator")
+    if not new_quiz_id:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return {"quiz_id": new_quiz_id}
+
+@app.post("/quizzes/{quiz_id}/publish")
+def publish_quiz(quiz_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
+    """Publishes the current content of a quiz as a new snapshot, new sessions will play this version"""
+    snapshot = db.publish_quiz(con, quiz_id=quiz_id)
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    snapshot_id, version = snapshot
+    return {"snapshot_id": snapshot_id, "version": version}
+
+@app.get("/quizzes/{quiz_id}/export")
+def export_quiz(quiz_id: int, request: Request):
+    """Exports a quiz with its questions, answer alternatives and hashtags as one bundle, answers 304 if unchanged"""
+    etag, version = content_version("quizzes", quiz_id, "Quiz not found")
+    if is_not_modified(request, etag, version):
+        return not_modified_response(etag, version)
+    con = read_connection()
+    bundle = db.get_quiz_bundle(con, quiz_id=quiz_id)
+    if not bundle:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return FastJSONResponse(bundle, headers=cache_headers(etag, version))
+
 @app.put("/quizzes/{quiz_id}", response_model=sc.QuizResponse)
-def put_update_quiz(quiz_id: int, quiz_update: sc.QuizUpdate):
+def put_update_quiz(quiz_id: int, quiz_update: sc.QuizUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific quiz and returns the whole object"""
-    con = get_connection()
     try:
         updated_quiz = db.put_update_quiz(
             con, 
@@ -181,9 +561,8 @@ def put_update_quiz(quiz_id: int, quiz_update: sc.QuizUpdate):
     return updated_quiz
 
 @app.delete("/quizzes/{quiz_id}")
-def delete_quiz(quiz_id: int):
+def delete_quiz(quiz_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific quiz and returns its ID"""
-    con = get_connection()
     try:
         deleted_quiz_id = db.delete_quiz(con, quiz_id=quiz_id)
         if not deleted_quiz_id:
@@ -193,7 +572,7 @@ def delete_quiz(quiz_id: int):
     return deleted_quiz_id
 
 @app.patch("/quizzes/{quiz_id}", response_model=sc.QuizResponse)
-def patch_update_quiz(quiz_id: int, quiz_patch: sc.QuizPatch):
+def patch_update_quiz(quiz_id: int, quiz_patch: sc.QuizPatch, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     update_data = quiz_patch.model_dump(exclude_unset=True)
 
     if not update_data:
@@ -201,7 +580,6 @@ def patch_update_quiz(quiz_id: int, quiz_patch: sc.QuizPatch):
     
     query, params = db.patch_update_table(update_data=update_data, table="quizzes", pk="id")
     params[-1] = quiz_id
-    con = get_connection()
 
     try:
         with con:
@@ -209,6 +587,8 @@ def patch_update_quiz(quiz_id: int, quiz_patch: sc.QuizPatch):
                 cursor.execute(query, tuple(params))
                 updated_quiz = cursor.fetchone()
 
+                if updated_quiz:
+                    db.notify_change(cursor, "quizzes", quiz_id)
                 if not updated_quiz:
                     raise HTTPException(status_code=404, detail="Quiz not found")
                 
@@ -227,23 +607,118 @@ def patch_update_quiz(quiz_id: int, quiz_patch: sc.QuizPatch):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# --- Hashtags Endpoints ---
+
+@app.get("/hashtags/trending")
+def list_trending_hashtags(limit: int = Query(10, ge=1, le=50)):
+    """Fetch the hashtags with the most recent plays"""
+    require_unsharded()
+    con = read_connection()
+    hashtags = db.get_trending_hashtags(con, limit=limit)
+    return records_response(hashtags)
+
+@app.get("/hashtags/autocomplete")
+def autocomplete_hashtags(prefix: str = Query(min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50)):
+    """Fetch hashtags starting with a prefix, the most used first"""
+    con = read_connection()
+    hashtags = db.autocomplete_hashtags(con, prefix=prefix, limit=limit)
+    return records_response(hashtags)
+
+@app.get("/hashtags/{hashtag_id}/quizzes")
+def list_quizzes_by_hashtag(hashtag_id: int, limit: int = Query(10, ge=1, le=50), after_id: int | None = None):
+    """Fetch a hashtag with its counters and its public quizzes, newest first"""
+    con = read_connection()
+    hashtag = db.get_hashtag(con, hashtag_id=hashtag_id)
+    if not hashtag:
+        raise HTTPException(status_code=404, detail="Hashtag not found")
+    quizzes = db.get_quizzes_by_hashtag(con, hashtag_id=hashtag_id, limit=limit, after_id=after_id)
+    return FastJSONResponse({"hashtag": hashtag, "quizzes": quizzes})
+
+# --- Creators Endpoints ---
+
+@app.get("/creators/{creator_id}/dashboard")
+def get_creator_dashboard(creator_id: int):
+    """Fetch plays, players and average score per creator and per quiz, and the recent sessions of a creator"""
+    require_unsharded()
+    con = read_connection()
+    dashboard = db.get_creator_dashboard(con, creator_id=creator_id)
+    if not dashboard:
+        raise HTTPException(status_code=404, detail="Creator not found")
+    return FastJSONResponse(dashboard)
+
+# --- Quiz snapshots Endpoints ---
+
+def snapshot_response(snapshot_id: int, answers: bool = True, headers: dict | None = None):
+    """
+    Serves a snapshot from the cache, by default it can also be cached forever by the client since it never changes.
+    Without answers it leaves out which alternatives are correct, the player view is cached under (snapshot_id, False)
+    """
+    def load(key):
+        if key == snapshot_id:
+            return db.get_quiz_snapshot_content(get_connection(), snapshot_id)
+        content = snapshot_cache.get(snapshot_id, load)
+        return without_answers(content) if content is not None else None
+
+    content = snapshot_cache.get(snapshot_id if answers else (snapshot_id, False), load)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=headers or {"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+@app.get("/snapshots/{snapshot_id}")
+def get_quiz_snapshot(snapshot_id: int):
+    """Fetch a published quiz snapshot with its questions and answer alternatives, including the correct ones (host view)"""
+    return snapshot_response(snapshot_id)
+
+@app.get("/sessions/{session_id}/quiz")
+def get_session_quiz(session_id: int, request: Request):
+    """Fetch the quiz snapshot that a specific session is playing, without the correct answers (player view)"""
+    con = shards.for_session(session_id)
+    found, snapshot_id = db.get_session_snapshot_id(con, session_id=session_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if snapshot_id is None:
+        raise HTTPException(status_code=404, detail="Session has no quiz")
+    # The session moves to another snapshot when its quiz changes, so this URL is revalidated, by the snapshot id
+    headers = {"ETag": f'W/"snapshot-{snapshot_id}-player"', "Cache-Control": "no-cache"}
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return snapshot_response(snapshot_id, answers=False, headers=headers)
+
 # --- Questions Endpoints ---
 
 @app.get("/questions")
-def list_questions():
-    """Fetch questions from the database, max 10"""
-    con = get_connection()
-    questions = db.get_questions(con, limit=10)
-    return questions
+def list_questions(ids: str | None = None, fields: str | None = None):
+    """Fetch questions from the database, max 10, or the ones with the given ids (?ids=1,2,3)"""
+    if ids is not None:
+        return batch_response("questions", parse_ids(ids), fields)
+    con = read_connection()
+    questions = db.get_questions(con, limit=10, compact=True, fields=parse_fields(fields, QuestionRecord))
+    return records_response(questions)
+
+@app.post("/questions/batch")
+def batch_questions(batch_input: sc.BatchIds, fields: str | None = None):
+    """Fetch questions by id, for id lists too long for a query parameter"""
+    return batch_response("questions", batch_input.ids, fields)
 
 @app.get("/questions/{question_id}")
-def get_question(question_id: int):
-    """Fetch a specific question by ID"""
-    con = get_connection()
-    question = db.get_question(con, question_id=question_id)
+def get_question(question_id: int, request: Request, fields: str | None = None):
+    """Fetch a specific question by ID, answers 304 if the client's copy is still current"""
+    fields = parse_fields(fields, QuestionRecord)
+    etag, version = content_version("questions", question_id, "Question not found", fields_variant(fields, QuestionRecord))
+    if is_not_modified(request, etag, version):
+        return not_modified_response(etag, version)
+    question = coalesced_read(
+        ("questions", question_id), fields, lambda con: db.get_question(con, question_id=question_id, compact=True, fields=fields)
+    )
     if not question:
             raise HTTPException(status_code=404, detail="Question not found")
-    return question
+    response = records_response(question)
+    response.headers.update(cache_headers(etag, version))
+    return response
 
 @app.get("/questions/{quiz_id}")
 def get_quiz_questions(con, quiz_id: int):
@@ -253,10 +728,21 @@ def get_quiz_questions(con, quiz_id: int):
             raise HTTPException(status_code=404, detail="Quiz not found")
     return quiz_questions
 
+@app.get("/questions/{question_id}/stats")
+def get_question_stats(question_id: int):
+    """Fetch answer count, percent correct and response time quantiles for a specific question"""
+    require_unsharded()
+    con = read_connection()
+    stats = db.get_question_stats(con, question_id=question_id)
+    if not stats:
+        if not db.get_question(con, question_id=question_id, compact=True):
+            raise HTTPException(status_code=404, detail="Question not found")
+        stats = {"question_id": question_id, "answer_count": 0, "correct_count": 0, "response_time_sum": 0, "response_time_buckets": []}
+    return question_stats.summarize(stats)
+
 @app.post("/questions")
-def add_question(question_input: sc.QuestionCreate):
+def add_question(question_input: sc.QuestionCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Adds a new question to the database, returns the new object and its ID"""
-    con = get_connection()
     try:
         question_id = db.add_question(
             con, 
@@ -273,9 +759,8 @@ def add_question(question_input: sc.QuestionCreate):
     return question_id
 
 @app.put("/questions/{question_id}", response_model=sc.QuestionResponse)
-def put_update_question(question_id: int, question_update: sc.QuestionUpdate):
+def put_update_question(question_id: int, question_update: sc.QuestionUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific questoin and returns the whole object"""
-    con = get_connection()
     try:
         updated_question = db.put_update_question(
             con, 
@@ -295,9 +780,8 @@ def put_update_question(question_id: int, question_update: sc.QuestionUpdate):
     return updated_question
 
 @app.delete("/questions/{question_id}")
-def delete_question(question_id: int):
+def delete_question(question_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific question and returns its ID"""
-    con = get_connection()
     try:
         deleted_question_id = db.delete_question(con, question_id=question_id)
         if not deleted_question_id:
@@ -307,7 +791,7 @@ def delete_question(question_id: int):
     return deleted_question_id
 
 @app.patch("/questions/{question_id}", response_model=sc.QuestionResponse)
-def patch_update_question(question_id: int, question_patch: sc.QuestionPatch):
+def patch_update_question(question_id: int, question_patch: sc.QuestionPatch, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     update_data = question_patch.model_dump(exclude_unset=True)
 
     if not update_data:
@@ -315,7 +799,6 @@ def patch_update_question(question_id: int, question_patch: sc.QuestionPatch):
     
     query, params = db.patch_update_table(update_data=update_data, table="questions", pk="id")
     params[-1] = question_id
-    con = get_connection()
 
     try:
         with con:
@@ -323,6 +806,8 @@ def patch_update_question(question_id: int, question_patch: sc.QuestionPatch):
                 cursor.execute(query, tuple(params))
                 updated_question = cursor.fetchone()
 
+                if updated_question:
+                    db.notify_change(cursor, "questions", question_id)
                 if not updated_question:
                     raise HTTPException(status_code=404, detail="Question not found")
                 
@@ -343,28 +828,55 @@ def patch_update_question(question_id: int, question_patch: sc.QuestionPatch):
 
 # --- Answer alternatives Endpoints ---
 
+@app.get("/answer_alternatives")
+def list_answer_alternatives(ids: str, fields: str | None = None):
+    """Fetch the answer alternatives with the given ids (?ids=1,2,3)"""
+    return batch_response("answer_alternatives", parse_ids(ids), fields)
+
+@app.post("/answer_alternatives/batch")
+def batch_answer_alternatives(batch_input: sc.BatchIds, fields: str | None = None):
+    """Fetch answer alternatives by id, for id lists too long for a query parameter"""
+    return batch_response("answer_alternatives", batch_input.ids, fields)
+
 @app.get("/answer_alternatives/{question_id}")
-def get_question_answer_alternatives(question_id: int):
-    """Fetch answer alternatives for a specific question"""
-    con = get_connection()
-    answer_alternatives = db.get_question_answer_alternatives(con, question_id=question_id, limit=10)
+def get_question_answer_alternatives(question_id: int, request: Request, fields: str | None = None):
+    """Fetch answer alternatives for a specific question, answers 304 if the client's copy is still current"""
+    # A change to an alternative also changes its question's updated_at
+    fields = parse_fields(fields, AnswerAlternativeRecord)
+    _, version = content_version("questions", question_id, "Question not found")
+    etag = make_etag("question_alternatives", question_id, version, fields_variant(fields, AnswerAlternativeRecord))
+    if is_not_modified(request, etag, version):
+        return not_modified_response(etag, version)
+    answer_alternatives = coalesced_read(
+        ("question_alternatives", question_id), fields,
+        lambda con: db.get_question_answer_alternatives(con, question_id=question_id, limit=10, compact=True, fields=fields),
+    )
     if not answer_alternatives:
         raise HTTPException(status_code=404, detail="Question not found")
-    return answer_alternatives
+    response = records_response(answer_alternatives)
+    response.headers.update(cache_headers(etag, version))
+    return response
 
 @app.get("/answer_alternatives/{answer_alternative_id}")
-def get_answer_alternative(answer_alternative_id: int):
-    """Fetch a specific answer alternative by ID"""
+def get_answer_alternative(answer_alternative_id: int, request: Request, fields: str | None = None):
+    """Fetch a specific answer alternative by ID, answers 304 if the client's copy is still current"""
+    fields = parse_fields(fields, AnswerAlternativeRecord)
+    etag, version = content_version(
+        "answer_alternatives", answer_alternative_id, "Answer not found", fields_variant(fields, AnswerAlternativeRecord)
+    )
+    if is_not_modified(request, etag, version):
+        return not_modified_response(etag, version)
     con = get_connection()
-    answer_alternative = db.get_answer_alternative(con, answer_alternative_id=answer_alternative_id)
+    answer_alternative = db.get_answer_alternative(con, answer_alternative_id=answer_alternative_id, compact=True, fields=fields)
     if not answer_alternative:
             raise HTTPException(status_code=404, detail="Answer not found")
-    return answer_alternative
+    response = records_response(answer_alternative)
+    response.headers.update(cache_headers(etag, version))
+    return response
 
 @app.post("/answer_alternatives")
-def add_answer_alternative(answer_input: sc.AnswerAlternativeCreate):
+def add_answer_alternative(answer_input: sc.AnswerAlternativeCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Adds a new answer alternative to the database, returns the new object and its ID"""
-    con = get_connection()
     try:
         answer_alternative_id = db.add_answer_alternative(
             con, 
@@ -379,9 +891,8 @@ def add_answer_alternative(answer_input: sc.AnswerAlternativeCreate):
     return answer_alternative_id
 
 @app.put("/answer_alternatives/{answer_alternative_id}", response_model=sc.AnswerAlternativeResponse)
-def put_update_answer_alternative(answer_alternative_id: int, answer_update: sc.AnswerAlternativeUpdate):
+def put_update_answer_alternative(answer_alternative_id: int, answer_update: sc.AnswerAlternativeUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific answer alternative and returns the whole object"""
-    con = get_connection()
     try:
         updated_answer = db.put_update_answer_alternative(
             con, 
@@ -398,9 +909,8 @@ def put_update_answer_alternative(answer_alternative_id: int, answer_update: sc.
     return updated_answer
 
 @app.delete("/answer_alternatives/{answer_alternative_id}")
-def delete_answer_alternative(answer_alternative_id: int):
+def delete_answer_alternative(answer_alternative_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific asnwer alternative and returns its ID"""
-    con = get_connection()
     try:
         deleted_answer_id = db.delete_answer_alternative(con, answer_alternative_id=answer_alternative_id)
         if not deleted_answer_id:
@@ -412,25 +922,28 @@ def delete_answer_alternative(answer_alternative_id: int):
 # --- Sessions Endpoints ---
 
 @app.get("/sessions")
-def list_sessions():
+def list_sessions(fields: str | None = None):
     """Fetch sessions from the database, max 10"""
-    con = get_connection()
-    sessions = db.get_sessions(con, limit=10)
-    return sessions
+    fields = parse_fields(fields, SessionRecord)
+    sessions = shards.fan_out(
+        lambda con: db.get_sessions(con, limit=10, compact=True, fields=fields), limit=10, unsharded=read_connection
+    )
+    return records_response(sessions)
 
 @app.get("/sessions/{session_id}")
-def get_session(session_id: int):
+def get_session(session_id: int, fields: str | None = None):
     """Fetch a specific session by ID"""
-    con = get_connection()
-    session = db.get_session(con, session_id=session_id)
+    con = shards.for_session(session_id)
+    session = db.get_session(con, session_id=session_id, compact=True, fields=parse_fields(fields, SessionRecord))
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return records_response(session)
 
 @app.post("/sessions")
-def add_session(session_input: sc.SessionCreate):
+def add_session(session_input: sc.SessionCreate, con: UnitOfWork = Depends(unit_of_work, scope="function"),
+                catalog: UnitOfWork = Depends(catalog_unit_of_work, scope="function")):
     """Adds a new session to the database, returns the new object and its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_code(session_input.session_code))
     try:
         session_id = db.add_session(
             con, 
@@ -441,17 +954,29 @@ def add_session(session_input: sc.SessionCreate):
             session_input.session_status, 
             session_input.started_at, 
             session_input.current_question_id, 
-            session_input.session_code
+            session_input.session_code,
+            catalog_con=catalog if shards.enabled else None,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if session_log.enabled:
+        def log_start(connection):
+            log_event(session_id, SESSION_START, session_input.active_quiz or 0, session_input.session_code)
+            log_question_change(session_id, None, session_input.current_question_id)
+        con.after_commit(log_start)
     return session_id
 
 @app.put("/sessions/{session_id}", response_model=sc.SessionResponse)
-def put_update_session(session_id: int, session_update: sc.SessionUpdate):
+def put_update_session(session_id: int, session_update: sc.SessionUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function"),
+                       catalog: UnitOfWork = Depends(catalog_unit_of_work, scope="function")):
     """Updates a specific session and returns the whole object"""
-    con = get_connection()
+    # Codes are unique per shard and a session lives on shard_for_code(session_code), so a new code has to map to the same one
+    if shards.enabled and shards.shard_for_code(session_update.session_code) != shards.shard_for_id(session_id):
+        raise HTTPException(status_code=409, detail="session_code can only change to a code of the same shard")
+    con.route(lambda: shards.for_session(session_id))
     try:
+        # The event log records question changes, so it needs the question before the update
+        previous = db.get_session(con, session_id=session_id, compact=True, fields=["current_question_id"]) if session_log.enabled else None
         updated_session = db.put_update_session(
             con, 
             session_id, 
@@ -462,18 +987,23 @@ def put_update_session(session_id: int, session_update: sc.SessionUpdate):
             session_update.session_status, 
             session_update.started_at, 
             session_update.current_question_id, 
-            session_update.session_code
+            session_update.session_code,
+            catalog_con=catalog if shards.enabled else None,
         )
         if not updated_session:
             raise HTTPException(status_code=404, detail="Session not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if previous is not None:
+        con.after_commit(lambda connection: log_question_change(
+            session_id, previous.current_question_id, updated_session["current_question_id"]
+        ))
     return updated_session
 
 @app.delete("/sessions/{session_id}")
-def delete_session(session_id: int):
+def delete_session(session_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific session and returns its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_session(session_id))
     try:
         deleted_session_id = db.delete_session(con, session_id=session_id)
         if not deleted_session_id:
@@ -482,37 +1012,151 @@ def delete_session(session_id: int):
         raise HTTPException(status_code=400, detail="Cannot delete session due to foreign key constraints")
     return deleted_session_id
 
+@app.get("/sessions/{session_id}/dashboard")
+def get_session_dashboard(session_id: int, x_min_lsn: str | None = Header(None)):
+    """Fetch the host screen of a session: state, player count, answers on the current question and the top 5"""
+    load = lambda: db.get_session_dashboard(session_read_connection(session_id, x_min_lsn), session_id=session_id)
+    if not shards.enabled and replicas.required_lsn(("session", session_id), x_min_lsn):
+        # The client reads its own write, a cached dashboard could be older than it
+        dashboard = load()
+    else:
+        dashboard = dashboard_cache.get(session_id, load)
+    if not dashboard:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return FastJSONResponse(dashboard)
+
+@app.get("/sessions/{session_id}/live")
+def get_live_session(session_id: int):
+    """Fetch the live state of a running session: current question, remaining time and the players' points and ranks"""
+    try:
+        session = live_sessions.get(session_id)
+    except psycopg2.OperationalError:
+        raise HTTPException(status_code=503, detail="The session's database is unavailable, retry later")
+    if session is None:
+        raise HTTPException(status_code=404, detail="No running session with this ID")
+    return FastJSONResponse(session.as_dict())
+
+@app.get("/sessions/{session_id}/changes")
+def get_session_changes(session_id: int, since: int = Query(..., ge=0)):
+    """
+    Fetch the session rows that changed after version since, and the ids of the deleted ones, or 304 if nothing changed.
+    A client that is too far behind gets the whole session state instead, with full set to true
+    """
+    if session_changes.latest(session_id) == since:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    con = shards.for_session(session_id)
+    delta = session_changes.changes_since(session_id, since)
+    if delta is None:
+        version = db.get_session_version(con, session_id=session_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if version == since:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED)
+        state = db.get_session_state(con, session_id=session_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return FastJSONResponse({"version": state[0], "full": True, "changes": state[1], "deleted": {}})
+
+    version, changed = delta
+    changes, deleted = {}, {}
+    for table, ids in changed.items():
+        if table not in db.SESSION_TABLES:
+            continue
+        records = db.get_records_by_ids(con, table, ids)
+        if records:
+            changes[table] = [records[row_id] for row_id in ids if row_id in records]
+        if len(records) < len(ids):
+            deleted[table] = [row_id for row_id in ids if row_id not in records]
+    return FastJSONResponse({"version": version, "full": False, "changes": changes, "deleted": deleted})
+
+@app.get("/sessions/{session_id}/events")
+async def session_events(session_id: int, request: Request):
+    """Streams the change events of a specific session to the client as server-sent events"""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=100)
+
+    def put_event(event):
+        # Drops events for a client that is too slow to keep up instead of buffering forever
+        if not events.full():
+            events.put_nowait(event)
+
+    change_listener = session_listeners[shards.slot_for_session(session_id)]
+    subscriber = change_listener.subscribe(lambda event: loop.call_soon_threadsafe(put_event, event), session_id=session_id)
+    # Clients that accept it get fixed-width binary frames instead, see wire.py
+    binary = wire.EVENT_CONTENT_TYPE in request.headers.get("accept", "")
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield wire.KEEP_ALIVE_FRAME if binary else ": keep-alive\n\n"
+                    continue
+                yield wire.encode_event(event) if binary else f"data: {dumps(event).decode()}\n\n"
+        finally:
+            change_listener.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type=wire.EVENT_CONTENT_TYPE if binary else "text/event-stream")
+
+@app.post("/sessions/{session_id}/end")
+def end_session(session_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
+    """Ends a specific session and returns it"""
+    con.route(lambda: shards.for_session(session_id))
+    ended_session = db.end_session(con, session_id=session_id)
+    if not ended_session:
+        if not db.get_session(con, session_id=session_id, compact=True):
+            raise HTTPException(status_code=404, detail="Session not found")
+        raise HTTPException(status_code=409, detail="Session has already ended")
+    if session_log.enabled:
+        def log_end(connection):
+            log_question_change(session_id, ended_session["current_question_id"], None)
+            log_event(session_id, SESSION_END)
+        con.after_commit(log_end)
+    return ended_session
+
 # --- Session players Endpoints ---
 
 @app.get("/session_players")
-def list_all_session_players():
-    """Fetch session players from the database, max 10"""
-    con = get_connection()
-    all_session_players = db.get_all_session_players(con, limit=10)
-    return all_session_players
+def list_all_session_players(ids: str | None = None, fields: str | None = None):
+    """Fetch session players from the database, max 10, or the ones with the given ids (?ids=1,2,3)"""
+    if ids is not None:
+        return batch_response("session_players", parse_ids(ids), fields)
+    fields = parse_fields(fields, SessionPlayerRecord)
+    all_session_players = shards.fan_out(
+        lambda con: db.get_all_session_players(con, limit=10, compact=True, fields=fields), limit=10, unsharded=read_connection
+    )
+    return records_response(all_session_players)
+
+@app.post("/session_players/batch")
+def batch_session_players(batch_input: sc.BatchIds, fields: str | None = None):
+    """Fetch session players by id, for id lists too long for a query parameter"""
+    return batch_response("session_players", batch_input.ids, fields)
 
 @app.get("/session_players/{session_id}")
 def get_players_for_session(con, session_id: int):
     """Fetch players for a specific session"""
-    con = get_connection()
+    con = shards.for_session(session_id)
     players = db.get_players_for_session(con, session_id=session_id)
     if not players:
         raise HTTPException(status_code=404, detail="Session not found")
     return players
 
 @app.get("/session_players/{session_player_id}")
-def get_session_player(session_player_id: int):
+def get_session_player(session_player_id: int, fields: str | None = None):
     """Fetch a specific session player by ID"""
-    con = get_connection()
-    player = db.get_session_player(con, session_player_id=session_player_id)
+    con = shards.for_row(session_player_id)
+    player = db.get_session_player(con, session_player_id=session_player_id, compact=True, fields=parse_fields(fields, SessionPlayerRecord))
     if not player:
         raise HTTPException(status_code=404, detail="Session player not found")
-    return player
+    return records_response(player)
 
 @app.post("/session_players")
-def add_session_player(player_input: sc.SessionPlayerCreate):
+def add_session_player(request: Request, player_input: sc.SessionPlayerCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Adds a new session player to the database, returns the new object and its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_session(player_input.session_id))
+    # The player loads the session right after joining, its reads must see the new player
+    con.after_commit(lambda connection: remember_write(request, ("session", player_input.session_id), connection))
     try:
         player_id = db.add_session_player(
             con, 
@@ -524,12 +1168,14 @@ def add_session_player(player_input: sc.SessionPlayerCreate):
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if session_log.enabled:
+        con.after_commit(lambda connection: log_event(player_input.session_id, JOIN, player_id, player_input.display_name))
     return player_id
 
 @app.put("/session_player/{session_player_id}", response_model=sc.SessionPlayerResponse)
-def put_update_session_player(session_player_id: int, player_update: sc.SessionPlayerUpdate):
+def put_update_session_player(session_player_id: int, player_update: sc.SessionPlayerUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific session player and returns the whole object"""
-    con = get_connection()
+    con.route(lambda: shards.for_row(session_player_id))
     try:
         updated_player = db.put_update_session_player(
             con, 
@@ -547,9 +1193,9 @@ def put_update_session_player(session_player_id: int, player_update: sc.SessionP
     return updated_player
 
 @app.delete("/session_players/{session_player_id}")
-def delete_session_player(session_player_id: int):
+def delete_session_player(session_player_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific session player and returns its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_row(session_player_id))
     try:
         deleted_player_id = db.delete_session_player(con, session_player_id=session_player_id)
         if not deleted_player_id:
@@ -561,16 +1207,18 @@ def delete_session_player(session_player_id: int):
 # --- Player answers Endpoints --- 
 
 @app.get("/player_answers")
-def list_all_player_answers():
+def list_all_player_answers(fields: str | None = None):
     """Fetch player asnwers from the database, max 10"""
-    con = get_connection()
-    all_player_answers = db.get_all_player_answers(con, limit=10)
-    return all_player_answers
+    fields = parse_fields(fields, PlayerAnswerRecord)
+    all_player_answers = shards.fan_out(
+        lambda con: db.get_all_player_answers(con, limit=10, compact=True, fields=fields), limit=10, unsharded=read_connection
+    )
+    return records_response(all_player_answers)
 
 @app.get("/player_answers/{session_player_id}")
 def list_answers_by_player(session_player_id: int):
     """Fetch answers by a specific session player based on their ID"""
-    con = get_connection()
+    con = shards.for_row(session_player_id)
     player_answers = db.get_answers_by_player(con, session_player_id=session_player_id, limit=10)
     if not player_answers:
             raise HTTPException(status_code=404, detail="Session player not found")
@@ -579,35 +1227,63 @@ def list_answers_by_player(session_player_id: int):
 @app.get("/player_answers/{session_player_id}/{question_id}")
 def get_player_answer_for_question(session_player_id: int, question_id: int):
     """Fetch answer by a specific player for a specific question"""
-    con = get_connection()
+    con = shards.for_row(session_player_id)
     player_answer = db.get_player_answer_for_question(con, player_id=session_player_id, question_id=question_id)
     if not player_answer:
             raise HTTPException(status_code=404, detail="Player answer not found")
     return player_answer
 
-@app.post("/player_answers")
-def add_player_answer(answer_input: sc.PlayerAnswerCreate):
-    """Adds a new player answer to the database, returns the new object and its ID"""
-    con = get_connection()
+async def answer_values(request: Request) -> tuple:
+    """
+    Reads an answer submission as a tuple in wire.ANSWER_FIELDS order. JSON is validated by PlayerAnswerCreate,
+    the binary formats of wire.py have a fixed schema and are decoded without pydantic
+    """
+    content_type = request.headers.get("content-type")
+    body = await request.body()
+    if wire.is_binary_answer(content_type):
+        try:
+            return wire.decode_answer(content_type, body)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
     try:
-        answer_id = db.add_player_answer(
-            con, 
-            answer_input.player_id, 
-            answer_input.session_id, 
-            answer_input.question_id, 
-            answer_input.answer_id, 
-            answer_input.response_time, 
-            answer_input.points_earned, 
-            answer_input.is_correct
-        )
+        answer_input = sc.PlayerAnswerCreate.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+    return tuple(getattr(answer_input, field) for field in wire.ANSWER_FIELDS)
+
+@app.post("/player_answers", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": sc.PlayerAnswerCreate.model_json_schema()},
+            wire.ANSWER_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            wire.MSGPACK_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        },
+    },
+})
+def add_player_answer(request: Request, answer: tuple = Depends(answer_values)):
+    """
+    Adds a new player answer to the database and the points to the player, returns the new answer's ID.
+    Accepts JSON or one of the compact binary formats of wire.py, and answers in the same format
+    """
+    try:
+        answer_id = answer_queues[shards.slot_for_session(answer[1])].submit(db.write_player_answer, *answer)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if session_log.enabled:
+        player_id, session_id, question_id, answer_alternative_id, response_time, points_earned, is_correct = answer
+        log_event(session_id, ANSWER, answer_id, player_id, question_id, answer_alternative_id, response_time, points_earned, is_correct)
+        if points_earned:
+            log_event(session_id, SCORE, player_id, points_earned)
+    content_type = request.headers.get("content-type")
+    if wire.is_binary_answer(content_type):
+        return Response(wire.encode_answer_id(content_type, answer_id), media_type=wire.media_type(content_type))
     return answer_id
 
 @app.put("/player_answers/{player_answer_id}", response_model=sc.PlayerAnswerResponse)
-def put_update_player_answer(player_answer_id: int, answer_update: sc.PlayerAnswerUpdate):
+def put_update_player_answer(player_answer_id: int, answer_update: sc.PlayerAnswerUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific player answer and returns the whole object"""
-    con = get_connection()
+    con.route(lambda: shards.for_row(player_answer_id))
     try:
         updated_answer = db.put_update_player_answer(
             con, 
@@ -627,9 +1303,9 @@ def put_update_player_answer(player_answer_id: int, answer_update: sc.PlayerAnsw
     return updated_answer
 
 @app.delete("/player_answers/{player_answer_id}")
-def delete_player_answer(player_answer_id: int):
+def delete_player_answer(player_answer_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific player answer and returns its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_row(player_answer_id))
     try:
         deleted_answer_id = db.delete_player_answer(con, player_answer_id=player_answer_id)
         if not deleted_answer_id:
@@ -641,25 +1317,27 @@ def delete_player_answer(player_answer_id: int):
 # --- Session scoreboards Endpoints ---
 
 @app.get("/session_scoreboards")
-def list_session_scoreboards():
+def list_session_scoreboards(fields: str | None = None):
     """Fetch session scoreboards from the database, max 10"""
-    con = get_connection()
-    scoreboards = db.get_session_scoreboards(con, limit=10)
-    return scoreboards
+    fields = parse_fields(fields, ScoreboardRecord)
+    scoreboards = shards.fan_out(
+        lambda con: db.get_session_scoreboards(con, limit=10, compact=True, fields=fields), limit=10, unsharded=read_connection
+    )
+    return records_response(scoreboards)
 
 @app.get("/session_scoreboards/{session_id}")
-def get_scoreboard_for_session(session_id: int):
+def get_scoreboard_for_session(session_id: int, fields: str | None = None, x_min_lsn: str | None = Header(None)):
     """Fetch a scoreboard for a specific session based on the session's ID"""
-    con = get_connection()
-    scoreboard = db.get_scoreboard_for_session(con, session_id=session_id)
+    con = session_read_connection(session_id, x_min_lsn)
+    scoreboard = db.get_scoreboard_for_session(con, session_id=session_id, compact=True, fields=parse_fields(fields, ScoreboardRecord))
     if not scoreboard:
         raise HTTPException(status_code=404, detail="Scoreboard not found")
-    return scoreboard
+    return records_response(scoreboard)
 
 @app.post("/session_scoreboards")
-def add_session_scoreboard(scoreboard_input: sc.ScoreboardCreate):
+def add_session_scoreboard(scoreboard_input: sc.ScoreboardCreate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Adds a new session scoreboard to the database, returns the new object and its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_session(scoreboard_input.session_id))
     try:
         scoreboard_id = db.add_session_scoreboard(
             con, 
@@ -674,9 +1352,9 @@ def add_session_scoreboard(scoreboard_input: sc.ScoreboardCreate):
     return scoreboard_id
 
 @app.put("/session_scoreboards/{session_scoreboard_id}", response_model=sc.ScoreboardResponse)
-def put_update_session_scoreboard(session_scoreboard_id: int, scoreboard_update: sc.ScoreboardUpdate):
+def put_update_session_scoreboard(session_scoreboard_id: int, scoreboard_update: sc.ScoreboardUpdate, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Updates a specific session scoreboard and returns the whole object"""
-    con = get_connection()
+    con.route(lambda: shards.for_row(session_scoreboard_id))
     try:
         updated_scoreboard = db.put_update_session_scoreboard(
             con, 
@@ -694,9 +1372,9 @@ def put_update_session_scoreboard(session_scoreboard_id: int, scoreboard_update:
     return updated_scoreboard
 
 @app.delete("/session_scoreboards/{session_scoreboard_id}")
-def delete_session_scoreboard(session_scoreboard_id: int):
+def delete_session_scoreboard(session_scoreboard_id: int, con: UnitOfWork = Depends(unit_of_work, scope="function")):
     """Delete a specific session scoreboard and returns its ID"""
-    con = get_connection()
+    con.route(lambda: shards.for_row(session_scoreboard_id))
     try:
         deleted_scoreboard_id = db.delete_session_scoreboard(con, session_scoreboard_id=session_scoreboard_id)
         if not deleted_scoreboard_id:
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as api
+import schemas as sc
+import wire
+
+"""
+Benchmark of answer submission (POST /player_answers) in JSON and in the compact binary formats of wire.py.
+The write queue is replaced so that only the request parsing and decoding is measured.
+
+Measures:
+  - decode only: PlayerAnswerCreate.model_validate_json vs wire.decode_answer
+  - end-to-end: the whole request through the app
+
+Run with: python benchmarks/bench_answers.py [requests]
+"""
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+ANSWER = {
+    "player_id": 1234, "session_id": 56, "question_id": 789, "answer_id": 3117,
+    "response_time": 4250, "points_earned": 812, "is_correct": True,
+}
+
+for queue in api.answer_queues:
+    queue.submit = lambda write, *args: 1
+for listener in api.listeners:
+    listener.start = lambda: None  # no database to listen to
+
+bodies = [("json", "application/json", json.dumps(ANSWER).encode())]
+bodies.append(("struct", wire.ANSWER_CONTENT_TYPE, wire.ANSWER_FORMAT.pack(*ANSWER.values())))
+if wire.msgpack is not None:
+    bodies.append(("msgpack", wire.MSGPACK_CONTENT_TYPE, wire.msgpack.packb(list(ANSWER.values()))))
+
+
+def decode(content_type, body):
+    if wire.is_binary_answer(content_type):
+        return wire.decode_answer(content_type, body)
+    return sc.PlayerAnswerCreate.model_validate_json(body)
+
+
+def measure_decode(content_type, body):
+    count = REQUESTS * 50
+    start = time.perf_counter()
+    for _ in range(count):
+        decode(content_type, body)
+    return (time.perf_counter() - start) / count * 1_000_000
+
+
+def measure_requests(client, content_type, body):
+    headers = {"content-type": content_type}
+    client.post("/player_answers", content=body, headers=headers)  # warm up
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        response = client.post("/player_answers", content=body, headers=headers)
+        assert response.status_code == 200
+    return (time.perf_counter() - start) / REQUESTS * 1000
+
+
+def main():
+    print(f"{REQUESTS} requests per measurement")
+    with TestClient(api.app) as client:
+        for name, content_type, body in bodies:
+            print(
+                f"  {name:<8} {len(body):4d} bytes  decode {measure_decode(content_type, body):7.2f} us"
+                f"  request {measure_requests(client, content_type, body):7.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as api
+import db as db
+
+"""
+Benchmark of the startup recovery of the running sessions (recovery.py) and of GET /sessions/{session_id}/live.
+The four recovery queries are replaced with generated rows, so this measures building the live state in the
+worker. The queries themselves scan sessions_active_idx and the (session_id, ...) indexes of the players and
+answers, check them with EXPLAIN ANALYZE on a database with as many running sessions.
+
+Run with: python benchmarks/bench_recovery.py [sessions] [players per session]
+"""
+
+SESSIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+PLAYERS = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+REQUESTS = 2000
+
+session_rows = [(i, 1, 1, 1000 + i % 50, 7.5, 40) for i in range(1, SESSIONS + 1)]
+player_rows = [
+    (session_id, session_id * 1000 + p, f"player {session_id}-{p}", 1000 - p * 10)
+    for session_id in range(1, SESSIONS + 1) for p in range(PLAYERS)
+]
+answered_rows = [
+    (session_id, [session_id * 1000 + p for p in range(0, PLAYERS, 2)]) for session_id in range(1, SESSIONS + 1)
+]
+
+
+class FakeConnection:
+    def close(self):
+        pass
+
+
+def rows_for(rows, session_id):
+    return rows if session_id is None else [row for row in rows if row[0] == session_id]
+
+
+db.get_active_sessions = lambda con, session_id=None: rows_for(session_rows, session_id)
+db.get_active_session_players = lambda con, session_id=None: rows_for(player_rows, session_id)
+db.get_active_session_answered = lambda con, session_id=None: rows_for(answered_rows, session_id)
+db.get_time_limits = lambda con, question_ids: {question_id: 20 for question_id in question_ids}
+api.live_sessions.session_databases = [FakeConnection]
+api.live_sessions.session_database = lambda session_id: FakeConnection()
+api.live_sessions.catalog = FakeConnection
+for listener in api.listeners:
+    listener.start = lambda: None  # no database to listen to
+
+
+def main():
+    print(f"{SESSIONS} running sessions with {PLAYERS} players each")
+    with TestClient(api.app):
+        pass  # the lifespan runs the recovery once as a warm up
+    runs = []
+    for _ in range(5):
+        started = time.perf_counter()
+        api.live_sessions.recover()
+        runs.append((time.perf_counter() - started) * 1000)
+    print(f"recovery   best {min(runs):8.1f} ms   target {api.live_sessions.target_ms:.0f} ms")
+
+    with TestClient(api.app) as client:
+        client.get("/sessions/1/live")
+        started = time.perf_counter()
+        for i in range(REQUESTS):
+            response = client.get(f"/sessions/{i % SESSIONS + 1}/live")
+            assert response.status_code == 200
+        print(f"GET /sessions/{{id}}/live   {(time.perf_counter() - started) / REQUESTS * 1000:.3f} ms per request")
+
+
+if __name__ == "__main__":
+    main()
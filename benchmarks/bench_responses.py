@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as api
+import db as db
+import responses
+from records import ScoreboardRecord, SessionRecord
+
+"""
+Benchmark of the end-to-end request time for GET /sessions and GET /session_scoreboards/{session_id}.
+The database is replaced with generated rows so that only the fastapi + serialization part is measured.
+
+Compares:
+  - fastapi default: dict rows returned from the endpoint (jsonable_encoder + json module)
+  - records + json:  records_response with the json module fallback
+  - records + orjson: records_response with orjson (skipped if it isn't installed)
+
+Run with: python benchmarks/bench_responses.py [rows] [requests]
+"""
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+started = datetime(2025, 1, 1, 12, 0, 0)
+session_records = [
+    SessionRecord(i, f"Session {i}", 1, 1, None, 1, started + timedelta(minutes=i), None, None, 100000 + i, None)
+    for i in range(ROWS)
+]
+scoreboard_records = [ScoreboardRecord(i, 1, i, 1000 - i, i % 10, i + 1) for i in range(ROWS)]
+
+
+def fake_get_sessions(con, limit, compact=False, fields=None):
+    return session_records if compact else [record.as_dict() for record in session_records]
+
+
+def fake_get_scoreboard_for_session(con, session_id, compact=False, fields=None):
+    return scoreboard_records if compact else [record.as_dict() for record in scoreboard_records]
+
+
+db.get_sessions = fake_get_sessions
+db.get_scoreboard_for_session = fake_get_scoreboard_for_session
+api.get_connection = lambda: None
+api.replicas.primary = api.get_connection  # the routers hold the real get_connection since import
+api.shards.catalog = api.get_connection
+api.change_listener.start = lambda: None  # no database to listen to
+api.live_sessions.recover = lambda: None
+
+default_app = FastAPI()
+
+@default_app.get("/sessions")
+def list_sessions():
+    return db.get_sessions(None, limit=10)
+
+@default_app.get("/session_scoreboards/{session_id}")
+def get_scoreboard_for_session(session_id: int):
+    return db.get_scoreboard_for_session(None, session_id=session_id)
+
+
+def measure(client, path):
+    client.get(path)  # warm up
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        response = client.get(path)
+        assert response.status_code == 200
+    return (time.perf_counter() - start) / REQUESTS * 1000
+
+
+def main():
+    orjson_module = responses.orjson
+    modes = [("fastapi default", default_app, None), ("records + json", api.app, None)]
+    if orjson_module is not None:
+        modes.append(("records + orjson", api.app, orjson_module))
+
+    print(f"{ROWS} rows per response, {REQUESTS} requests per measurement")
+    for path in ("/sessions", "/session_scoreboards/1"):
+        print(path)
+        for name, application, serializer in modes:
+            responses.orjson = serializer
+            with TestClient(application) as client:
+                print(f"  {name:<18} {measure(client, path):8.3f} ms/request")
+    responses.orjson = orjson_module
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
+import csv
+import io
+import json
+import re
+
 import psycopg2
 from psycopg2 import errors, sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+from records import (AnswerAlternativeRecord, HashtagRecord, PlayerAnswerRecord, QuestionRecord, QuizRecord,
+                     ScoreboardRecord, SessionPlayerRecord, SessionRecord, UserRecord)
 
 """
 This file is responsible for making database queries, which the fastapi endpoints can use.
@@ -8,91 +16,178 @@ The reason we split them up is to avoid clutter in the endpoints, so that the en
 """
 
 
+# --- Compact row mode ---
+
+def fetch_records(con, record_cls, query, params, one: bool = False):
+    """
+    Runs a SELECT with a plain tuple cursor and maps the rows to record_cls in column order.
+    Used by the readers when compact=True, the query must select record_cls.columns()
+    """
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(query, params)
+            if one:
+                row = cursor.fetchone()
+                return record_cls(*row) if row else None
+            rows = cursor.fetchall()
+    return [record_cls(*row) for row in rows]
+
+
+# --- Change notifications ---
+
+CHANGES_CHANNEL = "kahoot_changes"
+
+def notify_change(cursor, table: str, row_id, session_id=None, related=()):
+    """
+    Sends a compact change event (table, id, session_id) on the LISTEN/NOTIFY channel, see notify.py.
+    Postgres only delivers it when the transaction commits, so listeners never see rolled back changes.
+    A change to a session's rows also bumps sessions.change_version and adds the new version to the event.
+    related lists the other (table, id) rows the same write changed, they share the event and its version
+    """
+    if session_id is None:
+        payload = json.dumps({"table": table, "id": row_id, "session_id": session_id}, separators=(",", ":"))
+        cursor.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, payload))
+        return
+    cursor.execute(
+        """WITH bumped AS (
+            UPDATE sessions SET change_version = change_version + 1 WHERE id = %s RETURNING change_version
+        )
+        SELECT pg_notify(%s, json_strip_nulls(json_build_object(
+            'table', %s::text, 'id', %s::int, 'session_id', %s::int, 'version', (SELECT change_version FROM bumped),
+            'related', %s::json
+        ))::text)""",
+        (session_id, CHANGES_CHANNEL, table, row_id, session_id, json.dumps([list(row) for row in related]) if related else None),
+    )
+
+
 # --- Listing get-operations (fetching several entries) --- 
 
-def get_users(con, limit: int):
+def get_users(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of users from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = UserRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM users LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM users LIMIT %s", (limit,))
             users = cursor.fetchall()
     return users
 
-def get_quizzes(con, limit: int):
+def get_quizzes(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of quizzes from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = QuizRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM quizzes LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM quizzes LIMIT %s", (limit,))
             quizzes = cursor.fetchall()
     return quizzes
 
-def get_sessions(con, limit: int):
-    
+def get_sessions(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of sessions from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = SessionRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM sessions LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM sessions LIMIT %s", (limit,))
             sessions = cursor.fetchall()
     return sessions
 
-def get_all_session_players(con, limit: int):
+def get_all_session_players(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of all session players from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = SessionPlayerRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM session_players LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM session_players LIMIT %s", (limit,))
             session_players = cursor.fetchall()
     return session_players
 
-def get_players_for_session(con, session_id, limit: int):
+def get_players_for_session(con, session_id, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of players in a specific session, based on the limit-parameter"""
+    if compact:
+        record_cls = SessionPlayerRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM session_players WHERE session_id = %s LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (session_id, limit))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM session_players WHERE session_id = %s LIMIT = %s", (session_id, limit),)
             session_players = cursor.fetchall()
     return session_players
 
-def get_questions(con, limit: int):
+def get_questions(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of questions from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = QuestionRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM questions LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM questions LIMIT %s;", (limit,))
             questions = cursor.fetchall()
     return questions
 
-def get_quiz_questions(con, quiz_id, limit: int):
+def get_quiz_questions(con, quiz_id, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of questions for a specific quiz, based on the limit-parameter"""
+    if compact:
+        record_cls = QuestionRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM questions WHERE quiz_id = %s LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (quiz_id, limit))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM questions WHERE quiz_id = %s LIMIT", (quiz_id, limit),)
             quiz_questions = cursor.fetchall()
     return quiz_questions
 
-def get_question_answer_alternatives(con, question_id, limit: int):
+def get_question_answer_alternatives(con, question_id, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of answer alternatives for a specific question, based on the limit-parameter"""
+    if compact:
+        record_cls = AnswerAlternativeRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM answer_alternatives WHERE question_id = %s LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (question_id, limit))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM answer_alternatives WHERE question_id = %s LIMIT %s", (question_id, limit),)
             answer_alternatives = cursor.fetchall()
             return answer_alternatives
         
-def get_all_player_answers(con, limit: int):
+def get_all_player_answers(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of player answers from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = PlayerAnswerRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM player_answers LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM player_answers LIMIT %s", (limit,))
             all_player_answers = cursor.fetchall()
     return all_player_answers
 
-def get_answers_by_player(con, session_player_id, limit: int):
+def get_answers_by_player(con, session_player_id, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of answes by a specific player from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = PlayerAnswerRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM player_answers WHERE player_id = %s LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (session_player_id, limit))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM player_answer WHERE question_id id = %s LIMIT %s", (session_player_id, limit),)
             player_answers = cursor.fetchall()
             return player_answers
         
-def get_session_scoreboards(con, limit: int):
+def get_session_scoreboards(con, limit: int, compact: bool = False, fields: list | None = None):
     """Returns list of session scoreboards from the database, based on the limit-parameter"""
+    if compact:
+        record_cls = ScoreboardRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM session_scoreboards LIMIT %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (limit,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM session_scoreboards LIMIT %s", (limit,))
@@ -101,48 +196,72 @@ def get_session_scoreboards(con, limit: int):
 
 # --- Detail get-operations (fetching one entry) ---
 
-def get_user(con, user_id):
+def get_user(con, user_id, compact: bool = False, fields: list | None = None):
     """Returns the user with the given id from the database"""
+    if compact:
+        record_cls = UserRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM users WHERE id = %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (user_id,), one=True)
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))             
             user = cursor.fetchone()
             return user
         
-def get_quiz(con, quiz_id):
+def get_quiz(con, quiz_id, compact: bool = False, fields: list | None = None):
     """Returns the quiz with the given id from the database"""
+    if compact:
+        record_cls = QuizRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM quizzes WHERE id = %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (quiz_id,), one=True)
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM quizzes WHERE id = %s", (quiz_id,))             
             quiz = cursor.fetchone()
             return quiz
         
-def get_session(con, session_id):
+def get_session(con, session_id, compact: bool = False, fields: list | None = None):
     """Returns the session with the given id from the database"""
+    if compact:
+        record_cls = SessionRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM sessions WHERE id = %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (session_id,), one=True)
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM sessions WHERE id = %s", (session_id,))
             session = cursor.fetchone()
     return session
 
-def get_session_player(con, session_player_id):
+def get_session_player(con, session_player_id, compact: bool = False, fields: list | None = None):
     """Returns the session player with the given id from the database"""
+    if compact:
+        record_cls = SessionPlayerRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM session_players WHERE id = %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (session_player_id,), one=True)
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM session_players WHERE id = %s", (session_player_id,))             
             session_player = cursor.fetchone()
             return session_player
 
-def get_question(con, question_id):
+def get_question(con, question_id, compact: bool = False, fields: list | None = None):
     """Returns the question with the given id from the database"""
+    if compact:
+        record_cls = QuestionRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM questions WHERE id = %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (question_id,), one=True)
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM questions WHERE id = %s", (question_id,))             
             question = cursor.fetchone()
             return question
         
-def get_answer_alternative(con, answer_alternative_id):
+def get_answer_alternative(con, answer_alternative_id, compact: bool = False, fields: list | None = None):
     """Returns the answer alternative with the given id from the database"""
+    if compact:
+        record_cls = AnswerAlternativeRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM answer_alternatives WHERE id = %s").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (answer_alternative_id,), one=True)
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute("SELECT * FROM answer_alternatives WHERE id = %s", (answer_alternative_id,))             
@@ -161,14 +280,247 @@ def get_player_answer_for_question(con, player_id, question_id):
             player_answer = cursor.fetchone()
             return player_answer
 
-def get_scoreboard_for_session(con, session_id):
-    """Returns the scoreboard for a specific session"""
+def get_scoreboard_for_session(con, session_id, compact: bool = False, fields: list | None = None):
+    """Returns the scoreboard rows for a specific session, ordered by rank"""
+    if compact:
+        record_cls = ScoreboardRecord.project(fields)
+        query = sql.SQL("SELECT {} FROM session_scoreboards WHERE session_id = %s ORDER BY rank").format(record_cls.columns())
+        return fetch_records(con, record_cls, query, (session_id,))
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("SELECT * FROM session_scoreboard WHERE session_id = %s", (session_id,))
-            scoreboard = cursor.fetchone()
+            cursor.execute("SELECT * FROM session_scoreboards WHERE session_id = %s ORDER BY rank", (session_id,))
+            scoreboard = cursor.fetchall()
             return scoreboard
 
+# --- Batch get-operations (fetching several entries by id) ---
+
+BATCH_RECORDS = {
+    "users": UserRecord,
+    "quizzes": QuizRecord,
+    "questions": QuestionRecord,
+    "answer_alternatives": AnswerAlternativeRecord,
+    "sessions": SessionRecord,
+    "session_players": SessionPlayerRecord,
+    "player_answers": PlayerAnswerRecord,
+    "session_scoreboards": ScoreboardRecord,
+}
+
+def get_records_by_ids(con, table: str, ids: list, fields: list | None = None):
+    """Returns the rows of a table with the given ids in one query, as a dict of id -> record"""
+    record_cls = BATCH_RECORDS[table].project(fields)
+    query = sql.SQL("SELECT {} FROM {} WHERE id = ANY(%s)").format(record_cls.columns(), sql.Identifier(table))
+    return {record.id: record for record in fetch_records(con, record_cls, query, (list(ids),))}
+
+# --- Content versions ---
+
+VERSIONED_TABLES = ("quizzes", "questions", "answer_alternatives")
+
+def get_content_version(con, table: str, row_id):
+    """Returns only the updated_at of a quiz content row, used for the ETag / Last-Modified headers"""
+    if table not in VERSIONED_TABLES:
+        raise ValueError(f"{table} has no updated_at version")
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(sql.SQL("SELECT updated_at FROM {} WHERE id = %s").format(sql.Identifier(table)), (row_id,))
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+# --- Delta sync ---
+
+SESSION_TABLES = ("sessions", "session_players", "player_answers", "session_scoreboards")
+
+def get_session_version(con, session_id):
+    """Returns the change_version of a session, None if it doesn't exist"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute("SELECT change_version FROM sessions WHERE id = %s", (session_id,))
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_session_state(con, session_id):
+    """
+    Returns (version, {table: [records]}) with the session, its players and its scoreboard,
+    for clients that are too far behind for a delta. None if the session doesn't exist.
+    The version is read first, so the rows are at least as new as it
+    """
+    version = get_session_version(con, session_id)
+    if version is None:
+        return None
+    state = {}
+    for table, column, order in (("sessions", "id", "id"), ("session_players", "session_id", "id"), ("session_scoreboards", "session_id", "rank")):
+        record_cls = BATCH_RECORDS[table].project(None)
+        query = sql.SQL("SELECT {} FROM {} WHERE {} = %s ORDER BY {}").format(
+            record_cls.columns(), sql.Identifier(table), sql.Identifier(column), sql.Identifier(order)
+        )
+        state[table] = fetch_records(con, record_cls, query, (session_id,))
+    return version, state
+
+# --- Host dashboard ---
+
+def get_session_dashboard(con, session_id, top: int = 5):
+    """
+    Returns what the host screen shows in one query: the session state, the player count,
+    the answers received on the current question and the top of the scoreboard
+    """
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """SELECT s.id AS session_id, s.session_name, s.session_status, s.session_code,
+                    s.current_question_id, s.started_at, s.ended_at,
+                    (SELECT count(*) FROM session_players p WHERE p.session_id = s.id) AS player_count,
+                    (SELECT count(*) FROM player_answers a
+                        WHERE a.session_id = s.id AND a.question_id = s.current_question_id) AS answers_received,
+                    coalesce((
+                        SELECT json_agg(top_players) FROM (
+                            SELECT p.id AS player_id, p.display_name, p.player_points
+                            FROM session_players p WHERE p.session_id = s.id
+                            ORDER BY p.player_points DESC, p.id
+                            LIMIT %s
+                        ) top_players), '[]') AS scoreboard
+                FROM sessions s WHERE s.id = %s""",
+                (top, session_id),
+            )
+            dashboard = cursor.fetchone()
+    return dashboard
+
+# --- Search ---
+
+def build_search_query(text: str):
+    """
+    Turns the user's search text into a tsquery string where every word must match,
+    the last word is matched as a prefix so that it works while the user is typing.
+    Returns None when there is nothing to search for
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    words[-1] += ":*"
+    return " & ".join(words)
+
+def search_quizzes(con, text: str, limit: int, after_rank: float | None = None, after_id: int | None = None):
+    """
+    Returns public quizzes matching the search text on title, hashtags and description, best match first.
+    Uses keyset pagination, pass the rank and id of the last result to get the next page
+    """
+    tsquery = build_search_query(text)
+    if tsquery is None:
+        return []
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """SELECT * FROM (
+                    SELECT q.id, q.quiz_creator_id, q.quiz_title, q.quiz_description, q.intro_image, q.created_at,
+                           ts_rank(q.search_vector, query) AS rank
+                    FROM quizzes q, to_tsquery('simple', %s) query
+                    WHERE q.is_public AND q.search_vector @@ query
+                ) matches
+                WHERE %s::real IS NULL OR (rank, id) < (%s::real, %s)
+                ORDER BY rank DESC, id DESC
+                LIMIT %s""",
+                (tsquery, after_rank, after_rank, after_id, limit),
+            )
+            quizzes = cursor.fetchall()
+    return quizzes
+
+# --- Hashtags ---
+
+def get_trending_hashtags(con, limit: int):
+    """Returns the hashtags with the most recent plays, read from the precomputed trending score"""
+    query = sql.SQL("SELECT {} FROM hashtags WHERE trending_score IS NOT NULL ORDER BY trending_score DESC LIMIT %s").format(HashtagRecord.columns())
+    return fetch_records(con, HashtagRecord, query, (limit,))
+
+def autocomplete_hashtags(con, prefix: str, limit: int):
+    """Returns hashtags starting with prefix (case insensitive), the most used first"""
+    pattern = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    query = sql.SQL("SELECT {} FROM hashtags WHERE lower(hashtag_name) LIKE %s ORDER BY quiz_count DESC LIMIT %s").format(HashtagRecord.columns())
+    return fetch_records(con, HashtagRecord, query, (pattern, limit))
+
+def get_hashtag(con, hashtag_id):
+    """Returns the hashtag with the given id and its counters"""
+    query = sql.SQL("SELECT {} FROM hashtags WHERE id = %s").format(HashtagRecord.columns())
+    return fetch_records(con, HashtagRecord, query, (hashtag_id,), one=True)
+
+def get_quizzes_by_hashtag(con, hashtag_id, limit: int, after_id: int | None = None):
+    """Returns public quizzes with a specific hashtag, newest first, pass the last quiz id as after_id for the next page"""
+    query = sql.SQL(
+        """SELECT {} FROM quizzes q JOIN quiz_hashtags qh ON qh.quiz_id = q.id
+        WHERE qh.hashtag_id = %s AND q.is_public AND (%s::int IS NULL OR q.id < %s)
+        ORDER BY q.id DESC LIMIT %s"""
+    ).format(sql.SQL(", ").join(sql.Identifier("q", column_name) for column_name in QuizRecord.__slots__))
+    return fetch_records(con, QuizRecord, query, (hashtag_id, after_id, after_id, limit))
+
+# --- Question stats ---
+
+def get_question_stats(con, question_id):
+    """Returns the question_stats rollup row for a specific question"""
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT * FROM question_stats WHERE question_id = %s", (question_id,))
+            question_stats = cursor.fetchone()
+    return question_stats
+
+def get_quiz_question_stats(con, quiz_id):
+    """Returns the question_stats rollup rows for every question in a specific quiz, in question order"""
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """SELECT q.id AS question_id,
+                    coalesce(s.answer_count, 0) AS answer_count,
+                    coalesce(s.correct_count, 0) AS correct_count,
+                    coalesce(s.response_time_sum, 0) AS response_time_sum,
+                    coalesce(s.response_time_buckets, '{}') AS response_time_buckets
+                FROM questions q LEFT JOIN question_stats s ON s.question_id = q.id
+                WHERE q.quiz_id = %s
+                ORDER BY q.question_order, q.id""",
+                (quiz_id,),
+            )
+            quiz_question_stats = cursor.fetchall()
+    return quiz_question_stats
+
+# --- Creator dashboard ---
+
+def get_creator_dashboard(con, creator_id, recent_sessions: int = 5):
+    """
+    Returns the creator with its profile, the precomputed stats per creator and per quiz, and the most recently
+    ended sessions of its quizzes, all in one query
+    """
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """SELECT c.id AS creator_id, c.name, p.name AS profile_name, p.description AS profile_description,
+                    coalesce(cs.plays, 0) AS plays,
+                    coalesce(cs.total_players, 0) AS total_players,
+                    CASE WHEN cs.total_players > 0 THEN round(cs.score_sum::numeric / cs.total_players, 1) END AS average_score,
+                    cs.last_played_at,
+                    coalesce((
+                        SELECT json_agg(quiz_stats ORDER BY quiz_stats.plays DESC, quiz_stats.quiz_id) FROM (
+                            SELECT q.id AS quiz_id, q.quiz_title,
+                                coalesce(s.plays, 0) AS plays,
+                                coalesce(s.total_players, 0) AS total_players,
+                                CASE WHEN s.total_players > 0 THEN round(s.score_sum::numeric / s.total_players, 1) END AS average_score,
+                                s.last_played_at
+                            FROM quizzes q LEFT JOIN creator_quiz_stats s ON s.quiz_id = q.id
+                            WHERE q.quiz_creator_id = c.id
+                        ) quiz_stats), '[]') AS quizzes,
+                    coalesce((
+                        SELECT json_agg(recent) FROM (
+                            SELECT s.id AS session_id, s.session_name, s.active_quiz, s.started_at, s.ended_at
+                            FROM sessions s JOIN quizzes q ON q.id = s.active_quiz
+                            WHERE q.quiz_creator_id = c.id AND s.ended_at IS NOT NULL
+                            ORDER BY s.ended_at DESC
+                            LIMIT %s
+                        ) recent), '[]') AS recent_sessions
+                FROM creators c
+                LEFT JOIN LATERAL (
+                    SELECT name, description FROM creator_profiles WHERE creator_id = c.id ORDER BY id LIMIT 1
+                ) p ON true
+                LEFT JOIN creator_stats cs ON cs.creator_id = c.id
+                WHERE c.id = %s""",
+                (recent_sessions, creator_id),
+            )
+            dashboard = cursor.fetchone()
+    return dashboard
+
 # --- POST/ADD OPERATIONS ---
 
 def add_user(con, user_name, email, password, registration_date, user_status, birth_date):
@@ -194,6 +546,7 @@ def add_quiz(con, quiz_creator_id, quiz_title, quiz_description, intro_image, cr
                 (quiz_creator_id, quiz_title, quiz_description, intro_image, created_at, updated_at, is_public),
             )
             quiz_id = cursor.fetchone()["id"]
+            notify_change(cursor, "quizzes", quiz_id)
             con.commit()
     return quiz_id
 
@@ -207,6 +560,7 @@ def add_question(con, quiz_id, question_text, question_order, time_limit, points
                 (quiz_id, question_text, question_order, time_limit, points, question_type, image),
             )
             question_id = cursor.fetchone()["id"]
+            notify_change(cursor, "questions", question_id)
             con.commit()
     return question_id
 
@@ -220,32 +574,47 @@ def add_answer_alternative(con, question_id, answer_text, is_correct, answer_ico
                 (question_id, answer_text, is_correct, answer_icon, answer_order),
             )
             answer_alternative_id = cursor.fetchone()["id"]
+            notify_change(cursor, "answer_alternatives", answer_alternative_id)
             con.commit()
     return answer_alternative_id
 
-def add_player_answer(con, player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct):
-    """Adds a new player answer to the database and returns its ID"""
-    with con:
-        with con.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
-                """INSERT INTO player_answers (player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct)
-                VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;""",
-                (player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct),
-            )
-            player_answer = cursor.fetchone()["id"]
-            con.commit()
-            return player_answer
+def write_player_answer(cursor, player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct):
+    """
+    Adds a new player answer and its points to the player, and returns the answer's ID.
+    Runs on the cursor it gets without committing, it is used by the group commit write queue
+    """
+    cursor.execute(
+        """INSERT INTO player_answers (player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct)
+        VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;""",
+        (player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct),
+    )
+    player_answer_id = cursor.fetchone()[0]
+    related = ()
+    if points_earned:
+        cursor.execute(
+            "UPDATE session_players SET player_points = player_points + %s WHERE id = %s",
+            (points_earned, player_id),
+        )
+        related = (("session_players", player_id),)
+    # One version bump per answer, the points of the player come with it
+    notify_change(cursor, "player_answers", player_answer_id, session_id, related=related)
+    return player_answer_id
 
-def add_session(con, session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code):
-    """Adds a new session to the database and returns its ID"""
+def add_session(con, session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code, catalog_con=None):
+    """
+    Adds a new session to the database, pinned to the newest snapshot of its quiz, and returns its ID.
+    catalog_con is the connection for the snapshot when the session is on a shard
+    """
     with con:
+        snapshot_id = snapshot_for_quiz(catalog_con or con, active_quiz) if active_quiz else None
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
-                """INSERT INTO sessions (session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id;""",
-                (session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code),
+                """INSERT INTO sessions (session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code, snapshot_id, question_started_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, CASE WHEN %s::int IS NULL THEN NULL ELSE now() END) RETURNING id;""",
+                (session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code, snapshot_id, current_question_id),
             )
             session_id = cursor.fetchone()["id"]
+            notify_change(cursor, "sessions", session_id, session_id)
             con.commit()
             return session_id
         
@@ -259,6 +628,7 @@ def add_session_player(con, session_id, display_name, user_id, joined_at, player
                 (session_id, display_name, user_id, joined_at, player_points),
             )
             player_id = cursor.fetchone()["id"]
+            notify_change(cursor, "session_players", player_id, session_id)
             con.commit()
             return player_id
 
@@ -272,9 +642,498 @@ def add_session_scoreboard(con, session_id, player_id, total_score, correct_answ
                 (session_id, player_id, total_score, correct_answers, rank),
             )
             scoreboard_id = cursor.fetchone()["id"]
+            notify_change(cursor, "session_scoreboards", scoreboard_id, session_id)
             con.commit()
             return scoreboard_id
         
+def end_session(con, session_id):
+    """Sets ended_at on a session that hasn't ended yet and returns it, this is what updates the creator stats"""
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                "UPDATE sessions SET ended_at = now() WHERE id = %s AND ended_at IS NULL RETURNING *;",
+                (session_id,),
+            )
+            ended_session = cursor.fetchone()
+            if ended_session:
+                notify_change(cursor, "sessions", session_id, session_id)
+            con.commit()
+    return ended_session
+
+# --- Quiz bundles (import / export) ---
+
+def reserve_ids(cursor, table: str, count: int):
+    """Takes count ids from the id sequence of a table, so rows can be inserted with known ids"""
+    if count == 0:
+        return []
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        (table, count),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def link_quiz_hashtags(cursor, quiz_id, hashtag_names):
+    """
+    Links a quiz to hashtags by name, creating the hashtags that don't exist yet. Names are matched case-insensitively
+    (hashtags_name_prefix_idx), so an existing "Math" is reused for "math", the oldest one if there are several.
+    A new hashtag keeps the case it was first submitted with
+    """
+    names = {}  # lowercased name -> name as submitted
+    for name in hashtag_names:
+        name = name.strip().lstrip("#")
+        if name:
+            names.setdefault(name.lower(), name)
+    if not names:
+        return
+    cursor.execute(
+        """SELECT DISTINCT ON (lower(hashtag_name)) lower(hashtag_name), id FROM hashtags
+        WHERE lower(hashtag_name) = ANY(%s) ORDER BY lower(hashtag_name), id""",
+        (list(names),),
+    )
+    hashtag_ids = dict(cursor.fetchall())
+    missing = [name for key, name in names.items() if key not in hashtag_ids]
+    if missing:
+        created = execute_values(cursor, "INSERT INTO hashtags (hashtag_name) VALUES %s RETURNING hashtag_name, id", [(name,) for name in missing], fetch=True)
+        hashtag_ids.update((name.lower(), hashtag_id) for name, hashtag_id in created)
+    execute_values(
+        cursor,
+        "INSERT INTO quiz_hashtags (quiz_id, hashtag_id) VALUES %s ON CONFLICT DO NOTHING",
+        [(quiz_id, hashtag_ids[key]) for key in names],
+    )
+
+def import_quiz_bundle(cursor, bundle: dict):
+    """
+    Inserts a whole quiz bundle (see schemas.QuizBundle) on the given cursor and returns the new quiz ID.
+    Question ids are reserved up front so every table is written with one multi-row insert, the caller commits
+    """
+    quiz = bundle["quiz"]
+    cursor.execute(
+        """INSERT INTO quizzes (quiz_creator_id, quiz_title, quiz_description, intro_image, created_at, updated_at, is_public)
+        VALUES (%s, %s, %s, %s, now(), now(), %s) RETURNING id;""",
+        (quiz["quiz_creator_id"], quiz["quiz_title"], quiz.get("quiz_description"), quiz.get("intro_image"), quiz.get("is_public", False)),
+    )
+    quiz_id = cursor.fetchone()[0]
+
+    questions = bundle.get("questions", [])
+    question_ids = reserve_ids(cursor, "questions", len(questions))
+    if questions:
+        execute_values(
+            cursor,
+            """INSERT INTO questions (id, quiz_id, question_text, question_order, time_limit, points, question_type, image)
+            VALUES %s""",
+            [
+                (question_id, quiz_id, question["question_text"],
+                 question["question_order"] if question.get("question_order") is not None else order,
+                 question["time_limit"], question.get("points", 100), question["question_type"], question["image"])
+                for order, (question_id, question) in enumerate(zip(question_ids, questions), start=1)
+            ],
+        )
+
+    alternatives = [
+        (question_id, alternative["answer_text"], alternative["is_correct"], alternative["answer_icon"],
+         alternative["answer_order"] if alternative.get("answer_order") is not None else order)
+        for question_id, question in zip(question_ids, questions)
+        for order, alternative in enumerate(question.get("alternatives", []), start=1)
+    ]
+    if alternatives:
+        execute_values(
+            cursor,
+            "INSERT INTO answer_alternatives (question_id, answer_text, correct_status, answer_icon, answer_order) VALUES %s",
+            alternatives,
+            page_size=1000,
+        )
+
+    link_quiz_hashtags(cursor, quiz_id, bundle.get("hashtags", []))
+    notify_change(cursor, "quizzes", quiz_id)
+    return quiz_id
+
+def add_quiz_bundle(con, bundle: dict):
+    """Imports a whole quiz bundle in one transaction and returns the new quiz ID"""
+    with con:
+        with con.cursor() as cursor:
+            quiz_id = import_quiz_bundle(cursor, bundle)
+            con.commit()
+    return quiz_id
+
+def get_quiz_bundle(con, quiz_id):
+    """Returns a quiz with its questions, answer alternatives and hashtags as a bundle, built in one query"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """SELECT json_build_object(
+                    'quiz', json_build_object(
+                        'quiz_creator_id', q.quiz_creator_id,
+                        'quiz_title', q.quiz_title,
+                        'quiz_description', q.quiz_description,
+                        'intro_image', q.intro_image,
+                        'is_public', coalesce(q.is_public, false)),
+                    'hashtags', coalesce((
+                        SELECT json_agg(h.hashtag_name ORDER BY h.hashtag_name)
+                        FROM quiz_hashtags qh JOIN hashtags h ON h.id = qh.hashtag_id
+                        WHERE qh.quiz_id = q.id), '[]'),
+                    'questions', coalesce((
+                        SELECT json_agg(json_build_object(
+                            'question_text', qu.question_text,
+                            'question_order', qu.question_order,
+                            'time_limit', qu.time_limit,
+                            'points', qu.points,
+                            'question_type', qu.question_type,
+                            'image', qu.image,
+                            'alternatives', coalesce((
+                                SELECT json_agg(json_build_object(
+                                    'answer_text', a.answer_text,
+                                    'is_correct', a.correct_status,
+                                    'answer_icon', a.answer_icon,
+                                    'answer_order', a.answer_order) ORDER BY a.answer_order, a.id)
+                                FROM answer_alternatives a WHERE a.question_id = qu.id), '[]'))
+                            ORDER BY qu.question_order, qu.id)
+                        FROM questions qu WHERE qu.quiz_id = q.id), '[]'))
+                FROM quizzes q WHERE q.id = %s""",
+                (quiz_id,),
+            )
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+def clone_quiz(con, quiz_id, quiz_creator_id=None, quiz_title=None):
+    """
+    Copies a quiz with its questions, answer alternatives and hashtag links in one statement and returns the new quiz ID.
+    New question ids are drawn from the sequence in question_map, which is how the alternatives find their new question.
+    The copy is private until it is published, and keeps the original's creator and title unless new ones are given
+    """
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """WITH new_quiz AS (
+                    INSERT INTO quizzes (quiz_creator_id, quiz_title, quiz_description, intro_image, created_at, updated_at, is_public)
+                    SELECT coalesce(%(creator_id)s, quiz_creator_id), coalesce(%(title)s, quiz_title), quiz_description, intro_image, now(), now(), false
+                    FROM quizzes WHERE id = %(quiz_id)s
+                    RETURNING id
+                ),
+                question_map AS MATERIALIZED (
+                    SELECT id AS old_id, nextval(pg_get_serial_sequence('questions', 'id')) AS new_id
+                    FROM questions WHERE quiz_id = %(quiz_id)s
+                ),
+                new_questions AS (
+                    INSERT INTO questions (id, quiz_id, question_text, question_order, time_limit, points, question_type, image)
+                    SELECT m.new_id, nq.id, q.question_text, q.question_order, q.time_limit, q.points, q.question_type, q.image
+                    FROM questions q JOIN question_map m ON m.old_id = q.id CROSS JOIN new_quiz nq
+                    RETURNING id
+                ),
+                new_alternatives AS (
+                    INSERT INTO answer_alternatives (question_id, answer_text, correct_status, answer_icon, answer_order)
+                    SELECT m.new_id, a.answer_text, a.correct_status, a.answer_icon, a.answer_order
+                    FROM answer_alternatives a JOIN question_map m ON m.old_id = a.question_id
+                    WHERE EXISTS (SELECT 1 FROM new_quiz)
+                    RETURNING id
+                ),
+                new_links AS (
+                    INSERT INTO quiz_hashtags (quiz_id, hashtag_id)
+                    SELECT nq.id, qh.hashtag_id FROM quiz_hashtags qh CROSS JOIN new_quiz nq
+                    WHERE qh.quiz_id = %(quiz_id)s
+                    RETURNING hashtag_id
+                )
+                SELECT (SELECT id FROM new_quiz), (SELECT count(*) FROM new_questions), (SELECT count(*) FROM new_alternatives)""",
+                {"quiz_id": quiz_id, "creator_id": quiz_creator_id, "title": quiz_title},
+            )
+            new_quiz_id = cursor.fetchone()[0]
+            if new_quiz_id:
+                notify_change(cursor, "quizzes", new_quiz_id)
+            con.commit()
+    return new_quiz_id
+
+# --- Quiz snapshots ---
+
+def create_quiz_snapshot(con, quiz_id):
+    """
+    Serializes the quiz with its questions and answer alternatives into a new snapshot version and returns (id, version),
+    or None if the quiz doesn't exist. Runs in the caller's transaction, the caller commits
+    """
+    with con.cursor() as cursor:
+        # Locks the quiz so two publishes can't take the same version number
+        cursor.execute("SELECT id FROM quizzes WHERE id = %s FOR UPDATE", (quiz_id,))
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute(
+            """INSERT INTO quiz_snapshots (quiz_id, version, content)
+            SELECT q.id, v.version, json_build_object(
+                'quiz_id', q.id,
+                'version', v.version,
+                'quiz_title', q.quiz_title,
+                'quiz_description', q.quiz_description,
+                'intro_image', q.intro_image,
+                'questions', coalesce((
+                    SELECT json_agg(json_build_object(
+                        'id', qu.id,
+                        'question_text', qu.question_text,
+                        'question_order', qu.question_order,
+                        'time_limit', qu.time_limit,
+                        'points', qu.points,
+                        'question_type', qu.question_type,
+                        'image', qu.image,
+                        'alternatives', coalesce((
+                            SELECT json_agg(json_build_object(
+                                'id', a.id,
+                                'answer_text', a.answer_text,
+                                'is_correct', a.correct_status,
+                                'answer_icon', a.answer_icon,
+                                'answer_order', a.answer_order) ORDER BY a.answer_order, a.id)
+                            FROM answer_alternatives a WHERE a.question_id = qu.id), '[]'))
+                        ORDER BY qu.question_order, qu.id)
+                    FROM questions qu WHERE qu.quiz_id = q.id), '[]'))::text
+            FROM quizzes q
+            CROSS JOIN (SELECT coalesce(max(version), 0) + 1 AS version FROM quiz_snapshots WHERE quiz_id = %s) v
+            WHERE q.id = %s
+            RETURNING id, version""",
+            (quiz_id, quiz_id),
+        )
+        snapshot_id, version = cursor.fetchone()
+    return snapshot_id, version
+
+def snapshot_for_quiz(con, quiz_id):
+    """Returns the id of the newest snapshot of a quiz, publishing one first if there is none. Runs in the caller's transaction"""
+    with con.cursor() as cursor:
+        cursor.execute("SELECT id FROM quiz_snapshots WHERE quiz_id = %s ORDER BY version DESC LIMIT 1", (quiz_id,))
+        row = cursor.fetchone()
+    if row:
+        return row[0]
+    snapshot = create_quiz_snapshot(con, quiz_id)
+    return snapshot[0] if snapshot else None
+
+def publish_quiz(con, quiz_id):
+    """Publishes a new snapshot version of a quiz and returns (id, version), or None if the quiz doesn't exist"""
+    with con:
+        snapshot = create_quiz_snapshot(con, quiz_id)
+        con.commit()
+    return snapshot
+
+def get_quiz_snapshot_content(con, snapshot_id):
+    """Returns the serialized content of a snapshot, snapshots never change so the result can be cached forever"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute("SELECT content FROM quiz_snapshots WHERE id = %s", (snapshot_id,))
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_session_snapshot_id(con, session_id):
+    """Returns (found, snapshot_id) for a session, found is False if the session doesn't exist"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute("SELECT snapshot_id FROM sessions WHERE id = %s", (session_id,))
+            row = cursor.fetchone()
+    return (True, row[0]) if row else (False, None)
+
+# --- Background jobs ---
+
+JOB_COLUMNS = """id, job_type, payload, status, attempts, max_attempts, run_after, progress, progress_message,
+    result, error, locked_by, created_at, started_at, heartbeat_at, finished_at"""
+
+def enqueue_job(con, job_type: str, payload: dict, max_attempts: int = 3):
+    """Adds a job to the queue and returns its ID"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO jobs (job_type, payload, max_attempts) VALUES (%s, %s::jsonb, %s) RETURNING id",
+                (job_type, json.dumps(payload), max_attempts),
+            )
+            job_id = cursor.fetchone()[0]
+            con.commit()
+            return job_id
+
+def claim_job(con, job_types: list, worker: str):
+    """
+    Takes the oldest queued job of one of job_types that is due and marks it running, or returns None.
+    SKIP LOCKED lets any number of workers claim jobs at the same time without waiting on each other
+    """
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                    started_at = now(), heartbeat_at = now(), error = NULL
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND run_after <= now() AND job_type = ANY(%s)
+                    ORDER BY run_after, id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, job_type, payload, attempts, max_attempts""",
+                (worker, list(job_types)),
+            )
+            job = cursor.fetchone()
+            con.commit()
+            return job
+
+def update_job_progress(con, job_id, progress: float, message: str | None = None):
+    """Records the progress (0 to 1) of a running job, which also counts as its heartbeat"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """UPDATE jobs SET progress = %s, progress_message = coalesce(%s, progress_message), heartbeat_at = now()
+                WHERE id = %s AND status = 'running'""",
+                (progress, message, job_id),
+            )
+            con.commit()
+
+def touch_jobs(con, running: dict):
+    """Renews the heartbeat of the running jobs {job_id: worker} that those workers still hold"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """UPDATE jobs SET heartbeat_at = now()
+                FROM unnest(%s::bigint[], %s::text[]) AS held (id, worker)
+                WHERE jobs.id = held.id AND jobs.locked_by = held.worker AND jobs.status = 'running'""",
+                (list(running), list(running.values())),
+            )
+            con.commit()
+
+def complete_job(con, job_id, result):
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """UPDATE jobs SET status = 'succeeded', progress = 1, result = %s::jsonb, finished_at = now(), locked_by = NULL
+                WHERE id = %s""",
+                (json.dumps(result, default=str), job_id),
+            )
+            con.commit()
+
+def fail_job(con, job_id, error: str, retry_delay: float | None):
+    """Puts a failed job back in the queue after retry_delay seconds, or marks it failed if retry_delay is None"""
+    with con:
+        with con.cursor() as cursor:
+            if retry_delay is None:
+                cursor.execute(
+                    "UPDATE jobs SET status = 'failed', error = %s, finished_at = now(), locked_by = NULL WHERE id = %s",
+                    (error, job_id),
+                )
+            else:
+                cursor.execute(
+                    """UPDATE jobs SET status = 'queued', error = %s, locked_by = NULL,
+                        run_after = now() + make_interval(secs => %s)
+                    WHERE id = %s""",
+                    (error, retry_delay, job_id),
+                )
+            con.commit()
+
+def requeue_stale_jobs(con, stale_after: float):
+    """Puts running jobs back in the queue when their worker stopped sending heartbeats, returns how many"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    error = 'Worker stopped responding', locked_by = NULL, run_after = now(),
+                    finished_at = CASE WHEN attempts >= max_attempts THEN now() END
+                WHERE status = 'running' AND heartbeat_at < now() - make_interval(secs => %s)""",
+                (stale_after,),
+            )
+            count = cursor.rowcount
+            con.commit()
+            return count
+
+def get_job(con, job_id):
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+            job = cursor.fetchone()
+    return job
+
+def get_jobs(con, limit: int, status: str | None = None, job_type: str | None = None):
+    """Returns the newest jobs, optionally only those with the given status and/or type"""
+    with con:
+        with con.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                f"""SELECT {JOB_COLUMNS} FROM jobs
+                WHERE (%(status)s::text IS NULL OR status = %(status)s) AND (%(job_type)s::text IS NULL OR job_type = %(job_type)s)
+                ORDER BY created_at DESC, id DESC LIMIT %(limit)s""",
+                {"status": status, "job_type": job_type, "limit": limit},
+            )
+            jobs = cursor.fetchall()
+    return jobs
+
+# --- Crash recovery ---
+# A session is running from started_at until ended_at, sessions_active_idx covers exactly those rows
+
+def get_active_sessions(con, session_id=None):
+    """
+    Returns (id, active_quiz, snapshot_id, current_question_id, seconds since the question started, change_version)
+    of every running session, or only of session_id. The seconds are measured by the database, so they don't
+    depend on the clock of the worker
+    """
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """SELECT id, active_quiz, snapshot_id, current_question_id,
+                    extract(epoch FROM now() - question_started_at)::float8, change_version
+                FROM sessions
+                WHERE started_at IS NOT NULL AND ended_at IS NULL AND (%(session_id)s::int IS NULL OR id = %(session_id)s)""",
+                {"session_id": session_id},
+            )
+            sessions = cursor.fetchall()
+    return sessions
+
+def get_active_session_players(con, session_id=None):
+    """Returns (session_id, id, display_name, player_points) of the players of the running sessions, best first"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """SELECT p.session_id, p.id, p.display_name, p.player_points
+                FROM sessions s JOIN session_players p ON p.session_id = s.id
+                WHERE s.started_at IS NOT NULL AND s.ended_at IS NULL AND (%(session_id)s::int IS NULL OR s.id = %(session_id)s)
+                ORDER BY p.session_id, p.player_points DESC, p.id""",
+                {"session_id": session_id},
+            )
+            players = cursor.fetchall()
+    return players
+
+def get_active_session_answered(con, session_id=None):
+    """Returns (session_id, [player ids]) of the players that answered the current question of the running sessions"""
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute(
+                """SELECT a.session_id, array_agg(DISTINCT a.player_id)
+                FROM sessions s JOIN player_answers a ON a.session_id = s.id AND a.question_id = s.current_question_id
+                WHERE s.started_at IS NOT NULL AND s.ended_at IS NULL AND (%(session_id)s::int IS NULL OR s.id = %(session_id)s)
+                GROUP BY a.session_id""",
+                {"session_id": session_id},
+            )
+            answered = cursor.fetchall()
+    return answered
+
+def get_time_limits(con, question_ids: list):
+    """Returns {question_id: time_limit} of the given questions"""
+    if not question_ids:
+        return {}
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute("SELECT id, time_limit FROM questions WHERE id = ANY(%s)", (list(question_ids),))
+            time_limits = dict(cursor.fetchall())
+    return time_limits
+
+# --- Session event logs ---
+
+def copy_session_events(con, session_id, rows_after):
+    """
+    Copies the events of a session's log into session_events with COPY. rows_after(seq) returns the rows after
+    the last event that is in the table already, so copying a log again only adds its new events.
+    Returns the number of copied events
+    """
+    with con:
+        with con.cursor() as cursor:
+            cursor.execute("SELECT coalesce(max(seq), 0) FROM session_events WHERE session_id = %s", (session_id,))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            count = 0
+            for row in rows_after(cursor.fetchone()[0]):
+                writer.writerow(row)
+                count += 1
+            buffer.seek(0)
+            cursor.copy_expert(
+                """COPY session_events (session_id, seq, event_type, occurred_at, player_id, question_id, points, detail)
+                FROM STDIN WITH (FORMAT csv)""",
+                buffer,
+            )
+            con.commit()
+    return count
+
 # -------- PUT OPERATIONS -------------
 
 def put_update_user(con, user_id, user_name, email, password, registration_date, user_status, birth_date):
@@ -307,6 +1166,8 @@ def put_update_quiz(con, quiz_id, quiz_creator_id, quiz_title, quiz_description,
                 (quiz_creator_id, quiz_title, quiz_description, intro_image, created_at, updated_at, is_public, quiz_id),
             )
             updated_quiz = cursor.fetchone()
+            if updated_quiz:
+                notify_change(cursor, "quizzes", updated_quiz["id"])
             con.commit()
     return {
         "id": updated_quiz["id"],
@@ -329,6 +1190,8 @@ def put_update_question(con, question_id, quiz_id, question_text, question_order
                 (quiz_id, question_text, question_order, time_limit, points, question_type, image, question_id),
             )
             updated_question = cursor.fetchone()
+            if updated_question:
+                notify_change(cursor, "questions", updated_question["id"])
             con.commit()
     return {
         "id": updated_question["id"],
@@ -351,6 +1214,8 @@ def put_update_answer_alternative(con, answer_alternative_id, question_id, answe
                 (question_id, answer_text, is_correct, answer_icon, answer_order, answer_alternative_id),
             )
             updated_answer_alternative = cursor.fetchone()
+            if updated_answer_alternative:
+                notify_change(cursor, "answer_alternatives", updated_answer_alternative["id"])
             con.commit()
     return {
         "id": updated_answer_alternative["id"], 
@@ -361,16 +1226,24 @@ def put_update_answer_alternative(con, answer_alternative_id, question_id, answe
         "answer_order": updated_answer_alternative.get("answer_order")
     }
 
-def put_update_session(con, session_id, session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code):
-    """Updates a specfic session and returns it"""
+def put_update_session(con, session_id, session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code, catalog_con=None):
+    """
+    Updates a specfic session and returns it, the session is pinned to a new snapshot only if its quiz changes.
+    catalog_con is the connection for the snapshot when the session is on a shard
+    """
     with con:
+        snapshot_id = snapshot_for_quiz(catalog_con or con, active_quiz) if active_quiz else None
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
-                """UPDATE sessions SET session_name = %s, host_user_id = %s, active_quiz = %s, qr_code_id = %s, session_status = %s, started_at = %s, current_question_id = %s, session_code = %s
+                """UPDATE sessions SET session_name = %s, host_user_id = %s, active_quiz = %s, qr_code_id = %s, session_status = %s, started_at = %s, current_question_id = %s, session_code = %s,
+                snapshot_id = CASE WHEN active_quiz IS NOT DISTINCT FROM %s THEN snapshot_id ELSE %s END,
+                question_started_at = CASE WHEN current_question_id IS NOT DISTINCT FROM %s THEN question_started_at WHEN %s::int IS NULL THEN NULL ELSE now() END
                 WHERE id = %s RETURNING *;""",
-                (session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code, session_id),
+                (session_name, host_user_id, active_quiz, qr_code_id, session_status, started_at, current_question_id, session_code, active_quiz, snapshot_id, current_question_id, current_question_id, session_id),
             )
             updated_session = cursor.fetchone()
+            if updated_session:
+                notify_change(cursor, "sessions", updated_session["id"], session_id)
             con.commit()
     return {
         "id": updated_session["id"],
@@ -381,7 +1254,8 @@ def put_update_session(con, session_id, session_name, host_user_id, active_quiz,
         "session_status": updated_session.get("session_status"),
         "started_at": updated_session.get("started_at"), 
         "current_question_id": updated_session.get("current_question_id"), 
-        "session_code": updated_session.get("session_code")
+        "session_code": updated_session.get("session_code"),
+        "snapshot_id": updated_session.get("snapshot_id")
     }
 
 def put_update_session_player(con, session_player_id, session_id, display_name, user_id, joined_at, player_points):
@@ -394,6 +1268,8 @@ def put_update_session_player(con, session_player_id, session_id, display_name,
                 (session_id, display_name, user_id, joined_at, player_points, session_player_id),
             )
             updated_player = cursor.fetchone()
+            if updated_player:
+                notify_change(cursor, "session_players", updated_player["id"], session_id)
             con.commit()
     return {
         "id": updated_player["id"],
@@ -413,7 +1289,9 @@ def put_update_player_answer(con, player_answer_id, player_id, session_id, quest
                 WHERE id = %s RETURNING *;""",
                 (player_id, session_id, question_id, answer_id, response_time, points_earned, is_correct, player_answer_id),
             )
-            updated_answer = con.fetchone()
+            updated_answer = cursor.fetchone()
+            if updated_answer:
+                notify_change(cursor, "player_answers", updated_answer["id"], session_id)
             con.commit()
     return {
         "id": updated_answer["id"],
@@ -436,6 +1314,8 @@ def put_update_session_scoreboard(con, session_scoreboard_id, session_id, player
                 (session_id, player_id, total_score, correct_answers, rank, session_scoreboard_id),
             )
             updated_scoreboard = cursor.fetchone()
+            if updated_scoreboard:
+                notify_change(cursor, "session_scoreboards", updated_scoreboard["id"], session_id)
             con.commit()
     return {
         "id": updated_scoreboard["id"],
@@ -465,6 +1345,8 @@ def delete_quiz(con, quiz_id):
             cursor.execute(
                 "DELETE FROM quizzes WHERE id = %s RETURNINNG id;", (quiz_id,))
             deleted_quiz_id = cursor.fetchone()
+            if deleted_quiz_id:
+                notify_change(cursor, "quizzes", deleted_quiz_id["id"])
             con.commit()
     return deleted_quiz_id
 
@@ -475,6 +1357,8 @@ def delete_question(con, question_id):
             cursor.execute(
                 "DELETE FROM questions WHERE id = %s RETURNING id;", (question_id,))
             deleted_question_id = cursor.fetchone()
+            if deleted_question_id:
+                notify_change(cursor, "questions", deleted_question_id["id"])
             con.commit()
     return deleted_question_id
 
@@ -485,6 +1369,8 @@ def delete_answer_alternative(con, answer_alternative_id):
                 cursor.execute(
                     "DELETE FROM answer_alternatives WHERE id = %s RETURNING id;", (answer_alternative_id,))
                 deleted_answer_id = cursor.fetchone()
+                if deleted_answer_id:
+                    notify_change(cursor, "answer_alternatives", deleted_answer_id["id"])
                 con.commit()
     return deleted_answer_id
 
@@ -495,6 +1381,8 @@ def delete_session(con, session_id):
                 cursor.execute(
                     "DELETE FROM sessions WHERE id = %s RETURNING id;", (session_id,))
                 deleted_session_id = cursor.fetchone()
+                if deleted_session_id:
+                    notify_change(cursor, "sessions", deleted_session_id["id"], deleted_session_id["id"])
                 con.commit()
     return deleted_session_id
 
@@ -502,8 +1390,10 @@ def delete_session_player(con, session_player_id):
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
-                "DELETE FROM session_players WHERE id = %s RETURNING id;", (session_player_id,))
+                "DELETE FROM session_players WHERE id = %s RETURNING id, session_id;", (session_player_id,))
             deleted_player_id = cursor.fetchone()
+            if deleted_player_id:
+                notify_change(cursor, "session_players", deleted_player_id["id"], deleted_player_id["session_id"])
             con.commit()
     return deleted_player_id
 
@@ -512,8 +1402,10 @@ def delete_player_answer(con, player_answer_id):
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
-                "DELETE FROM player_answers WHERE id = %s RETURNING id;", (player_answer_id,))
+                "DELETE FROM player_answers WHERE id = %s RETURNING id, session_id;", (player_answer_id,))
             deleted_answer_id = cursor.fetchone()
+            if deleted_answer_id:
+                notify_change(cursor, "player_answers", deleted_answer_id["id"], deleted_answer_id["session_id"])
             con.commit()
     return deleted_answer_id
 
@@ -522,8 +1414,10 @@ def delete_session_scoreboard(con, session_scoreboard_id):
     with con:
         with con.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
-                "DELETE FROM session_scoreboards WHERE id = %s RETURNING id;", (session_scoreboard_id,))
+                "DELETE FROM session_scoreboards WHERE id = %s RETURNING id, session_id;", (session_scoreboard_id,))
             deleted_scoreboard_id = cursor.fetchone()
+            if deleted_scoreboard_id:
+                notify_change(cursor, "session_scoreboards", deleted_scoreboard_id["id"], deleted_scoreboard_id["session_id"])
             con.commit()
     return deleted_scoreboard_id
 
@@ -1,26 +1,57 @@
 import os
+import time
+from contextvars import ContextVar
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2.extensions import make_dsn
 
 load_dotenv(override=True)
 
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 PASSWORD = os.getenv("PASSWORD")
 
+# The primary takes every write, DATABASE_PRIMARY_DSN overrides the local default.
+# DATABASE_REPLICA_DSNS is a comma separated list of read replicas for the read-only endpoints, see replicas.py
+PRIMARY_DSN = os.getenv("DATABASE_PRIMARY_DSN") or make_dsn(
+    dbname=DATABASE_NAME,
+    user="thomasdeming",  # change if needed
+    password=PASSWORD,
+    host="localhost",  # change if needed
+    port="5432",  # change if needed
+)
+REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("DATABASE_REPLICA_DSNS", "").split(",") if dsn.strip()]
+# SESSION_SHARD_DSNS is a comma separated list of databases for the live session tables, see shards.py
+SESSION_SHARD_DSNS = [dsn.strip() for dsn in os.getenv("SESSION_SHARD_DSNS", "").split(",") if dsn.strip()]
+
+# statement_timeout in ms for the connections opened in the current context (0 disables it).
+# The admission middleware sets it per request priority (see admission.py), otherwise STATEMENT_TIMEOUT_MS is used
+statement_timeout = ContextVar("statement_timeout", default=None)
+
+# Callbacks that get the seconds every connect took, failed ones included (a connect that times out is the longest
+# wait of all), the admission control uses it as the database wait time
+connect_observers = []
+
+
+def connect(dsn: str):
+    """Opens a connection to dsn with the statement_timeout of the current context, raises psycopg2.Error"""
+    timeout = statement_timeout.get()
+    if timeout is None:
+        timeout = int(os.getenv("STATEMENT_TIMEOUT_MS", "0"))
+    started = time.perf_counter()
+    try:
+        return psycopg2.connect(dsn, options=f"-c statement_timeout={timeout}")
+    finally:
+        for observer in connect_observers:
+            observer(time.perf_counter() - started)
+
 
 def get_connection():
     """
-    Function that returns a single connection.
+    Function that returns a single connection to the primary.
     """
     try:
-        conn = psycopg2.connect(
-            dbname=DATABASE_NAME,
-            user="thomasdeming",  # change if needed
-            password=PASSWORD,
-            host="localhost",  # change if needed
-            port="5432",  # change if needed
-        )
+        conn = connect(PRIMARY_DSN)
         print("Successful connection")
         return conn
     except psycopg2.Error as e:
@@ -89,11 +120,11 @@ def create_tables():
     """
     CREATE TABLE IF NOT EXISTS quiz_hashtags (
         quiz_id INT NOT NULL REFERENCES quizzes(id),
-        hashtag_id NOT NULL REFERENCES hashtags(id),
+        hashtag_id INT NOT NULL REFERENCES hashtags(id),
         PRIMARY KEY (quiz_id, hashtag_id)
         )
     """,
-    """ CREATE TABLE question_types (
+    """ CREATE TABLE IF NOT EXISTS question_types (
             id SERIAL PRIMARY KEY,
             question_type VARCHAR(255) UNIQUE NOT NULL
             )
@@ -194,7 +225,7 @@ def create_tables():
     """
     CREATE TABLE IF NOT EXISTS course_hashtags (
         course_id INT NOT NULL REFERENCES courses(id),
-        hashtag_id NOT NULL REFERENCES hashtags(id),
+        hashtag_id INT NOT NULL REFERENCES hashtags(id),
         PRIMARY KEY (course_id, hashtag_id)
         )
     """,
@@ -203,7 +234,7 @@ def create_tables():
         id SERIAL PRIMARY KEY,
         creator_id INT NOT NULL REFERENCES creators(id),
         name VARCHAR(255) UNIQUE NOT NULL,
-        description TEXT,
+        description TEXT
         )
     """,
     """
@@ -215,7 +246,7 @@ def create_tables():
     """,
     """
     CREATE TABLE IF NOT EXISTS channel_courses (
-        channel_id INT NOT NULL REFERENCES channel(id),
+        channel_id INT NOT NULL REFERENCES channels(id),
         course_id INT NOT NULL REFERENCES courses(id),
         PRIMARY KEY (channel_id, course_id)
         )
@@ -227,6 +258,458 @@ def create_tables():
         description TEXT NOT NULL, 
         profile_picture INT REFERENCES images
         )
+    """,
+    # --- Full-text search on quizzes ---
+    # search_vector is kept up to date by triggers, title weighs the most, then hashtags, then the description
+    """
+    ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    """,
+    """
+    CREATE OR REPLACE FUNCTION quiz_search_vector(p_quiz_id INT, p_title TEXT, p_description TEXT)
+    RETURNS TSVECTOR AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(p_title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce((
+                SELECT string_agg(h.hashtag_name, ' ')
+                FROM quiz_hashtags qh JOIN hashtags h ON h.id = qh.hashtag_id
+                WHERE qh.quiz_id = p_quiz_id), '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(p_description, '')), 'C')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION quizzes_search_vector_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.search_vector := quiz_search_vector(NEW.id, NEW.quiz_title, NEW.quiz_description);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER quizzes_search_vector
+    BEFORE INSERT OR UPDATE OF quiz_title, quiz_description ON quizzes
+    FOR EACH ROW EXECUTE FUNCTION quizzes_search_vector_trigger()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION quiz_hashtags_search_vector_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE quizzes SET search_vector = quiz_search_vector(id, quiz_title, quiz_description)
+        WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.quiz_id ELSE NEW.quiz_id END;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER quiz_hashtags_search_vector
+    AFTER INSERT OR DELETE ON quiz_hashtags
+    FOR EACH ROW EXECUTE FUNCTION quiz_hashtags_search_vector_trigger()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION hashtags_search_vector_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE quizzes SET search_vector = quiz_search_vector(id, quiz_title, quiz_description)
+        WHERE id IN (SELECT quiz_id FROM quiz_hashtags WHERE hashtag_id = NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER hashtags_search_vector
+    AFTER UPDATE OF hashtag_name ON hashtags
+    FOR EACH ROW EXECUTE FUNCTION hashtags_search_vector_trigger()
+    """,
+    """
+    UPDATE quizzes SET search_vector = quiz_search_vector(id, quiz_title, quiz_description)
+    WHERE search_vector IS NULL
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS quizzes_search_vector_idx ON quizzes USING GIN (search_vector)
+    """,
+    # --- Hashtag counters ---
+    # quiz_count and course_count are kept up to date by triggers on the link tables.
+    # trending_score is the log of a time decayed play count: every session started on a quiz adds
+    # exp(days since 2024-01-01) to each of its hashtags, stored as a log so it never overflows.
+    # Scores from different times are comparable without having to decay the other rows.
+    """
+    ALTER TABLE hashtags
+        ADD COLUMN IF NOT EXISTS quiz_count INT NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS course_count INT NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS play_count INT NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS trending_score DOUBLE PRECISION
+    """,
+    """
+    CREATE OR REPLACE FUNCTION hashtag_link_count_trigger() RETURNS TRIGGER AS $$
+    DECLARE
+        delta INT := CASE WHEN TG_OP = 'DELETE' THEN -1 ELSE 1 END;
+        tag_id INT := CASE WHEN TG_OP = 'DELETE' THEN OLD.hashtag_id ELSE NEW.hashtag_id END;
+    BEGIN
+        IF TG_TABLE_NAME = 'quiz_hashtags' THEN
+            UPDATE hashtags SET quiz_count = quiz_count + delta WHERE id = tag_id;
+        ELSE
+            UPDATE hashtags SET course_count = course_count + delta WHERE id = tag_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER quiz_hashtags_count
+    AFTER INSERT OR DELETE ON quiz_hashtags
+    FOR EACH ROW EXECUTE FUNCTION hashtag_link_count_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER course_hashtags_count
+    AFTER INSERT OR DELETE ON course_hashtags
+    FOR EACH ROW EXECUTE FUNCTION hashtag_link_count_trigger()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION hashtag_trending_trigger() RETURNS TRIGGER AS $$
+    DECLARE
+        play DOUBLE PRECISION := extract(epoch FROM now() - TIMESTAMP '2024-01-01') / 86400;
+    BEGIN
+        UPDATE hashtags SET
+            play_count = play_count + 1,
+            trending_score = CASE WHEN trending_score IS NULL THEN play
+                ELSE greatest(trending_score, play) + ln(1 + exp(-abs(trending_score - play))) END
+        WHERE id IN (SELECT hashtag_id FROM quiz_hashtags WHERE quiz_id = NEW.active_quiz);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER sessions_hashtag_trending
+    AFTER INSERT ON sessions
+    FOR EACH ROW WHEN (NEW.active_quiz IS NOT NULL) EXECUTE FUNCTION hashtag_trending_trigger()
+    """,
+    """
+    UPDATE hashtags h SET
+        quiz_count = (SELECT count(*) FROM quiz_hashtags WHERE hashtag_id = h.id),
+        course_count = (SELECT count(*) FROM course_hashtags WHERE hashtag_id = h.id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS hashtags_name_prefix_idx ON hashtags (lower(hashtag_name) text_pattern_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS hashtags_trending_idx ON hashtags (trending_score DESC NULLS LAST)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS quiz_hashtags_hashtag_idx ON quiz_hashtags (hashtag_id, quiz_id)
+    """,
+    # --- Question stats ---
+    # Rollup of player_answers per question, kept up to date by a trigger.
+    # The response time buckets must match the layout in question_stats.py
+    """
+    CREATE TABLE IF NOT EXISTS question_stats (
+        question_id INT PRIMARY KEY REFERENCES questions(id) ON DELETE CASCADE,
+        answer_count INT NOT NULL DEFAULT 0,
+        correct_count INT NOT NULL DEFAULT 0,
+        response_time_sum BIGINT NOT NULL DEFAULT 0,
+        response_time_buckets INT[] NOT NULL DEFAULT array_fill(0, ARRAY[40])
+        )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION question_stats_apply(p_question_id INT, p_response_time INT, p_is_correct BOOLEAN, p_sign INT)
+    RETURNS VOID AS $$
+    DECLARE
+        bucket INT := CASE WHEN p_response_time < 100 THEN 1
+            ELSE least(floor(ln(p_response_time / 100.0) / ln(1.25))::INT + 2, 40) END;
+    BEGIN
+        INSERT INTO question_stats (question_id) VALUES (p_question_id) ON CONFLICT (question_id) DO NOTHING;
+        UPDATE question_stats SET
+            answer_count = answer_count + p_sign,
+            correct_count = correct_count + CASE WHEN p_is_correct THEN p_sign ELSE 0 END,
+            response_time_sum = response_time_sum + p_sign * p_response_time,
+            response_time_buckets[bucket] = response_time_buckets[bucket] + p_sign
+        WHERE question_id = p_question_id;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION player_answers_question_stats_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM question_stats_apply(OLD.question_id, OLD.response_time, OLD.is_correct, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM question_stats_apply(NEW.question_id, NEW.response_time, NEW.is_correct, 1);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER player_answers_question_stats
+    AFTER INSERT OR UPDATE OF question_id, response_time, is_correct OR DELETE ON player_answers
+    FOR EACH ROW EXECUTE FUNCTION player_answers_question_stats_trigger()
+    """,
+    """
+    DO $$
+    BEGIN
+        -- Backfill once, from then on the trigger keeps the rollup up to date
+        IF NOT EXISTS (SELECT 1 FROM question_stats) THEN
+            PERFORM question_stats_apply(question_id, response_time, is_correct, 1) FROM player_answers;
+        END IF;
+    END
+    $$
+    """,
+    # --- Creator stats ---
+    # Per quiz and per creator counters, added to when a session ends (ended_at goes from NULL to a time)
+    """
+    CREATE TABLE IF NOT EXISTS creator_quiz_stats (
+        quiz_id INT PRIMARY KEY REFERENCES quizzes(id) ON DELETE CASCADE,
+        creator_id INT NOT NULL REFERENCES creators(id),
+        plays INT NOT NULL DEFAULT 0,
+        total_players INT NOT NULL DEFAULT 0,
+        score_sum BIGINT NOT NULL DEFAULT 0,
+        last_played_at TIMESTAMP
+        )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS creator_stats (
+        creator_id INT PRIMARY KEY REFERENCES creators(id) ON DELETE CASCADE,
+        plays INT NOT NULL DEFAULT 0,
+        total_players INT NOT NULL DEFAULT 0,
+        score_sum BIGINT NOT NULL DEFAULT 0,
+        last_played_at TIMESTAMP
+        )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION sessions_creator_stats_trigger() RETURNS TRIGGER AS $$
+    DECLARE
+        v_creator_id INT;
+        v_players INT;
+        v_score_sum BIGINT;
+    BEGIN
+        SELECT quiz_creator_id INTO v_creator_id FROM quizzes WHERE id = NEW.active_quiz;
+        IF v_creator_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+        SELECT count(*), coalesce(sum(player_points), 0) INTO v_players, v_score_sum
+        FROM session_players WHERE session_id = NEW.id;
+
+        INSERT INTO creator_quiz_stats (quiz_id, creator_id, plays, total_players, score_sum, last_played_at)
+        VALUES (NEW.active_quiz, v_creator_id, 1, v_players, v_score_sum, NEW.ended_at)
+        ON CONFLICT (quiz_id) DO UPDATE SET
+            plays = creator_quiz_stats.plays + 1,
+            total_players = creator_quiz_stats.total_players + EXCLUDED.total_players,
+            score_sum = creator_quiz_stats.score_sum + EXCLUDED.score_sum,
+            last_played_at = greatest(creator_quiz_stats.last_played_at, EXCLUDED.last_played_at);
+
+        INSERT INTO creator_stats (creator_id, plays, total_players, score_sum, last_played_at)
+        VALUES (v_creator_id, 1, v_players, v_score_sum, NEW.ended_at)
+        ON CONFLICT (creator_id) DO UPDATE SET
+            plays = creator_stats.plays + 1,
+            total_players = creator_stats.total_players + EXCLUDED.total_players,
+            score_sum = creator_stats.score_sum + EXCLUDED.score_sum,
+            last_played_at = greatest(creator_stats.last_played_at, EXCLUDED.last_played_at);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER sessions_creator_stats
+    AFTER UPDATE OF ended_at ON sessions
+    FOR EACH ROW WHEN (OLD.ended_at IS NULL AND NEW.ended_at IS NOT NULL AND NEW.active_quiz IS NOT NULL)
+    EXECUTE FUNCTION sessions_creator_stats_trigger()
+    """,
+    """
+    DO $$
+    BEGIN
+        -- Backfill once from the sessions that have already ended
+        IF NOT EXISTS (SELECT 1 FROM creator_quiz_stats) THEN
+            INSERT INTO creator_quiz_stats (quiz_id, creator_id, plays, total_players, score_sum, last_played_at)
+            SELECT q.id, q.quiz_creator_id, count(DISTINCT s.id), count(p.id), coalesce(sum(p.player_points), 0), max(s.ended_at)
+            FROM sessions s
+            JOIN quizzes q ON q.id = s.active_quiz
+            LEFT JOIN session_players p ON p.session_id = s.id
+            WHERE s.ended_at IS NOT NULL
+            GROUP BY q.id, q.quiz_creator_id;
+
+            INSERT INTO creator_stats (creator_id, plays, total_players, score_sum, last_played_at)
+            SELECT creator_id, sum(plays), sum(total_players), sum(score_sum), max(last_played_at)
+            FROM creator_quiz_stats
+            GROUP BY creator_id
+            ON CONFLICT (creator_id) DO NOTHING;
+        END IF;
+    END
+    $$
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS session_players_session_idx ON session_players (session_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS sessions_active_quiz_ended_idx ON sessions (active_quiz, ended_at DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS quizzes_creator_idx ON quizzes (quiz_creator_id)
+    """,
+    # --- Quiz snapshots ---
+    # A published, never changing copy of a quiz with its questions and alternatives, already serialized to JSON.
+    # Sessions pin the snapshot they play, so the creator can keep editing the live quiz
+    """
+    CREATE TABLE IF NOT EXISTS quiz_snapshots (
+        id SERIAL PRIMARY KEY,
+        quiz_id INT NOT NULL REFERENCES quizzes(id),
+        version INT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (quiz_id, version)
+        )
+    """,
+    """
+    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS snapshot_id INT
+    """,
+    """
+    DO $$
+    BEGIN
+        -- Not inline in ADD COLUMN IF NOT EXISTS: before PostgreSQL 13 its REFERENCES was added again on every run
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'sessions_snapshot_id_fkey') THEN
+            ALTER TABLE sessions ADD CONSTRAINT sessions_snapshot_id_fkey FOREIGN KEY (snapshot_id) REFERENCES quiz_snapshots(id);
+        END IF;
+    END
+    $$
+    """,
+    # --- updated_at on quiz content ---
+    # updated_at is set by the database on every write, and a change to a question or an answer alternative
+    # also touches its question and quiz, so quizzes.updated_at is the version of the whole quiz document.
+    # It's what the ETag / Last-Modified headers in app.py are built from
+    """
+    ALTER TABLE quizzes ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP
+    """,
+    """
+    UPDATE quizzes SET updated_at = coalesce(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL
+    """,
+    """
+    ALTER TABLE questions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    """,
+    """
+    ALTER TABLE answer_alternatives ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    """,
+    """
+    CREATE OR REPLACE FUNCTION set_updated_at_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER quizzes_updated_at
+    BEFORE INSERT OR UPDATE ON quizzes
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER questions_updated_at
+    BEFORE INSERT OR UPDATE ON questions
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER answer_alternatives_updated_at
+    BEFORE INSERT OR UPDATE ON answer_alternatives
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION touch_parent_updated_at_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        -- Statement level, so a multi-row insert (import, clone) touches each parent once
+        IF TG_TABLE_NAME = 'questions' THEN
+            UPDATE quizzes SET updated_at = clock_timestamp() WHERE id IN (SELECT quiz_id FROM changed_rows);
+        ELSE
+            UPDATE questions SET updated_at = clock_timestamp() WHERE id IN (SELECT question_id FROM changed_rows);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER questions_touch_quiz_insert
+    AFTER INSERT ON questions REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER questions_touch_quiz_update
+    AFTER UPDATE ON questions REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER questions_touch_quiz_delete
+    AFTER DELETE ON questions REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER answer_alternatives_touch_question_insert
+    AFTER INSERT ON answer_alternatives REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER answer_alternatives_touch_question_update
+    AFTER UPDATE ON answer_alternatives REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_updated_at_trigger()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER answer_alternatives_touch_question_delete
+    AFTER DELETE ON answer_alternatives REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_parent_updated_at_trigger()
+    """,
+    # --- Host dashboard ---
+    """
+    CREATE INDEX IF NOT EXISTS player_answers_session_question_idx ON player_answers (session_id, question_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS session_players_session_points_idx ON session_players (session_id, player_points DESC, id)
+    """,
+    # --- Delta sync, bumped by db.notify_change on every write to a session's rows ---
+    """
+    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS change_version BIGINT NOT NULL DEFAULT 0
+    """,
+    # --- Background jobs, see jobs.py ---
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id BIGSERIAL PRIMARY KEY,
+        job_type VARCHAR(100) NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}',
+        status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+        attempts INT NOT NULL DEFAULT 0,
+        max_attempts INT NOT NULL DEFAULT 3,
+        run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+        progress REAL NOT NULL DEFAULT 0,
+        progress_message TEXT,
+        result JSONB,
+        error TEXT,
+        locked_by VARCHAR(255),
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        started_at TIMESTAMPTZ,
+        heartbeat_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ
+        )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS jobs_queued_idx ON jobs (run_after, id) WHERE status = 'queued'
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS jobs_running_heartbeat_idx ON jobs (heartbeat_at) WHERE status = 'running'
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS jobs_type_status_idx ON jobs (job_type, status, created_at DESC)
+    """,
+    # --- Session event logs copied from the log files, see event_log.py ---
+    """
+    CREATE TABLE IF NOT EXISTS session_events (
+        session_id INT NOT NULL,
+        seq INT NOT NULL,
+        event_type VARCHAR(20) NOT NULL,
+        occurred_at TIMESTAMPTZ NOT NULL,
+        player_id INT,
+        question_id INT,
+        points INT,
+        detail JSONB,
+        PRIMARY KEY (session_id, seq)
+        )
+    """,
+    # --- Crash recovery of the running sessions, see recovery.py ---
+    """
+    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS question_started_at TIMESTAMPTZ
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS sessions_active_idx ON sessions (id) WHERE started_at IS NOT NULL AND ended_at IS NULL
     """)
 
     try:
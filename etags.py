@@ -0,0 +1,100 @@
+import threading
+import time
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Response
+
+"""
+Conditional GET support (ETag / Last-Modified) for the quiz content endpoints.
+The version of a row is its updated_at, which the database keeps up to date (see db_setup.py).
+VersionCache keeps the versions in memory so a 304 can be answered without a query, it subscribes to
+the change events from notify.py to drop versions that changed, with a ttl in case events are missed.
+"""
+
+# A change to a child row also changes the version of its parents, see touch_parent_updated_at_trigger
+PARENT_TABLES = {
+    "quizzes": (),
+    "questions": ("quizzes",),
+    "answer_alternatives": ("questions", "quizzes"),
+}
+
+
+class VersionCache:
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, table: str, row_id: int, load):
+        """Returns the updated_at of a row, calling load() on a miss. None (row not found) is never cached"""
+        key = (table, row_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        version = load()
+        if version is not None:
+            with self._lock:
+                self._versions[key] = (version, now + self.ttl)
+        return version
+
+    def invalidate(self, event: dict):
+        """Change event subscriber, drops the changed row and every cached row of its parent tables"""
+        table = event.get("table")
+        if table not in PARENT_TABLES:
+            return
+        with self._lock:
+            self._versions.pop((table, event.get("id")), None)
+            for parent_table in PARENT_TABLES[table]:
+                for key in [key for key in self._versions if key[0] == parent_table]:
+                    del self._versions[key]
+
+
+def _as_utc(value):
+    # updated_at is a TIMESTAMP without time zone, the database runs in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def make_etag(table: str, row_id: int, version, variant: str | None = None) -> str:
+    """variant tells apart the representations of one row version, e.g. the columns of a sparse fieldset"""
+    tag = f"{table}-{row_id}-{int(_as_utc(version).timestamp() * 1_000_000)}"
+    return f'W/"{tag}-{variant}"' if variant else f'W/"{tag}"'
+
+
+def cache_headers(etag: str, version) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": format_datetime(_as_utc(version), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+
+def etag_matches(request, etag: str) -> bool:
+    """Checks If-None-Match against etag, weak comparison"""
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+
+def is_not_modified(request, etag: str, version) -> bool:
+    """Checks If-None-Match (takes precedence) and If-Modified-Since against the current version"""
+    if request.headers.get("if-none-match") is not None:
+        return etag_matches(request, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # Last-Modified only has second precision
+        return _as_utc(version).replace(microsecond=0) <= _as_utc(since)
+    return False
+
+
+def not_modified_response(etag: str, version):
+    return Response(status_code=304, headers=cache_headers(etag, version))
@@ -0,0 +1,349 @@
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2
+
+import db as db
+from db_setup import SESSION_SHARD_DSNS, connect, get_connection
+from shards import ShardRouter
+
+"""
+Append-only event log of every live session: joins, question start and end, answers and score changes,
+so that a session can be replayed (rebuilding its state or auditing a game) after the rows have changed.
+
+Every session has its own file, <directory>/session-<id>.log: the 4 byte MAGIC and then one record per event.
+A record is length-prefixed and checksummed, so a record torn by a crash is detected and ends the log:
+
+    u16 body length | u32 crc32 of the body | body: u8 event type, i64 microseconds since the epoch, fields
+
+The fields of every event type are in EVENT_FORMATS. A record is written with a single write() on a file
+opened with O_APPEND, so the workers can append to the same session's log without locking each other.
+Opening a log cuts off a torn record at its end, otherwise the events appended after it couldn't be read.
+Reading maps the file into memory (read_log), replay() folds the events into a SessionState.
+
+The app writes the logs when SESSION_EVENT_LOG_DIR is set. To copy them into the session_events table:
+    python event_log.py load [session_id ...]
+and to print the replayed state of a session:
+    python event_log.py replay <session_id>
+"""
+
+MAGIC = b"KSL1"
+RECORD_HEADER = struct.Struct("<HI")
+EVENT_HEADER = struct.Struct("<Bq")
+
+SESSION_START, SESSION_END, JOIN, QUESTION_START, QUESTION_END, ANSWER, SCORE = range(1, 8)
+
+# type -> (name, struct of the fixed fields, field names). JOIN is followed by the display name in utf-8
+EVENT_FORMATS = {
+    SESSION_START: ("session_start", struct.Struct("<ii"), ("quiz_id", "session_code")),
+    SESSION_END: ("session_end", struct.Struct("<"), ()),
+    JOIN: ("join", struct.Struct("<i"), ("player_id", "display_name")),
+    QUESTION_START: ("question_start", struct.Struct("<i"), ("question_id",)),
+    QUESTION_END: ("question_end", struct.Struct("<i"), ("question_id",)),
+    ANSWER: ("answer", struct.Struct("<iiiiii?"),
+             ("id", "player_id", "question_id", "answer_id", "response_time", "points_earned", "is_correct")),
+    SCORE: ("score", struct.Struct("<ii"), ("player_id", "points")),
+}
+
+# at is in microseconds since the epoch, data holds the fields of EVENT_FORMATS in order
+Event = namedtuple("Event", ("type", "at", "data"))
+
+LOG_NAME = re.compile(r"^session-(\d+)\.log$")
+
+
+def encode_event(event_type: int, *fields, at: int | None = None) -> bytes:
+    """Encodes one record, at defaults to now"""
+    fixed = EVENT_FORMATS[event_type][1]
+    if event_type == JOIN:
+        body = fixed.pack(fields[0]) + fields[1].encode()
+    else:
+        body = fixed.pack(*fields)
+    body = EVENT_HEADER.pack(event_type, time.time_ns() // 1000 if at is None else at) + body
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def _records(buffer, offset: int):
+    """
+    Yields (event type, body, end offset) of the records from offset on, and stops at the end of the buffer
+    or at the first record that is incomplete or corrupted (a write torn by a crash)
+    """
+    end = len(buffer)
+    while offset + RECORD_HEADER.size <= end:
+        length, checksum = RECORD_HEADER.unpack_from(buffer, offset)
+        start = offset + RECORD_HEADER.size
+        if length < EVENT_HEADER.size or start + length > end:
+            return
+        body = buffer[start:start + length]
+        if zlib.crc32(body) != checksum:
+            return
+        event_type = body[0]
+        if event_type not in EVENT_FORMATS or length < EVENT_HEADER.size + EVENT_FORMATS[event_type][1].size:
+            return
+        offset = start + length
+        yield event_type, body, offset
+
+
+def decode_events(buffer, offset: int = len(MAGIC)):
+    """Yields the events of a log from offset on, up to the end of the buffer or the first torn record"""
+    for event_type, body, _ in _records(buffer, offset):
+        at = EVENT_HEADER.unpack_from(body)[1]
+        fixed = EVENT_FORMATS[event_type][1]
+        data = fixed.unpack_from(body, EVENT_HEADER.size)
+        if event_type == JOIN:
+            data = (*data, bytes(body[EVENT_HEADER.size + fixed.size:]).decode(errors="replace"))
+        yield Event(event_type, at, data)
+
+
+def valid_length(buffer) -> int:
+    """The length of a log up to the end of its last complete record"""
+    end = len(MAGIC)
+    for _, _, end in _records(buffer, end):
+        pass
+    return end
+
+
+def read_log(path) -> list:
+    """Reads every event of a log file through a memory map, a missing or empty log has no events"""
+    try:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size <= len(MAGIC):
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{path} is not a session event log")
+                # memoryview slices don't copy, only the fields that are unpacked are
+                view = memoryview(mapped)
+                try:
+                    return list(decode_events(view))
+                finally:
+                    view.release()
+    except FileNotFoundError:
+        return []
+
+
+class SessionState:
+    """The state of a session after its events, see replay()"""
+    __slots__ = ("session_id", "quiz_id", "session_code", "started_at", "ended_at", "players",
+                 "current_question_id", "question_started_at", "answers", "answered", "events")
+
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.quiz_id = None
+        self.session_code = None
+        self.started_at = None
+        self.ended_at = None
+        self.players = {}  # player_id -> [display_name, points]
+        self.current_question_id = None
+        self.question_started_at = None
+        self.answers = 0
+        self.answered = set()  # players that answered the current question
+        self.events = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "quiz_id": self.quiz_id,
+            "session_code": self.session_code,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "current_question_id": self.current_question_id,
+            "question_started_at": self.question_started_at,
+            "answers": self.answers,
+            "answered": len(self.answered),
+            "events": self.events,
+            "players": [
+                {"id": player_id, "display_name": name, "points": points}
+                for player_id, (name, points) in sorted(self.players.items(), key=lambda item: -item[1][1])
+            ],
+        }
+
+
+def replay(session_id: int, events) -> SessionState:
+    """Folds the events of a session into its state"""
+    state = SessionState(session_id)
+    for event_type, at, data in events:
+        state.events += 1
+        if event_type == SESSION_START:
+            state.quiz_id = data[0] or None
+            state.session_code = data[1]
+            state.started_at = at
+        elif event_type == SESSION_END:
+            state.ended_at = at
+            state.current_question_id = None
+        elif event_type == JOIN:
+            state.players.setdefault(data[0], [data[1], 0])[0] = data[1]
+        elif event_type == QUESTION_START:
+            state.current_question_id = data[0]
+            state.question_started_at = at
+            state.answered = set()
+        elif event_type == QUESTION_END:
+            if state.current_question_id == data[0]:
+                state.current_question_id = None
+        elif event_type == ANSWER:
+            state.answers += 1
+            if data[2] == state.current_question_id:
+                state.answered.add(data[1])
+        elif event_type == SCORE:
+            state.players.setdefault(data[0], [None, 0])[1] += data[1]
+    return state
+
+
+class SessionEventLog:
+    """
+    Appends the events of the live sessions to their log files. A log without a directory is disabled and
+    ignores the events. Keeps up to max_open_files files open, the least recently written one is closed first
+    """
+
+    def __init__(self, directory: str | None, max_open_files: int = 256, sync: bool = False):
+        self.directory = Path(directory) if directory else None
+        self.max_open_files = max_open_files
+        self.sync = sync
+        self.events_written = 0
+        self._files = OrderedDict()  # session_id -> fd
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def path(self, session_id: int) -> Path:
+        return self.directory / f"session-{session_id}.log"
+
+    def append(self, session_id: int, event_type: int, *fields):
+        """Appends one event to the session's log, call it once the change is committed"""
+        if self.directory is None:
+            return
+        record = encode_event(event_type, *fields)
+        with self._lock:
+            fd = self._open(session_id)
+            os.write(fd, record)
+            if self.sync:
+                os.fsync(fd)
+            self.events_written += 1
+            if event_type == SESSION_END:
+                os.close(self._files.pop(session_id))
+
+    def _open(self, session_id: int) -> int:
+        fd = self._files.get(session_id)
+        if fd is not None:
+            self._files.move_to_end(session_id)
+            return fd
+        path = self.path(session_id)
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            self._repair(fd, path)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._files[session_id] = fd
+        if len(self._files) > self.max_open_files:
+            os.close(self._files.popitem(last=False)[1])
+        return fd
+
+    @staticmethod
+    def _repair(fd: int, path: Path):
+        """
+        Writes the magic of a new log, and cuts an existing one after its last complete record so that the
+        events appended from here on follow it. The other workers opening the log wait on the file lock
+        """
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(fd).st_size
+            if size < len(MAGIC):  # new, or its creator crashed before the magic was written
+                os.ftruncate(fd, 0)
+                os.write(fd, MAGIC)
+                return
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{path} is not a session event log")
+                view = memoryview(mapped)
+                try:
+                    end = valid_length(view)
+                finally:
+                    view.release()
+            if end < size:
+                os.ftruncate(fd, end)
+                print(f"Cut a torn record of {size - end} bytes off the end of {path}")
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def read(self, session_id: int) -> list:
+        return read_log(self.path(session_id)) if self.directory is not None else []
+
+    def close(self):
+        with self._lock:
+            for fd in self._files.values():
+                os.close(fd)
+            self._files.clear()
+
+
+def event_rows(session_id: int, events, after_seq: int = 0):
+    """The session_events rows of a session's events, numbered from 1 in log order, from after_seq on"""
+    for seq, (event_type, at, data) in enumerate(events, start=1):
+        if seq <= after_seq:
+            continue
+        fields = dict(zip(EVENT_FORMATS[event_type][2], data))
+        yield (
+            session_id, seq, EVENT_FORMATS[event_type][0], datetime.fromtimestamp(at / 1_000_000, timezone.utc).isoformat(),
+            fields.pop("player_id", None), fields.pop("question_id", None),
+            fields.pop("points_earned", fields.pop("points", None)),
+            json.dumps(fields) if fields else None,
+        )
+
+
+def load_logs(directory: str, session_ids: list | None = None):
+    """Copies the events of the session logs that aren't in the session_events table yet, returns the number copied"""
+    shards = ShardRouter(connect, get_connection, SESSION_SHARD_DSNS)
+    paths = sorted(Path(directory).glob("session-*.log"))
+    copied = 0
+    for path in paths:
+        session_id = int(LOG_NAME.match(path.name).group(1))
+        if session_ids and session_id not in session_ids:
+            continue
+        con = shards.for_session(session_id)
+        try:
+            count = db.copy_session_events(
+                con, session_id, lambda after_seq: event_rows(session_id, read_log(path), after_seq)
+            )
+        finally:
+            con.close()
+        copied += count
+        print(f"{path}: {count} new events")
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay session event logs or copy them into the database")
+    parser.add_argument("command", choices=("load", "replay"))
+    parser.add_argument("session_ids", nargs="*", type=int)
+    parser.add_argument("--directory", default=os.getenv("SESSION_EVENT_LOG_DIR", "session_logs"))
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        if len(args.session_ids) != 1:
+            raise SystemExit("replay takes one session id")
+        session_id = args.session_ids[0]
+        started = time.perf_counter()
+        events = read_log(Path(args.directory) / f"session-{session_id}.log")
+        state = replay(session_id, events)
+        print(json.dumps(state.as_dict(), indent=2))
+        print(f"Replayed {len(events)} events in {(time.perf_counter() - started) * 1000:.2f} ms")
+    else:
+        try:
+            copied = load_logs(args.directory, args.session_ids)
+        except psycopg2.Error as e:
+            raise SystemExit(f"Loading the logs failed: {e}")
+        print(f"Copied {copied} events")
@@ -0,0 +1,54 @@
+import argparse
+import json
+from pathlib import Path
+
+import psycopg2
+from pydantic import ValidationError
+
+import db as db
+import schemas as sc
+from db_setup import get_connection
+
+"""
+Bulk loads quiz bundles (the same format as POST /quizzes/import) from directories of .json files.
+Every bundle is imported in its own transaction on one shared connection, so a broken file only skips that file.
+
+Usage: python import_bundles.py bundles/ more_bundles/ [--recursive]
+"""
+
+
+def find_bundle_files(directories, recursive: bool):
+    pattern = "**/*.json" if recursive else "*.json"
+    for directory in directories:
+        yield from sorted(Path(directory).glob(pattern))
+
+
+def import_directories(directories, recursive: bool = False):
+    """Imports every bundle file found and returns the number of imported and failed files"""
+    con = get_connection()
+    imported, failed = 0, 0
+    try:
+        for path in find_bundle_files(directories, recursive):
+            try:
+                bundle = sc.QuizBundle.model_validate(json.loads(path.read_text(encoding="utf-8")))
+                quiz_id = db.add_quiz_bundle(con, bundle.model_dump())
+            except (ValueError, ValidationError, psycopg2.Error) as e:
+                con.rollback()
+                failed += 1
+                print(f"{path}: failed, {e}")
+                continue
+            imported += 1
+            print(f"{path}: imported as quiz {quiz_id}")
+    finally:
+        con.close()
+    return imported, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import quiz bundles from directories of .json files")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--recursive", action="store_true", help="also look in subdirectories")
+    args = parser.parse_args()
+
+    imported, failed = import_directories(args.directories, recursive=args.recursive)
+    print(f"Imported {imported} bundles, {failed} failed")
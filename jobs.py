@@ -0,0 +1,251 @@
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+
+import psycopg2
+from pydantic import ValidationError
+
+import db as db
+import schemas as sc
+from db_setup import get_connection
+
+"""
+Background jobs for the operations that are too slow to run inside a request (exports, bulk imports, ...).
+Jobs are rows in the jobs table (see db_setup.py). POST /jobs adds one, and a JobRunner claims them with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of runners (in the api workers or as separate processes)
+can share the queue. A job that raises is retried with exponential backoff until max_attempts, a job whose
+worker stopped sending heartbeats is put back in the queue. Every runner renews the heartbeats of the jobs it
+is running from a separate thread, so a long job doesn't have to call ctx.progress() to keep its claim.
+
+A job type is a function registered with @job, it gets a JobContext and returns a JSON-serializable result:
+
+    @job("export_quiz", concurrency=4)
+    def export_quiz(ctx):
+        ...
+
+concurrency is the number of jobs of that type one runner process runs at the same time.
+
+Run a separate runner with: python jobs.py [--workers 4]
+or set JOB_WORKERS to run one inside every api worker.
+"""
+
+
+class JobType:
+    __slots__ = ("name", "handler", "concurrency")
+
+    def __init__(self, name: str, handler, concurrency: int):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+
+
+JOB_TYPES = {}
+
+
+def job(name: str, concurrency: int = 1):
+    """Registers a job type"""
+    def register(handler):
+        JOB_TYPES[name] = JobType(name, handler, concurrency)
+        return handler
+    return register
+
+
+class JobFailed(Exception):
+    """Fails a job without retrying it, for errors that another attempt won't fix"""
+
+
+class JobContext:
+    def __init__(self, con, job: dict):
+        self.con = con
+        self.job_id = job["id"]
+        self.payload = job["payload"]
+        self.attempt = job["attempts"]
+
+    def progress(self, fraction: float, message: str | None = None):
+        """Records the progress of the job (0 to 1), it also tells the runners that the job is still alive"""
+        db.update_job_progress(self.con, self.job_id, min(max(fraction, 0.0), 1.0), message)
+
+
+# --- Job types ---
+
+@job("export_quiz", concurrency=4)
+def export_quiz(ctx: JobContext):
+    """Exports a quiz bundle, payload: {"quiz_id": 1}"""
+    bundle = db.get_quiz_bundle(ctx.con, quiz_id=ctx.payload.get("quiz_id"))
+    if not bundle:
+        raise JobFailed("Quiz not found")
+    return bundle
+
+
+@job("import_quizzes", concurrency=1)
+def import_quizzes(ctx: JobContext):
+    """
+    Imports quiz bundles, payload: {"bundles": [bundle, ...]}. Every bundle is imported in its own transaction,
+    so a broken bundle only skips that bundle. Returns the new quiz IDs and the errors by bundle index
+    """
+    bundles = ctx.payload.get("bundles") or []
+    quiz_ids, errors = [], {}
+    for index, raw_bundle in enumerate(bundles):
+        try:
+            bundle = sc.QuizBundle.model_validate(raw_bundle)
+            quiz_ids.append(db.add_quiz_bundle(ctx.con, bundle.model_dump()))
+        except (ValueError, ValidationError, psycopg2.Error) as e:
+            ctx.con.rollback()
+            errors[index] = str(e)
+        ctx.progress((index + 1) / len(bundles), f"{index + 1}/{len(bundles)} bundles")
+    return {"quiz_ids": quiz_ids, "errors": errors}
+
+
+# --- Runner ---
+
+class JobRunner:
+    def __init__(self, connection_factory, workers: int = 2, poll_interval: float = 1.0, stale_after: float = 600.0,
+                 retry_delay: float = 5.0, max_retry_delay: float = 600.0, heartbeat_interval: float | None = None):
+        self.connection_factory = connection_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval or stale_after / 4
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs_succeeded = 0
+        self.jobs_failed = 0
+        self._running = {name: 0 for name in JOB_TYPES}
+        self._claimed = {}  # job_id -> worker, the jobs this runner is running
+        self._claim_lock = threading.Lock()
+        self._last_stale_check = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f"{self.name}/{number}",), name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        """Stops claiming new jobs and waits for the running ones to finish"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def wake(self):
+        """Tells idle workers to look for jobs now instead of after poll_interval, e.g. after enqueueing one"""
+        self._wake.set()
+
+    def _run(self, worker: str):
+        backoff = 0.5
+        while not self._stop.is_set():
+            con = None
+            try:
+                con = self.connection_factory()
+                if con is None:  # get_connection prints the error and returns None
+                    raise psycopg2.OperationalError("No connection to the database")
+                backoff = 0.5
+                while not self._stop.is_set():
+                    if not self._work_once(con, worker):
+                        self._wake.wait(self.poll_interval)
+                        self._wake.clear()
+            except psycopg2.Error as e:
+                print(f"Job worker {worker} lost its connection: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if con is not None:
+                    con.close()
+
+    def _heartbeat(self):
+        """Renews the heartbeats of the claimed jobs every heartbeat_interval, on its own connection"""
+        con = None
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._claim_lock:
+                claimed = dict(self._claimed)
+            if not claimed:
+                continue
+            try:
+                if con is None:
+                    con = self.connection_factory()
+                    if con is None:  # get_connection printed why, retried on the next beat
+                        continue
+                db.touch_jobs(con, claimed)
+            except psycopg2.Error as e:
+                print(f"Couldn't renew the heartbeats of {len(claimed)} jobs: {e}")
+                if con is not None:
+                    con.close()
+                con = None
+        if con is not None:
+            con.close()
+
+    def _work_once(self, con, worker: str) -> bool:
+        """Claims and runs one job, returns False if there was nothing to do"""
+        with self._claim_lock:
+            if time.monotonic() - self._last_stale_check > self.stale_after / 2:
+                self._last_stale_check = time.monotonic()
+                requeued = db.requeue_stale_jobs(con, self.stale_after)
+                if requeued:
+                    print(f"Requeued {requeued} jobs of stopped workers")
+            # Per-type limits, the claim runs under the lock so two workers can't both take the last slot
+            job_types = [name for name, job_type in JOB_TYPES.items() if self._running.get(name, 0) < job_type.concurrency]
+            claimed = db.claim_job(con, job_types, worker) if job_types else None
+            if claimed is None:
+                return False
+            self._running[claimed["job_type"]] = self._running.get(claimed["job_type"], 0) + 1
+            self._claimed[claimed["id"]] = worker
+
+        try:
+            self._execute(con, claimed)
+        finally:
+            with self._claim_lock:
+                self._running[claimed["job_type"]] -= 1
+                del self._claimed[claimed["id"]]
+        return True
+
+    def _execute(self, con, claimed: dict):
+        job_type = JOB_TYPES.get(claimed["job_type"])
+        try:
+            if job_type is None:
+                raise JobFailed(f"Unknown job type {claimed['job_type']}")
+            result = job_type.handler(JobContext(con, claimed))
+        except psycopg2.InterfaceError:
+            raise  # the connection is gone, the job is requeued when its heartbeat goes stale
+        except Exception as e:
+            con.rollback()
+            retry = not isinstance(e, JobFailed) and claimed["attempts"] < claimed["max_attempts"]
+            delay = min(self.retry_delay * 2 ** (claimed["attempts"] - 1), self.max_retry_delay) if retry else None
+            db.fail_job(con, claimed["id"], f"{type(e).__name__}: {e}", delay)
+            self.jobs_failed += 1
+            return
+        db.complete_job(con, claimed["id"], result)
+        self.jobs_succeeded += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs from the jobs table")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", "2")) or 2)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between polls when the queue is empty")
+    args = parser.parse_args()
+
+    runner = JobRunner(get_connection, workers=args.workers, poll_interval=args.poll_interval)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    runner.start()
+    print(f"Job runner {runner.name} started with {args.workers} workers")
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    runner.stop()
+    print(f"Job runner stopped, {runner.jobs_succeeded} jobs succeeded, {runner.jobs_failed} failed")
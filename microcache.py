@@ -0,0 +1,48 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+"""
+Sub-second cache with request coalescing, for endpoints that many clients poll at the same time.
+Within ttl seconds every request for a key gets the same result, and when the entry has expired only
+the first request runs the query, the others wait for its result instead of running their own (see singleflight.py).
+So N clients polling the same key cost at most one query per ttl.
+"""
+
+
+class MicroCache:
+    def __init__(self, ttl: float = 0.5, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.flight = SingleFlight()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """Returns the cached value for key, or the result of load() shared with every concurrent request"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+        return self.flight.do(key, lambda: self._load(key, load))
+
+    def _load(self, key, load):
+        value = load()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict_expired()
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry[1] <= now]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, **self.flight.stats()}
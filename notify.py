@@ -0,0 +1,121 @@
+import json
+import select
+import threading
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from db import CHANGES_CHANNEL
+
+"""
+Change notifications between the uvicorn workers, built on postgres LISTEN/NOTIFY.
+The write functions in db.py send a change event with db.notify_change, and every worker runs one
+ChangeListener with a single connection that LISTENs on the channel and hands the events to the
+local subscribers (caches and connected clients).
+
+An event is a dict: {"table": "sessions", "id": 12, "session_id": 12}
+
+Events sent while the listener isn't connected are lost, so the caches that rely on them register on_reconnect
+callbacks, which run every time the listener has (re)started listening, to drop what they may have missed.
+"""
+
+
+class ChangeListener:
+    def __init__(self, connection_factory, channel: str = CHANGES_CHANNEL, poll_timeout: float = 1.0):
+        self.connection_factory = connection_factory
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.events_received = 0
+        self._subscribers = []
+        self._reconnect_callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback, table: str | None = None, session_id: int | None = None):
+        """
+        Registers callback(event) for the events matching table and session_id (None matches everything).
+        Returns a token for unsubscribe. The callback runs on the listener thread, so it should be quick
+        """
+        subscriber = (callback, table, session_id)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def on_reconnect(self, callback):
+        """Registers callback(), called on the listener thread after every LISTEN, the first one included"""
+        with self._lock:
+            self._reconnect_callbacks.append(callback)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def dispatch(self, event: dict):
+        """Hands an event to the matching subscribers, a failing subscriber doesn't stop the others"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, table, session_id in subscribers:
+            if table is not None and event.get("table") != table:
+                continue
+            if session_id is not None and event.get("session_id") != session_id:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Change subscriber failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="change-listener", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            con = None
+            try:
+                con = self.connection_factory()
+                con.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with con.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                backoff = 0.5
+                self._reconnected()
+                self._listen(con)
+            except Exception as e:
+                print(f"Change listener disconnected: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if con is not None and not con.closed:
+                    con.close()
+
+    def _reconnected(self):
+        with self._lock:
+            callbacks = list(self._reconnect_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Reconnect callback failed: {e}")
+
+    def _listen(self, con):
+        while not self._stop.is_set():
+            if select.select([con], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            con.poll()
+            while con.notifies:
+                notification = con.notifies.pop(0)
+                try:
+                    event = json.loads(notification.payload)
+                except ValueError:
+                    continue
+                self.events_received += 1
+                self.dispatch(event)
@@ -0,0 +1,55 @@
+"""
+Per-question difficulty statistics, read from the question_stats rollup in the database.
+The rollup is kept up to date by a trigger on player_answers (see db_setup.py), so the stats never
+have to scan the raw answers. Response times are counted in a histogram with geometric buckets, which
+is what the quantiles are estimated from.
+
+The bucket layout has to match question_stats_apply in db_setup.py:
+bucket 0 is [0, BUCKET_BASE), bucket i is [BUCKET_BASE * BUCKET_GROWTH^(i-1), BUCKET_BASE * BUCKET_GROWTH^i)
+and the last bucket has no upper bound.
+"""
+
+BUCKET_BASE = 100
+BUCKET_GROWTH = 1.25
+BUCKET_COUNT = 40
+
+
+def bucket_bounds(index: int):
+    """Returns the lower and upper bound of a bucket (0-based), the upper bound of the last bucket is None"""
+    lower = 0 if index == 0 else BUCKET_BASE * BUCKET_GROWTH ** (index - 1)
+    upper = None if index == BUCKET_COUNT - 1 else BUCKET_BASE * BUCKET_GROWTH ** index
+    return lower, upper
+
+
+def estimate_quantile(buckets, quantile: float):
+    """Estimates a response time quantile (0-1) from the bucket counts, interpolating inside the bucket"""
+    total = sum(buckets)
+    if total <= 0:
+        return None
+    target = quantile * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count <= 0:
+            continue
+        if seen + count >= target:
+            lower, upper = bucket_bounds(index)
+            if upper is None:
+                return lower
+            return lower + (upper - lower) * (target - seen) / count
+        seen += count
+    return bucket_bounds(len(buckets) - 1)[0]
+
+
+def summarize(row):
+    """Turns a question_stats row into the stats returned by the API"""
+    answer_count = row["answer_count"]
+    buckets = row["response_time_buckets"]
+    return {
+        "question_id": row["question_id"],
+        "answer_count": answer_count,
+        "correct_count": row["correct_count"],
+        "percent_correct": round(100 * row["correct_count"] / answer_count, 1) if answer_count else None,
+        "average_response_time": round(row["response_time_sum"] / answer_count) if answer_count else None,
+        "median_response_time": round(estimate_quantile(buckets, 0.5)) if answer_count else None,
+        "p90_response_time": round(estimate_quantile(buckets, 0.9)) if answer_count else None,
+    }
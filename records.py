@@ -0,0 +1,100 @@
+from psycopg2 import sql
+
+from responses import FastJSONResponse
+
+"""
+Lightweight row records, used instead of RealDictCursor on the hot read paths.
+A record is filled from a plain tuple cursor in column order, so no dict is allocated per row,
+and since the rows come straight from our own database they can be serialized without going
+through pydantic again.
+"""
+
+
+# Record classes made by Record.project, one per table and set of fields. The fields are kept in column order,
+# so there is at most one class per subset of a table's columns, whatever order the clients ask for them in
+_projections = {}
+
+
+class Record:
+    """Base class for the records, every subclass lists its columns in __slots__"""
+    __slots__ = ()
+
+    @classmethod
+    def project(cls, fields=None):
+        """
+        Returns a record class with only the given columns (plus id) in column order, for sparse fieldsets.
+        The fields are validated against the columns of cls, which is the whitelist, raises ValueError otherwise
+        """
+        if not fields:
+            return cls
+        unknown = [field for field in fields if field not in cls.__slots__]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        requested = set(fields)
+        fields = tuple(column for column in cls.__slots__ if column == "id" or column in requested)
+        key = (cls, fields)
+        projected = _projections.get(key)
+        if projected is None:
+            projected = _projections[key] = type(cls.__name__, (Record,), {"__slots__": fields})
+        return projected
+
+    def __init__(self, *values):
+        for column_name, value in zip(self.__slots__, values):
+            setattr(self, column_name, value)
+
+    @classmethod
+    def columns(cls):
+        """Returns the column list for a SELECT, in the same order as __slots__"""
+        return sql.SQL(", ").join(sql.Identifier(column_name) for column_name in cls.__slots__)
+
+    def as_dict(self):
+        return {column_name: getattr(self, column_name) for column_name in self.__slots__}
+
+    def __getitem__(self, column_name):
+        # Lets the endpoints keep using record["id"] like they do with the dict rows
+        return getattr(self, column_name)
+
+    def get(self, column_name, default=None):
+        return getattr(self, column_name, default)
+
+
+class UserRecord(Record):
+    # password is left out on purpose, it should never be sent back to the client
+    __slots__ = ("id", "user_name", "email", "registration_date", "user_status", "birth_date")
+
+class QuizRecord(Record):
+    __slots__ = ("id", "quiz_creator_id", "quiz_title", "quiz_description", "intro_image", "created_at", "updated_at", "is_public")
+
+class QuestionRecord(Record):
+    __slots__ = ("id", "quiz_id", "question_text", "question_order", "time_limit", "points", "question_type", "image")
+
+class AnswerAlternativeRecord(Record):
+    __slots__ = ("id", "question_id", "answer_text", "correct_status", "answer_icon", "answer_order")
+
+class SessionRecord(Record):
+    __slots__ = ("id", "session_name", "host_user_id", "active_quiz", "qr_code_id", "session_status", "started_at", "ended_at", "current_question_id", "session_code", "snapshot_id")
+
+class SessionPlayerRecord(Record):
+    __slots__ = ("id", "session_id", "display_name", "user_id", "joined_at", "player_points")
+
+class PlayerAnswerRecord(Record):
+    __slots__ = ("id", "player_id", "session_id", "question_id", "answer_id", "response_time", "points_earned", "is_correct")
+
+class ScoreboardRecord(Record):
+    __slots__ = ("id", "session_id", "player_id", "total_score", "correct_answers", "rank")
+
+class HashtagRecord(Record):
+    __slots__ = ("id", "hashtag_name", "quiz_count", "course_count", "play_count")
+
+
+def records_response(records, status_code: int = 200):
+    """
+    Serializes one record or a list of records directly to a JSON response.
+    Returning a Response from an endpoint makes fastapi skip jsonable_encoder and response_model validation,
+    so only use this for rows we read from the database ourselves.
+    """
+    if isinstance(records, Record):
+        content = records.as_dict()
+    else:
+        content = [record.as_dict() for record in records]
+    return FastJSONResponse(content=content, status_code=status_code)
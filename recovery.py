@@ -0,0 +1,214 @@
+import threading
+import time
+
+import psycopg2
+
+import db as db
+
+"""
+Recovery of the sessions that were running when a worker (re)started, so that the players reconnecting
+after a crash get the game back where it was instead of a stranded session.
+
+A session is running from started_at until ended_at. LiveSessions.recover() rebuilds the live state of every
+running session (current question, remaining time, player scores and who answered) with four set-based queries
+per database, however many sessions there are:
+
+  1. the running sessions with their current question and how long ago it started   (sessions)
+  2. the players and points of all of them                                           (session_players)
+  3. the players that answered the current question of each                         (player_answers)
+  4. the time limits of the current questions                                        (questions, catalog)
+
+GET /sessions/{session_id}/live serves that state from memory. A change event of a session marks its state
+stale, the next read reloads it with the same queries for that one session. When the change listener reconnects,
+the events it missed are unknown, so reset() marks every session stale.
+recover() measures itself and warns when it takes longer than target_ms.
+"""
+
+
+class LiveSession:
+    __slots__ = ("session_id", "quiz_id", "snapshot_id", "version", "current_question_id", "time_limit",
+                 "question_deadline", "players", "answered")
+
+    def __init__(self, session_id: int, quiz_id, snapshot_id, version: int, current_question_id, time_limit,
+                 question_elapsed):
+        self.session_id = session_id
+        self.quiz_id = quiz_id
+        self.snapshot_id = snapshot_id
+        self.version = version
+        self.current_question_id = current_question_id
+        self.time_limit = time_limit
+        # On the monotonic clock of this worker, from the seconds the database measured
+        self.question_deadline = None
+        if time_limit is not None and question_elapsed is not None:
+            self.question_deadline = time.monotonic() + time_limit - question_elapsed
+        self.players = []  # [(player_id, display_name, points)], best first
+        self.answered = set()  # players that answered the current question
+
+    def remaining_time(self):
+        """Seconds left on the current question, None without a question or a known start"""
+        if self.question_deadline is None:
+            return None
+        return max(self.question_deadline - time.monotonic(), 0.0)
+
+    def as_dict(self) -> dict:
+        remaining = self.remaining_time()
+        return {
+            "session_id": self.session_id,
+            "quiz_id": self.quiz_id,
+            "snapshot_id": self.snapshot_id,
+            "version": self.version,
+            "current_question_id": self.current_question_id,
+            "time_limit": self.time_limit,
+            "remaining_time": None if remaining is None else round(remaining, 3),
+            "question_open": self.current_question_id is not None and (remaining is None or remaining > 0),
+            "answered": len(self.answered),
+            "players": [
+                {"id": player_id, "display_name": name, "points": points, "rank": rank,
+                 "answered": player_id in self.answered}
+                for rank, (player_id, name, points) in enumerate(self.players, start=1)
+            ],
+        }
+
+
+def load_live_sessions(con, catalog_con, session_id: int | None = None) -> dict:
+    """Rebuilds {session_id: LiveSession} of the running sessions on con (all of them or only session_id)"""
+    rows = db.get_active_sessions(con, session_id=session_id)
+    time_limits = db.get_time_limits(catalog_con, {row[3] for row in rows if row[3] is not None})
+    sessions = {
+        row_id: LiveSession(row_id, quiz_id, snapshot_id, version, question_id, time_limits.get(question_id), elapsed)
+        for row_id, quiz_id, snapshot_id, question_id, elapsed, version in rows
+    }
+    for player_session_id, player_id, display_name, points in db.get_active_session_players(con, session_id=session_id):
+        session = sessions.get(player_session_id)
+        if session is not None:
+            session.players.append((player_id, display_name, points or 0))
+    for answered_session_id, player_ids in db.get_active_session_answered(con, session_id=session_id):
+        session = sessions.get(answered_session_id)
+        if session is not None:
+            session.answered = set(player_ids)
+    return sessions
+
+
+class LiveSessions:
+    """
+    The live state of the running sessions. session_databases are connection factories of the databases with
+    the session tables (see ShardRouter.factories), session_database(session_id) picks the one of a session
+    and catalog connects to the database with the questions
+    """
+
+    def __init__(self, session_databases: list, session_database, catalog, target_ms: float = 2000.0):
+        self.session_databases = session_databases
+        self.session_database = session_database
+        self.catalog = catalog
+        self.target_ms = target_ms
+        self.last_recovery = None
+        self.reloads = 0
+        self._sessions = {}
+        self._loading = {}  # session_id -> [reads loading it, change events since the first of them started]
+        self._invalidated_during_recovery = None
+        self._recovery_reset = False
+        self._lock = threading.Lock()
+
+    def recover(self) -> dict:
+        """Loads every running session of every database, returns how many and how long it took"""
+        started = time.perf_counter()
+        recovered, players = {}, 0
+        with self._lock:
+            self._invalidated_during_recovery = set()
+            self._recovery_reset = False
+        catalog_con = self.catalog()
+        try:
+            if catalog_con is None:  # get_connection prints the error and returns None
+                raise psycopg2.OperationalError("No connection to the catalog database")
+            for connect in self.session_databases:
+                con = connect()
+                if con is None:
+                    raise psycopg2.OperationalError("No connection to a session database")
+                try:
+                    sessions = load_live_sessions(con, catalog_con)
+                finally:
+                    con.close()
+                recovered.update(sessions)
+                players += sum(len(session.players) for session in sessions.values())
+        finally:
+            if catalog_con is not None:
+                catalog_con.close()
+            with self._lock:
+                # Sessions that changed while they were loaded are reloaded on their next read, all of them if
+                # the listener reconnected meanwhile
+                if self._recovery_reset:
+                    recovered.clear()
+                for session_id in self._invalidated_during_recovery:
+                    recovered.pop(session_id, None)
+                self._invalidated_during_recovery = None
+                self._sessions.update(recovered)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.last_recovery = {
+            "sessions": len(recovered),
+            "players": players,
+            "ms": round(elapsed_ms, 2),
+            "target_ms": self.target_ms,
+        }
+        print(f"Recovered {len(recovered)} running sessions with {players} players in {elapsed_ms:.1f} ms")
+        if elapsed_ms > self.target_ms:
+            print(f"Session recovery took longer than its target of {self.target_ms:.0f} ms")
+        return self.last_recovery
+
+    def get(self, session_id: int):
+        """
+        The live state of a running session, reloaded if it changed since it was loaded, None if it isn't running.
+        Raises psycopg2.OperationalError when the session's database can't be reached
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                return session
+            loading = self._loading.setdefault(session_id, [0, 0])
+            loading[0] += 1
+            invalidations = loading[1]
+        con = catalog_con = None
+        try:
+            con = self.session_database(session_id)
+            catalog_con = self.catalog()
+            if con is None or catalog_con is None:  # get_connection prints the error and returns None
+                raise psycopg2.OperationalError(f"No connection to the database of session {session_id}")
+            session = load_live_sessions(con, catalog_con, session_id=session_id).get(session_id)
+            self.reloads += 1
+        finally:
+            for connection in (con, catalog_con):
+                if connection is not None:
+                    connection.close()
+            with self._lock:
+                # Not kept if a change event of the session came in while loading, it could be older than that change
+                if session is not None and invalidations == loading[1]:
+                    self._sessions[session_id] = session
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[session_id]
+        return session
+
+    def invalidate(self, event: dict):
+        """Change event subscriber, the next read of the session reloads it"""
+        session_id = event.get("session_id")
+        if session_id is not None:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+                loading = self._loading.get(session_id)
+                if loading is not None:
+                    loading[1] += 1
+                if self._invalidated_during_recovery is not None:
+                    self._invalidated_during_recovery.add(session_id)
+
+    def reset(self):
+        """Reconnect callback of the change listeners, every session is reloaded on its next read"""
+        with self._lock:
+            self._sessions.clear()
+            for loading in self._loading.values():
+                loading[1] += 1
+            if self._invalidated_during_recovery is not None:
+                self._recovery_reset = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            tracked = len(self._sessions)
+        return {"tracked": tracked, "reloads": self.reloads, "last_recovery": self.last_recovery}
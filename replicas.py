@@ -0,0 +1,169 @@
+import itertools
+import re
+import threading
+import time
+
+import psycopg2
+
+"""
+Read/write splitting. Writes and the reads that must see them go to the primary (db_setup.get_connection),
+the read-only endpoints (listings, analytics, exports) ask ReplicaRouter.read_connection for a replica.
+
+Replica lag: a replica that is more than max_lag seconds behind is skipped until it catches up, and when
+no replica is usable the read goes to the primary. Without replicas configured every read goes to the primary.
+
+Read-your-writes: after a write that the client will read right away (e.g. joining a session and then
+loading its players) the endpoint calls note_write(key, con), which remembers the primary's WAL position
+for that key. A later read with the same key only uses a replica that has replayed up to that position.
+The position is also returned to the client (X-Min-LSN header) so it can send it back to another worker.
+"""
+
+LSN_PATTERN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+# Lag in seconds and whether the replica has replayed up to the given position. The lag is 0 when everything
+# received is replayed and the WAL receiver is streaming from the primary. A replica whose receiver stopped has
+# replayed everything it received too, but the primary may be far ahead, so its lag is the time since its last
+# replayed transaction (NULL, so unusable, if it never replayed one)
+REPLICA_STATE_QUERY = """SELECT
+    CASE WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END,
+    coalesce(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)"""
+
+
+class _Replica:
+    __slots__ = ("dsn", "lag", "checked_at", "healthy")
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.lag = 0.0
+        self.checked_at = 0.0
+        self.healthy = True
+
+
+class ReplicaRouter:
+    def __init__(self, connect, primary, replica_dsns: list, max_lag: float = 1.0, check_interval: float = 1.0,
+                 write_ttl: float = 30.0, max_tracked_writes: int = 10000):
+        self.connect = connect
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.write_ttl = write_ttl
+        self.max_tracked_writes = max_tracked_writes
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._replicas = [_Replica(dsn) for dsn in replica_dsns]
+        self._order = itertools.cycle(range(len(self._replicas))) if self._replicas else None
+        self._writes = {}  # key -> (lsn, expires)
+        self._lock = threading.Lock()
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self._replicas)
+
+    def note_write(self, key, con):
+        """
+        Remembers the primary's current WAL position for key, call it after the write committed.
+        Returns the position, or None when there are no replicas to wait for
+        """
+        if not self._replicas:
+            return None
+        with con.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_lsn()::text")
+            lsn = cursor.fetchone()[0]
+        with self._lock:
+            if len(self._writes) >= self.max_tracked_writes:
+                now = time.monotonic()
+                self._writes = {k: v for k, v in self._writes.items() if v[1] > now}
+                if len(self._writes) >= self.max_tracked_writes:
+                    self._writes.clear()
+            self._writes[key] = (lsn, time.monotonic() + self.write_ttl)
+        return lsn
+
+    def required_lsn(self, key, min_lsn: str | None):
+        """The WAL position a read of key has to see, from the client's min_lsn and the writes noted for key"""
+        if min_lsn is not None and not LSN_PATTERN.match(min_lsn):
+            min_lsn = None
+        if key is None:
+            return min_lsn
+        with self._lock:
+            entry = self._writes.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return min_lsn
+        # Both are replayed in order, so the replica has to reach the highest one
+        return entry[0] if min_lsn is None else max(entry[0], min_lsn, key=_lsn_value)
+
+    def read_connection(self, key=None, min_lsn: str | None = None):
+        """Returns a connection to a replica that is recent enough, or to the primary"""
+        required = self.required_lsn(key, min_lsn)
+        for _ in range(len(self._replicas)):
+            with self._lock:
+                replica = self._replicas[next(self._order)]
+            con = self._try_replica(replica, required)
+            if con is not None:
+                self.replica_reads += 1
+                return con
+        self.primary_reads += 1
+        return self.primary()
+
+    def _try_replica(self, replica: _Replica, required: str | None):
+        now = time.monotonic()
+        stale = now - replica.checked_at > self.check_interval
+        if not stale and (not replica.healthy or replica.lag > self.max_lag):
+            return None
+        try:
+            con = self.connect(replica.dsn)
+        except psycopg2.Error as e:
+            print(f"Replica unavailable: {e}")
+            replica.healthy, replica.checked_at = False, now
+            return None
+        if not stale and required is None:
+            return con
+        try:
+            with con.cursor() as cursor:
+                cursor.execute(REPLICA_STATE_QUERY, (required or "0/0",))
+                lag, caught_up = cursor.fetchone()
+            con.rollback()
+        except psycopg2.Error:
+            con.close()
+            replica.healthy, replica.checked_at = False, now
+            return None
+        replica.lag, replica.healthy, replica.checked_at = float("inf") if lag is None else float(lag), True, now
+        if replica.lag > self.max_lag or not caught_up:
+            con.close()
+            return None
+        return con
+
+    def stats(self) -> dict:
+        return {
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "replicas": [{"healthy": r.healthy, "lag": round(r.lag, 3) if r.lag != float("inf") else None} for r in self._replicas],
+        }
+
+
+def _lsn_value(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that returns the WAL position of the request's writes (request.state.min_lsn) as X-Min-LSN"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_lsn(message):
+            if message["type"] == "http.response.start":
+                min_lsn = scope.get("state", {}).get("min_lsn")
+                if min_lsn:
+                    message["headers"] = [*message.get("headers", []), (b"x-min-lsn", min_lsn.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_lsn)
@@ -0,0 +1,42 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+
+try:
+    # orjson is optional, it is a lot faster and handles datetime and date natively
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+JSON serialization for the API responses.
+FastJSONResponse is used as the default response class in app.py, and dumps() is shared with records.py
+so that every response goes through the same serializer.
+"""
+
+
+def _json_default(value):
+    """Handles the types that the serializer can't handle by itself"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "as_dict"):
+        return value.as_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """Serializes content to JSON bytes, with orjson when it is installed and the json module otherwise"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that renders with dumps(), return it directly from an endpoint to also skip jsonable_encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -153,6 +153,7 @@ class SessionResponse(BaseModel):
     ended_at: datetime
     current_question_id: int
     session_code: int
+    snapshot_id: int | None = None
 
 class SessionUpdate(BaseModel):
     session_name: str = Field(min_length=3, max_length=255)
@@ -232,4 +233,44 @@ class ScoreboardUpdate(BaseModel):
     player_id: int 
     total_score: int 
     correct_answers: bool 
-    rank: int
\ No newline at end of file
+    rank: int
+
+class BundleAnswerAlternative(BaseModel):
+    answer_text: str = Field(min_length=1, max_length=255)
+    is_correct: bool
+    answer_icon: int
+    answer_order: int | None = None
+
+class BundleQuestion(BaseModel):
+    question_text: str = Field(min_length=3, max_length=500)
+    question_order: int | None = None
+    time_limit: int
+    points: int = 100
+    question_type: int
+    image: int
+    alternatives: list[BundleAnswerAlternative] = []
+
+class BundleQuiz(BaseModel):
+    quiz_creator_id: int
+    quiz_title: str = Field(min_length=3, max_length=255)
+    quiz_description: str | None = Field(None, max_length=1000)
+    intro_image: int | None = None
+    is_public: bool = False
+
+class QuizBundle(BaseModel):
+    """A whole quiz in one document, used by import and export. Images are referenced by their id"""
+    quiz: BundleQuiz
+    hashtags: list[str] = []
+    questions: list[BundleQuestion] = []
+
+class QuizClone(BaseModel):
+    quiz_creator_id: int | None = None
+    quiz_title: str | None = Field(None, min_length=3, max_length=255)
+
+class BatchIds(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
+class JobCreate(BaseModel):
+    job_type: str
+    payload: dict = {}
+    max_attempts: int = Field(3, ge=1, le=20)
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict, deque
+
+"""
+Recent changes per session, for the delta sync endpoint GET /sessions/{session_id}/changes?since=N.
+Every write to a session's rows bumps sessions.change_version once and sends the new version in its change event,
+with the other rows the write changed as related (see db.notify_change). SessionChangeLog subscribes to those events and keeps the last changes of each session
+in a bounded ring. A client that polls with the version it already has is answered from memory.
+When the ring can't answer (the session isn't tracked, the changes were pushed out of the ring or events were
+missed, or the listener reconnected and reset() dropped them) the endpoint falls back to the database.
+"""
+
+
+class SessionChangeLog:
+    def __init__(self, max_sessions: int = 10000, changes_per_session: int = 256):
+        self.max_sessions = max_sessions
+        self.changes_per_session = changes_per_session
+        self._sessions = OrderedDict()  # session_id -> deque of (version, table, id)
+        self._lock = threading.Lock()
+
+    def record(self, event: dict):
+        """Change event subscriber, events without a session version are ignored except a session's delete"""
+        session_id, version = event.get("session_id"), event.get("version")
+        if session_id is None:
+            return
+        if version is None:
+            # A deleted session has no change_version to bump, its ring goes so the endpoint finds it gone
+            if event.get("table") == "sessions" and event.get("id") == session_id:
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+            return
+        with self._lock:
+            changes = self._sessions.get(session_id)
+            if changes is None:
+                changes = self._sessions[session_id] = deque(maxlen=self.changes_per_session)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            if changes and version <= changes[-1][0]:
+                return
+            if changes and version != changes[-1][0] + 1:
+                # Missed events, only what comes after this one is known
+                changes.clear()
+            changes.append((version, event.get("table"), event.get("id")))
+            changes.extend((version, table, row_id) for table, row_id in event.get("related", ()))
+
+    def reset(self):
+        """Reconnect callback of the change listeners, events may have been missed so every ring starts over"""
+        with self._lock:
+            self._sessions.clear()
+
+    def latest(self, session_id: int):
+        """Returns the newest known version of a session, None if it isn't tracked"""
+        with self._lock:
+            changes = self._sessions.get(session_id)
+            return changes[-1][0] if changes else None
+
+    def changes_since(self, session_id: int, since: int):
+        """
+        Returns (version, {table: [ids]}) of everything that changed after version since,
+        or None if the ring doesn't cover that range
+        """
+        with self._lock:
+            changes = self._sessions.get(session_id)
+            if not changes:
+                return None
+            # Once the ring is full, part of its oldest version may have been pushed out, so since can't be older
+            oldest = changes[0][0] - 1 if len(changes) < changes.maxlen else changes[0][0]
+            if not oldest <= since <= changes[-1][0]:
+                return None
+            changed = {}
+            for version, table, row_id in reversed(changes):
+                if version <= since:
+                    break
+                ids = changed.setdefault(table, [])
+                if row_id not in ids:
+                    ids.append(row_id)
+            return changes[-1][0], changed
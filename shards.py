@@ -0,0 +1,215 @@
+import argparse
+
+import psycopg2
+
+from db_setup import SESSION_SHARD_DSNS, connect
+
+"""
+Sharding of the live session tables (sessions, session_players, player_answers, session_scoreboards) over several
+databases. Quiz content, users and everything else stays on the catalog database (db_setup.get_connection).
+
+SESSION_SHARD_DSNS is a comma separated list of shard databases. Without it there are no shards and everything
+is on the catalog database, like before.
+
+Routing without a lookup table:
+  - a new session goes to shard session_code % N, so the code a player types is enough to find the session
+  - on shard k every id sequence of the session tables hands out k+1, k+1+N, k+1+2N, ... so the shard of any
+    session, player, answer or scoreboard row is (id - 1) % N. A player or answer always lives on its session's shard
+
+The order of SESSION_SHARD_DSNS must never change once shards have data, and adding a shard needs a migration.
+The shards have no foreign keys to the catalog tables, and the catalog triggers that read the session tables
+(question stats, creator stats, trending hashtags) aren't on the shards, see setup_shards. The endpoints that
+read those statistics answer 501 while sharding is on.
+
+Set up the shards with: python shards.py
+"""
+
+SHARDED_TABLES = ("sessions", "session_players", "player_answers", "session_scoreboards")
+
+# The session tables of db_setup.py, without the foreign keys to catalog tables
+SHARD_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id SERIAL PRIMARY KEY,
+        session_name VARCHAR(255) NOT NULL,
+        host_user_id INT NOT NULL,
+        active_quiz INT,
+        qr_code_id INT,
+        session_status INT NOT NULL,
+        started_at TIMESTAMP,
+        ended_at TIMESTAMP,
+        current_question_id INT,
+        session_code INT UNIQUE NOT NULL,
+        snapshot_id INT,
+        change_version BIGINT NOT NULL DEFAULT 0,
+        question_started_at TIMESTAMPTZ
+        )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS session_players (
+        id SERIAL PRIMARY KEY,
+        display_name VARCHAR(255) UNIQUE NOT NULL,
+        session_id INT NOT NULL REFERENCES sessions(id),
+        user_id INT,
+        joined_at TIMESTAMP,
+        player_points INT DEFAULT 0
+        )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS session_scoreboards (
+        id SERIAL PRIMARY KEY,
+        session_id INT NOT NULL REFERENCES sessions(id),
+        player_id INT NOT NULL REFERENCES session_players(id),
+        total_score INT DEFAULT 0,
+        correct_answers INT DEFAULT 0,
+        rank INT
+        )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS player_answers (
+        id SERIAL PRIMARY KEY,
+        player_id INT NOT NULL REFERENCES session_players(id),
+        session_id INT NOT NULL REFERENCES sessions(id),
+        question_id INT NOT NULL,
+        answer_id INT NOT NULL,
+        response_time INT NOT NULL,
+        points_earned INT DEFAULT 0,
+        is_correct BOOLEAN
+        )
+    """,
+    """
+    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS question_started_at TIMESTAMPTZ
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS session_players_session_idx ON session_players (session_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS session_players_session_points_idx ON session_players (session_id, player_points DESC, id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS player_answers_session_question_idx ON player_answers (session_id, question_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS sessions_active_idx ON sessions (id) WHERE started_at IS NOT NULL AND ended_at IS NULL
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS session_events (
+        session_id INT NOT NULL,
+        seq INT NOT NULL,
+        event_type VARCHAR(20) NOT NULL,
+        occurred_at TIMESTAMPTZ NOT NULL,
+        player_id INT,
+        question_id INT,
+        points INT,
+        detail JSONB,
+        PRIMARY KEY (session_id, seq)
+        )
+    """,
+)
+
+
+class ShardRouter:
+    def __init__(self, connect, catalog, shard_dsns: list):
+        self.connect = connect
+        self.catalog = catalog
+        self.shard_dsns = list(shard_dsns)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shard_dsns)
+
+    @property
+    def count(self) -> int:
+        return len(self.shard_dsns)
+
+    def shard_for_id(self, row_id: int) -> int:
+        """The shard of a row of any of the sharded tables"""
+        return (row_id - 1) % self.count
+
+    def shard_for_code(self, session_code: int) -> int:
+        return session_code % self.count
+
+    def slot_for_session(self, session_id: int) -> int:
+        """Index of the session's database in factories(), 0 when sharding is off"""
+        return self.shard_for_id(session_id) if self.enabled else 0
+
+    def connection(self, shard: int | None = None):
+        """Connection to a shard, or to the catalog database when sharding is off"""
+        if not self.enabled:
+            return self.catalog()
+        return self.connect(self.shard_dsns[shard])
+
+    def for_session(self, session_id: int):
+        return self.connection(self.shard_for_id(session_id) if self.enabled else None)
+
+    def for_row(self, row_id: int):
+        return self.for_session(row_id)
+
+    def for_code(self, session_code: int):
+        return self.connection(self.shard_for_code(session_code) if self.enabled else None)
+
+    def factories(self) -> list:
+        """A connection factory per database that holds session tables, for the per-database workers"""
+        if not self.enabled:
+            return [self.catalog]
+        return [lambda dsn=dsn: self.connect(dsn) for dsn in self.shard_dsns]
+
+    def group_by_shard(self, ids) -> dict:
+        """{shard: [ids]}, with a single None shard when sharding is off"""
+        if not self.enabled:
+            return {None: list(ids)}
+        groups = {}
+        for row_id in ids:
+            groups.setdefault(self.shard_for_id(row_id), []).append(row_id)
+        return groups
+
+    def fan_out(self, read, limit: int | None = None, unsharded=None) -> list:
+        """
+        Runs read(con) on every shard and returns the rows of all of them, at most limit.
+        Without shards it runs once on a connection from unsharded() (e.g. a replica) or the catalog
+        """
+        if not self.enabled:
+            return read((unsharded or self.catalog)())
+        rows = []
+        for shard in range(self.count):
+            rows.extend(read(self.connection(shard)))
+            if limit is not None and len(rows) >= limit:
+                break
+        return rows[:limit] if limit is not None else rows
+
+
+def setup_shards(shard_dsns: list):
+    """Creates the session tables on every shard and interleaves their id sequences"""
+    for shard, dsn in enumerate(shard_dsns):
+        con = connect(dsn)
+        try:
+            with con:
+                with con.cursor() as cursor:
+                    for command in SHARD_SCHEMA:
+                        cursor.execute(command)
+                    for table in SHARDED_TABLES:
+                        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+                        sequence = cursor.fetchone()[0]
+                        cursor.execute(f"SELECT last_value, is_called FROM {sequence}")
+                        last_value, is_called = cursor.fetchone()
+                        # Next id after the existing ones that belongs to this shard
+                        start = shard + 1
+                        if is_called:
+                            start += ((last_value - shard - 1) // len(shard_dsns) + 1) * len(shard_dsns)
+                        cursor.execute(
+                            f"ALTER SEQUENCE {sequence} INCREMENT BY %s RESTART WITH %s", (len(shard_dsns), start)
+                        )
+            print(f"Shard {shard} is set up")
+        finally:
+            con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the session tables on the shards of SESSION_SHARD_DSNS")
+    parser.parse_args()
+    if not SESSION_SHARD_DSNS:
+        raise SystemExit("SESSION_SHARD_DSNS is not set")
+    try:
+        setup_shards(SESSION_SHARD_DSNS)
+    except psycopg2.Error as e:
+        raise SystemExit(f"Setting up the shards failed: {e}")
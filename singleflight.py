@@ -0,0 +1,93 @@
+import threading
+
+"""
+Single-flight request coalescing for the db readers.
+When a game starts hundreds of players ask for the same quiz and question within a few ms. With SingleFlight
+only the first request for a key runs the query, the requests that arrive while it is running wait for it and
+get the same result, so the database sees one query per key instead of one per player.
+Nothing is cached, a request that arrives after the query finished runs a new one (see microcache.py for that).
+"""
+
+
+class _Call:
+    """A query in progress that other requests for the same key can wait on"""
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, max_tracked_keys: int = 1000):
+        self.max_tracked_keys = max_tracked_keys
+        self.requests = 0
+        self.queries = 0
+        self._calls = {}
+        self._key_stats = {}  # key -> [requests, queries]
+        self._lock = threading.Lock()
+
+    def do(self, key, load):
+        """Returns load(), shared with every request for the same key that arrives while it is running"""
+        with self._lock:
+            self.requests += 1
+            key_stats = self._track(key)
+            key_stats[0] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.queries += 1
+                key_stats[1] += 1
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = load()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _track(self, key):
+        key_stats = self._key_stats.get(key)
+        if key_stats is None:
+            if len(self._key_stats) >= self.max_tracked_keys:
+                # Forget the half of the keys that collapsed the fewest requests
+                ranked = sorted(self._key_stats.items(), key=lambda item: item[1][0] - item[1][1])
+                for old_key, _ in ranked[:len(ranked) // 2 + 1]:
+                    del self._key_stats[old_key]
+            key_stats = self._key_stats[key] = [0, 0]
+        return key_stats
+
+    def stats(self, top: int = 20) -> dict:
+        """Totals and the keys with the most collapsed requests"""
+        with self._lock:
+            keys = sorted(self._key_stats.items(), key=lambda item: item[1][1] - item[1][0])[:top]
+            return {
+                "requests": self.requests,
+                "queries": self.queries,
+                "collapsed": self.requests - self.queries,
+                "in_flight": len(self._calls),
+                "keys": [
+                    {
+                        "key": "/".join(map(str, key)) if isinstance(key, tuple) else str(key),
+                        "requests": requests,
+                        "queries": queries,
+                        "collapsed": requests - queries,
+                    }
+                    for key, (requests, queries) in keys
+                ],
+            }
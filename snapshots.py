@@ -0,0 +1,53 @@
+import json
+import threading
+from collections import OrderedDict
+
+from responses import dumps
+
+"""
+In-process cache for the published quiz snapshots.
+A snapshot never changes once it is created, so an entry is valid forever and is only dropped when the cache
+is full (least recently used first). No invalidation is needed, even with several workers.
+The players get a snapshot without the correct answers, see without_answers().
+"""
+
+
+class SnapshotCache:
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, snapshot_id, load):
+        """Returns the cached content of a snapshot, calling load(snapshot_id) on a miss. None is never cached"""
+        with self._lock:
+            content = self._entries.get(snapshot_id)
+            if content is not None:
+                self._entries.move_to_end(snapshot_id)
+                self.hits += 1
+                return content
+            self.misses += 1
+
+        content = load(snapshot_id)
+        if content is None:
+            return None
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        with self._lock:
+            self._entries[snapshot_id] = content
+            self._entries.move_to_end(snapshot_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return content
+
+
+def without_answers(content: bytes) -> bytes:
+    """The snapshot content for the players, without the is_correct of the answer alternatives"""
+    snapshot = json.loads(content)
+    for question in snapshot.get("questions", []):
+        for alternative in question.get("alternatives", []):
+            alternative.pop("is_correct", None)
+    return dumps(snapshot)
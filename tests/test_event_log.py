@@ -0,0 +1,78 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_log import (ANSWER, JOIN, MAGIC, QUESTION_START, RECORD_HEADER, SCORE, SESSION_END, SESSION_START,
+                       SessionEventLog, decode_events, encode_event, read_log, replay, valid_length)
+
+EVENTS = [
+    (SESSION_START, (7, 123456)),
+    (JOIN, (1, "Ada")),
+    (JOIN, (2, "Grace ♥")),
+    (QUESTION_START, (10,)),
+    (ANSWER, (100, 1, 10, 50, 1200, 900, True)),
+    (SCORE, (1, 900)),
+    (ANSWER, (101, 2, 10, 51, 3000, 0, False)),
+]
+
+
+def make_log(events=EVENTS) -> bytes:
+    return MAGIC + b"".join(encode_event(event_type, *fields, at=1_000 + i) for i, (event_type, fields) in enumerate(events))
+
+
+def test_round_trip():
+    decoded = list(decode_events(make_log()))
+    assert [(event.type, event.data) for event in decoded] == EVENTS
+    assert [event.at for event in decoded] == list(range(1_000, 1_000 + len(EVENTS)))
+
+
+def test_torn_tail_ends_the_log():
+    log = make_log()
+    event_type, fields = EVENTS[-1]
+    for cut in range(1, len(encode_event(event_type, *fields))):
+        decoded = list(decode_events(log[:-cut]))
+        assert [(event.type, event.data) for event in decoded] == EVENTS[:-1]
+    assert valid_length(log[:-1]) == len(make_log(EVENTS[:-1]))
+
+
+def test_corrupt_crc_ends_the_log():
+    log = bytearray(make_log())
+    offset = len(make_log(EVENTS[:3]))
+    log[offset + RECORD_HEADER.size + 4] ^= 0xFF  # a byte of the fourth record's body
+    decoded = list(decode_events(bytes(log)))
+    assert [(event.type, event.data) for event in decoded] == EVENTS[:3]
+
+
+def test_replay():
+    state = replay(5, decode_events(make_log(EVENTS + [(SESSION_END, ())])))
+    assert state.quiz_id == 7 and state.session_code == 123456
+    assert state.players == {1: ["Ada", 900], 2: ["Grace ♥", 0]}
+    assert state.answers == 2
+    assert state.current_question_id is None
+    assert state.ended_at is not None and state.events == len(EVENTS) + 1
+
+
+def test_append_after_torn_tail_is_replayed(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    for event_type, fields in EVENTS[:4]:
+        log.append(5, event_type, *fields)
+    log.close()
+    event_type, fields = EVENTS[4]
+    with open(log.path(5), "ab") as file:  # a record torn by a crash
+        file.write(encode_event(event_type, *fields)[:-3])
+
+    reopened = SessionEventLog(str(tmp_path))
+    for event_type, fields in EVENTS[4:]:
+        reopened.append(5, event_type, *fields)
+    reopened.close()
+    assert [(event.type, event.data) for event in read_log(log.path(5))] == EVENTS
+
+
+def test_log_without_magic_is_started_again(tmp_path):
+    log = SessionEventLog(str(tmp_path))
+    log.path(5).write_bytes(MAGIC[:2])  # its creator crashed while writing the magic
+    event_type, fields = EVENTS[0]
+    log.append(5, event_type, *fields)
+    log.close()
+    assert [(event.type, event.data) for event in read_log(log.path(5))] == EVENTS[:1]
@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_changes import SessionChangeLog
+
+
+def event(version, table="session_players", row_id=1, session_id=5, **extra):
+    return {"table": table, "id": row_id, "session_id": session_id, "version": version, **extra}
+
+
+def test_changes_since_a_version():
+    log = SessionChangeLog()
+    log.record(event(1, row_id=10))
+    log.record(event(2, table="sessions", row_id=5, related=[["session_scoreboards", 30]]))
+    log.record(event(3, row_id=11))
+    log.record(event(4, row_id=10))
+    assert log.latest(5) == 4
+    assert log.changes_since(5, 2) == (4, {"session_players": [10, 11]})
+    assert log.changes_since(5, 1) == (4, {"session_players": [10, 11], "sessions": [5], "session_scoreboards": [30]})
+    assert log.changes_since(5, 0) == (4, {"session_players": [10, 11], "sessions": [5], "session_scoreboards": [30]})
+    assert log.changes_since(5, 4) == (4, {})
+
+
+def test_gap_drops_what_came_before():
+    log = SessionChangeLog()
+    log.record(event(1))
+    log.record(event(2))
+    log.record(event(5, row_id=2))  # the events of versions 3 and 4 were missed
+    assert log.latest(5) == 5
+    assert log.changes_since(5, 2) is None
+    assert log.changes_since(5, 4) == (5, {"session_players": [2]})
+
+
+def test_full_ring_no_longer_covers_its_oldest_version():
+    log = SessionChangeLog(changes_per_session=3)
+    for version in range(1, 5):
+        log.record(event(version, row_id=version))
+    assert log.changes_since(5, 1) is None
+    assert log.changes_since(5, 2) == (4, {"session_players": [4, 3]})
+
+
+def test_old_and_unversioned_events_are_ignored():
+    log = SessionChangeLog()
+    log.record(event(2))
+    log.record(event(1, row_id=9))
+    log.record(event(None, table="quizzes", session_id=None))
+    assert log.changes_since(5, 1) == (2, {"session_players": [1]})
+
+
+def test_deleted_session_and_reset_are_forgotten():
+    log = SessionChangeLog()
+    log.record(event(1))
+    log.record(event(1, session_id=6))
+    log.record({"table": "sessions", "id": 5, "session_id": 5})
+    assert log.latest(5) is None and log.changes_since(5, 1) is None
+    assert log.latest(6) == 1
+    log.reset()
+    assert log.latest(6) is None
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from microcache import MicroCache
+from singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, load, count):
+    """Starts count requests for key in threads, returns the threads and the list their results or errors go to"""
+    outcomes = [None] * count
+
+    def request(i):
+        try:
+            outcomes[i] = flight.do(key, load)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_waiters(flight, key, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with flight._lock:
+            call = flight._calls.get(key)
+            if call is not None and call.waiters == count:
+                return
+        time.sleep(0.001)
+    raise AssertionError("the requests didn't wait on the running query")
+
+
+def test_concurrent_requests_share_one_query():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait()
+        return {"id": 1}
+
+    threads, outcomes = run_concurrently(flight, ("quizzes", 1), load, 8)
+    wait_for_waiters(flight, ("quizzes", 1), 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(outcome is outcomes[0] for outcome in outcomes) and outcomes[0] == {"id": 1}
+    assert flight.stats()["collapsed"] == 7 and flight.stats()["in_flight"] == 0
+
+
+def test_error_is_raised_to_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def load():
+        release.wait()
+        raise ValueError("query failed")
+
+    threads, outcomes = run_concurrently(flight, "key", load, 4)
+    wait_for_waiters(flight, "key", 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    # Errors aren't remembered, the next request runs the query again
+    assert flight.do("key", lambda: 2) == 2
+
+
+def test_sequential_requests_run_their_own_query():
+    flight = SingleFlight()
+    assert [flight.do("key", lambda i=i: i) for i in range(3)] == [0, 1, 2]
+    assert flight.queries == 3
+
+
+def test_micro_cache_serves_within_ttl():
+    cache = MicroCache(ttl=60)
+    assert cache.get("dashboard", lambda: 1) == 1
+    assert cache.get("dashboard", lambda: 2) == 1
+    assert cache.hits == 1
+    with pytest.raises(ValueError):
+        cache.get("other", lambda: int("x"))
+    assert cache.get("other", lambda: 3) == 3
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire
+from wire import (ANSWER_CONTENT_TYPE, ANSWER_FIELDS, ANSWER_FORMAT, EVENT_FORMAT, EVENT_TABLE_CODES, KEEP_ALIVE_FRAME,
+                  MSGPACK_CONTENT_TYPE, decode_answer, encode_answer_id, encode_event, is_binary_answer)
+
+ANSWER = (1, 5, 10, 50, 1200, 900, True)
+
+
+def test_fixed_width_answer_round_trip():
+    body = ANSWER_FORMAT.pack(*ANSWER)
+    assert len(body) == 25
+    assert decode_answer(f"{ANSWER_CONTENT_TYPE}; charset=binary", body) == ANSWER
+    assert encode_answer_id(ANSWER_CONTENT_TYPE, 123) == (123).to_bytes(4, "little")
+
+
+def test_fixed_width_answer_of_wrong_size():
+    body = ANSWER_FORMAT.pack(*ANSWER)
+    for bad in (b"", body[:-1], body + b"\0"):
+        with pytest.raises(ValueError):
+            decode_answer(ANSWER_CONTENT_TYPE, bad)
+
+
+def test_content_types():
+    assert is_binary_answer("Application/X-Kahoot-Answer") and is_binary_answer(MSGPACK_CONTENT_TYPE)
+    assert not is_binary_answer("application/json") and not is_binary_answer(None)
+    with pytest.raises(ValueError):
+        decode_answer("application/json", b"{}")
+
+
+def test_msgpack_answer_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    assert decode_answer(MSGPACK_CONTENT_TYPE, msgpack.packb(list(ANSWER))) == ANSWER
+    assert decode_answer(MSGPACK_CONTENT_TYPE, msgpack.packb(dict(zip(ANSWER_FIELDS, ANSWER)))) == ANSWER
+    assert msgpack.unpackb(encode_answer_id(MSGPACK_CONTENT_TYPE, 123)) == 123
+
+
+def test_malformed_msgpack_answers():
+    msgpack = pytest.importorskip("msgpack")
+    fields = dict(zip(ANSWER_FIELDS, ANSWER))
+    del fields["answer_id"]
+    for bad in (
+        b"\xc1",  # never used in msgpack
+        msgpack.packb(list(ANSWER[:-1])),
+        msgpack.packb(fields),
+        msgpack.packb([1, 5, 10, "50", 1200, 900, True]),
+        msgpack.packb([1, 5, 10, 50, 1200, 900, 1]),
+    ):
+        with pytest.raises(ValueError):
+            decode_answer(MSGPACK_CONTENT_TYPE, bad)
+
+
+def test_msgpack_answer_without_msgpack(monkeypatch):
+    monkeypatch.setattr(wire, "msgpack", None)
+    with pytest.raises(ValueError):
+        decode_answer(MSGPACK_CONTENT_TYPE, b"\x97")
+
+
+def test_event_frames():
+    frames = encode_event({"table": "sessions", "id": 5, "session_id": 5, "version": 7,
+                           "related": [["session_scoreboards", 30], ["session_players", 2]]})
+    assert list(EVENT_FORMAT.iter_unpack(frames)) == [
+        (EVENT_TABLE_CODES["sessions"], 5, 5, 7),
+        (EVENT_TABLE_CODES["session_scoreboards"], 30, 5, 7),
+        (EVENT_TABLE_CODES["session_players"], 2, 5, 7),
+    ]
+    assert encode_event({"table": "player_answers", "id": 9, "session_id": 5}) == EVENT_FORMAT.pack(
+        EVENT_TABLE_CODES["player_answers"], 9, 5, 0
+    )
+    assert EVENT_FORMAT.unpack(KEEP_ALIVE_FRAME) == (0, 0, 0, 0) and len(KEEP_ALIVE_FRAME) == 17
@@ -0,0 +1,111 @@
+import os
+import sys
+from concurrent.futures import Future
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_queue import GroupCommitQueue
+
+
+class FakeCursor:
+    """Keeps the rows a transaction wrote, with the savepoint statements of the writer"""
+
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        if statement == "SAVEPOINT group_write":
+            self.con.savepoint = len(self.con.pending)
+        elif statement == "ROLLBACK TO SAVEPOINT group_write":
+            del self.con.pending[self.con.savepoint:]
+        elif statement == "RELEASE SAVEPOINT group_write":
+            self.con.savepoint = None
+        else:
+            self.con.pending.append(params)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.pending = []
+        self.committed = []
+        self.savepoint = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        self.closed = True
+
+
+def write_row(cursor, value):
+    cursor.execute("INSERT", (value,))
+    return value
+
+
+def write_half_then_fail(cursor, value):
+    cursor.execute("INSERT", (value,))
+    raise psycopg2.IntegrityError("duplicate key")
+
+
+def test_failing_write_is_rolled_back_alone():
+    con = FakeConnection()
+    writes = GroupCommitQueue(lambda: con)
+    group = [(write_row, 1), (write_half_then_fail, 2), (write_row, 3)]
+    # Committed directly so the three writes share one group
+    futures = [Future() for _ in group]
+    writes._commit_group([(write, (value,), future) for (write, value), future in zip(group, futures)])
+
+    assert con.committed == [(1,), (3,)]
+    assert futures[0].result() == 1 and futures[2].result() == 3
+    with pytest.raises(psycopg2.IntegrityError):
+        futures[1].result()
+    assert writes.groups_committed == 1 and writes.writes_committed == 2
+
+
+def test_submit_returns_after_commit():
+    con = FakeConnection()
+    writes = GroupCommitQueue(lambda: con)
+    assert writes.submit(write_row, 7) == 7
+    assert con.committed == [(7,)]
+    writes.stop()
+    assert con.closed
+
+
+def test_submit_after_stop_is_refused():
+    con = FakeConnection()
+    writes = GroupCommitQueue(lambda: con)
+    writes.submit(write_row, 1)
+    writes.stop()
+    with pytest.raises(RuntimeError):
+        writes.submit(write_row, 2)
+    assert con.committed == [(1,)]
+
+
+def test_failed_commit_fails_the_whole_group():
+    class FailingConnection(FakeConnection):
+        def commit(self):
+            raise psycopg2.OperationalError("server closed the connection")
+
+    con = FailingConnection()
+    writes = GroupCommitQueue(lambda: con)
+    with pytest.raises(psycopg2.OperationalError):
+        writes.submit(write_row, 1)
+    assert con.pending == [] and writes.writes_committed == 0
+    writes.stop()
@@ -0,0 +1,71 @@
+"""
+Request-scoped transactions for the write endpoints.
+The db.py functions each run in `with con:` and call con.commit(), so an endpoint that calls several of them commits
+several times and can leave half of its work behind when a later step fails. A UnitOfWork wraps the connection of
+one request and turns those into no-ops: every db call of the request runs in the same transaction, which the
+unit_of_work dependency in app.py commits once when the endpoint returns and rolls back when it raises.
+
+The connection is opened on first use, so an endpoint that writes to a session shard can call route() with the
+shard's connection factory before its first statement (see shards.py).
+"""
+
+
+class UnitOfWork:
+    """Connection proxy that the db.py functions can use like a connection, without committing"""
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._connection = None
+        self.skipped_commits = 0
+        self._after_commit = []
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None
+
+    def route(self, connect):
+        """Makes the unit of work use connections from connect, only possible before the first statement"""
+        if self._connection is not None:
+            raise RuntimeError("The unit of work already has a connection")
+        self._connect = connect
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # The transaction is finished by finish(), an exception propagates to the endpoint
+        return False
+
+    def commit(self):
+        self.skipped_commits += 1
+
+    def rollback(self):
+        """Discards the whole unit of work, not only the last step"""
+        self.connection.rollback()
+
+    def after_commit(self, callback):
+        """Runs callback(connection) once the request's transaction has committed"""
+        self._after_commit.append(callback)
+
+    def finish(self, commit: bool):
+        if self._connection is None:
+            return
+        if commit:
+            self.connection.commit()
+            for callback in self._after_commit:
+                callback(self.connection)
+        else:
+            self.connection.rollback()
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
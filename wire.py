@@ -0,0 +1,89 @@
+import struct
+
+try:
+    # msgpack is optional, without it only the fixed-width format is accepted
+    import msgpack
+except ImportError:
+    msgpack = None
+
+"""
+Compact binary encodings for the highest rate traffic: answer submissions and session change events.
+The format is negotiated with the content type, JSON stays the default.
+
+  application/x-kahoot-answer   fixed-width answer, 25 bytes, little-endian:
+                                player_id, session_id, question_id, answer_id, response_time, points_earned (int32)
+                                and is_correct (1 byte). The response is the new answer ID as an int32
+  application/msgpack           the same seven fields as an array in that order, or as a map with their names.
+                                The response is the new answer ID as msgpack
+  application/x-kahoot-events   (Accept header of GET /sessions/{session_id}/events) a stream of 17 byte frames:
+                                table code (1 byte), id, session_id (int32) and version (int64, 0 if unknown).
+                                Table code 0 is a keep-alive frame. The rows one write changed share a version
+
+The schema is fixed, so decoding unpacks the values directly instead of going through pydantic.
+"""
+
+ANSWER_CONTENT_TYPE = "application/x-kahoot-answer"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+EVENT_CONTENT_TYPE = "application/x-kahoot-events"
+
+ANSWER_FIELDS = ("player_id", "session_id", "question_id", "answer_id", "response_time", "points_earned", "is_correct")
+ANSWER_FORMAT = struct.Struct("<iiiiii?")
+ANSWER_ID_FORMAT = struct.Struct("<i")
+
+EVENT_FORMAT = struct.Struct("<Biiq")
+EVENT_TABLES = ("sessions", "session_players", "player_answers", "session_scoreboards")
+EVENT_TABLE_CODES = {table: code for code, table in enumerate(EVENT_TABLES, start=1)}
+KEEP_ALIVE_FRAME = EVENT_FORMAT.pack(0, 0, 0, 0)
+
+
+def media_type(content_type: str | None) -> str:
+    """The content type without parameters, e.g. 'application/json; charset=utf-8' -> 'application/json'"""
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def is_binary_answer(content_type: str | None) -> bool:
+    return media_type(content_type) in (ANSWER_CONTENT_TYPE, MSGPACK_CONTENT_TYPE)
+
+
+def decode_answer(content_type: str | None, body: bytes) -> tuple:
+    """Decodes a binary answer submission to a tuple in ANSWER_FIELDS order, raises ValueError if it is malformed"""
+    kind = media_type(content_type)
+    if kind == ANSWER_CONTENT_TYPE:
+        if len(body) != ANSWER_FORMAT.size:
+            raise ValueError(f"Answer must be {ANSWER_FORMAT.size} bytes, got {len(body)}")
+        return ANSWER_FORMAT.unpack(body)
+
+    if kind != MSGPACK_CONTENT_TYPE:
+        raise ValueError(f"Unsupported content type {kind}")
+    if msgpack is None:
+        raise ValueError("msgpack is not installed on the server")
+    try:
+        values = msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid msgpack: {e}")
+    if isinstance(values, dict):
+        try:
+            values = [values[field] for field in ANSWER_FIELDS]
+        except KeyError as e:
+            raise ValueError(f"Missing field {e}")
+    if not isinstance(values, (list, tuple)) or len(values) != len(ANSWER_FIELDS):
+        raise ValueError(f"Answer must have the {len(ANSWER_FIELDS)} fields {', '.join(ANSWER_FIELDS)}")
+    *numbers, is_correct = values
+    if any(type(value) is not int for value in numbers) or type(is_correct) is not bool:
+        raise ValueError("Answer fields must be integers and is_correct a boolean")
+    return tuple(values)
+
+
+def encode_answer_id(content_type: str | None, answer_id: int) -> bytes:
+    if media_type(content_type) == MSGPACK_CONTENT_TYPE:
+        return msgpack.packb(answer_id)
+    return ANSWER_ID_FORMAT.pack(answer_id)
+
+
+def encode_event(event: dict) -> bytes:
+    """Encodes a session change event as one fixed-width frame, plus one with the same version per related row"""
+    session_id, version = event.get("session_id") or 0, event.get("version") or 0
+    frame = EVENT_FORMAT.pack(EVENT_TABLE_CODES.get(event.get("table"), 0), event.get("id") or 0, session_id, version)
+    for table, row_id in event.get("related", ()):
+        frame += EVENT_FORMAT.pack(EVENT_TABLE_CODES.get(table, 0), row_id, session_id, version)
+    return frame
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import psycopg2
+
+"""
+Group commit for the high rate writes (player answers and the player's points).
+Instead of one commit per request, the requests put their write in a queue and a single writer thread
+runs the queued writes in one transaction, bounded by max_batch_size writes or max_delay seconds.
+Every request blocks until the group its write belongs to has been committed, so an answer is only
+acknowledged once it is durable, while the database gets one WAL flush per group instead of one per answer.
+"""
+
+_STOP = object()
+
+
+class GroupCommitQueue:
+    def __init__(self, connection_factory, max_batch_size: int = 200, max_delay: float = 0.005):
+        self.connection_factory = connection_factory
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.groups_committed = 0
+        self.writes_committed = 0
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._con = None
+
+    def submit(self, write, *args, timeout: float | None = None):
+        """
+        Queues write(cursor, *args) and blocks until its group is committed.
+        Returns whatever write returned, or raises the exception the write (or the commit) raised
+        """
+        future = Future()
+        with self._lock:
+            # Queued under the lock, so a write is either ahead of the stop marker or refused
+            self._ensure_started()
+            self._pending.put((write, args, future))
+        return future.result(timeout)
+
+    def stop(self):
+        """Commits what is already queued and stops the writer thread"""
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+            if thread is not None:
+                self._pending.put(_STOP)
+        if thread is not None:
+            thread.join()
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    def _ensure_started(self):
+        """Starts the writer thread on the first write, call it holding _lock"""
+        if self._stopped:
+            raise RuntimeError("The write queue has been stopped")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._pending.get()
+            if item is _STOP:
+                break
+            group = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(group) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+            self._commit_group(group)
+
+    def _commit_group(self, group):
+        """Runs every write of the group in one transaction, a failing write is rolled back to its savepoint only"""
+        results = []
+        try:
+            if self._con is None or self._con.closed:
+                self._con = self.connection_factory()
+            with self._con.cursor() as cursor:
+                for write, args, future in group:
+                    cursor.execute("SAVEPOINT group_write")
+                    try:
+                        results.append((future, write(cursor, *args), None))
+                        cursor.execute("RELEASE SAVEPOINT group_write")
+                    except psycopg2.Error as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT group_write")
+                        results.append((future, None, e))
+            self._con.commit()
+        except Exception as e:
+            # The connection or the commit failed, so nothing in the group is durable
+            if self._con is not None and not self._con.closed:
+                try:
+                    self._con.rollback()
+                except psycopg2.Error:
+                    self._con.close()
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+
+        self.groups_committed += 1
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                self.writes_committed += 1
+                future.set_result(result)